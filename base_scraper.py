@@ -1,60 +1,195 @@
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from typing import Any, Callable, Iterator, List, Optional, Tuple, Union
 import requests
-from bs4 import BeautifulSoup
-from models import Event
-import pandas as pd
-import os
+from bs4 import BeautifulSoup, SoupStrainer
+from models import Event, EventBatch
+from transport import HttpTransport, get_default_transport
+from http_cache import HttpCache, get_default_cache
+from host_limits import HostLimiter, get_default_host_limiter
+from url_index import SeenUrlIndex, get_default_seen_index
+from run_metrics import RunMetrics, get_default_metrics
+from event_store import CsvSink, EventStore
+from date_normalize import normalize_dates
+
+try:  # lxml builds trees several times faster than the pure python html.parser
+    import lxml  # noqa: F401
+
+    DEFAULT_PARSER = "lxml"
+except ImportError:
+    DEFAULT_PARSER = "html.parser"
+
+
+class ParseRegions(SoupStrainer):
+    """parse_only filter that keeps just the given page regions
+
+    Each region is a (tag name, css class) pair and either part may be None to
+    match anything. Matching tags are kept with everything inside them, the rest
+    of the page is never turned into Tag objects.
+    """
+
+    def __init__(self, *regions: Tuple[Optional[str], Optional[str]]):
+        super().__init__()
+        self.regions = regions
+
+    def allow_tag_creation(self, nsprefix, name, attrs) -> bool:
+        classes = (attrs or {}).get("class") or []
+        if isinstance(classes, str):
+            classes = classes.split()
+        return any(
+            (tag is None or tag == name) and (cls is None or cls in classes)
+            for tag, cls in self.regions
+        )
 
 
 class BaseScraper(ABC):
-    def __init__(self, source_name: str):
+    # Bump when an extractor's output changes, results the HTTP cache holds
+    # from older versions are then extracted again
+    extractor_version = 1
+
+    def __init__(
+        self,
+        source_name: str,
+        transport: Optional[HttpTransport] = None,
+        cache: Optional[HttpCache] = None,
+        seen_index: Optional[SeenUrlIndex] = None,
+        parser: Optional[str] = None,
+        partial_parse: bool = True,
+        metrics: Optional[RunMetrics] = None,
+        host_limiter: Optional[HostLimiter] = None,
+    ):
         self.source_name = source_name
+        # Pooled keep-alive session, shared across scrapers unless one is given
+        self.transport = transport or get_default_transport()
+        # Optional on-disk response cache, see http_cache.configure_default_cache
+        self.cache = cache or get_default_cache()
+        # Optional record of fetched detail URLs for incremental crawls
+        self.seen_index = seen_index or get_default_seen_index()
+        # BeautifulSoup tree builder, and whether to build only the regions
+        # each scraper reads instead of the whole page
+        self.parser = parser or DEFAULT_PARSER
+        self.partial_parse = partial_parse
+        # Counters and stage timings of the run, exported by the runner
+        self.metrics = metrics or get_default_metrics()
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
         }
+        # Rate, concurrency and retries per host, shared by every scraper so
+        # sources hitting the same host do not add up past its limits
+        self.host_limiter = host_limiter or get_default_host_limiter()
+
+    def make_request(self, url: str, stream: bool = False) -> requests.Response:
+        """Common method for making HTTP requests
 
-    def make_request(self, url: str) -> requests.Response:
-        """Common method for making HTTP requests"""
+        Requests wait on the host's limits and are retried on 429, 5xx and
+        connection errors, see host_limits. With stream=True the body is left
+        unread, use iter_body to consume it; the request holds its host slot
+        until then, and a cached body is stored while it is read.
+        """
+        self.metrics.count(self.source_name, "requests")
+        # Fresh cache hits never reach the transport, so they are not limited
+        transport = self.host_limiter.bind(
+            self.transport,
+            lambda delay: self.metrics.count(self.source_name, "retries"),
+        )
+        response = None
         try:
-            response = requests.get(url, headers=self.headers)
+            with self.timed("fetch"):
+                if self.cache:
+                    response = self.cache.fetch(
+                        transport, url, self.headers, self.source_name, stream
+                    )
+                elif stream:
+                    response = transport.get(url, headers=self.headers, stream=True)
+                else:
+                    response = transport.get(url, headers=self.headers)
             response.raise_for_status()
-            return response
         except requests.exceptions.RequestException as e:
+            if stream and response is not None:
+                # Frees the connection and the host slot of the unread body
+                response.close()
+            self.metrics.count(self.source_name, "fetch_errors")
             print(f"Request failed for {url}: {e}")
             raise
+        if getattr(response, "from_cache", False):
+            self.metrics.count(self.source_name, "cache_hits")
+        if not stream:
+            self.metrics.count(
+                self.source_name, "response_bytes", len(response.content)
+            )
+        return response
+
+    def iter_body(self, response: requests.Response) -> Iterator[bytes]:
+        """Read a response made with stream=True chunk by chunk"""
+        chunks = getattr(response, "body_chunks", None)
+        if chunks is None:
+            chunks = self.transport.iter_body(response)
+        for chunk in self.metrics.timed_iter(self.source_name, "fetch", chunks):
+            self.metrics.count(self.source_name, "response_bytes", len(chunk))
+            yield chunk
 
-    def parse_html(self, content: str) -> BeautifulSoup:
-        """Common method for parsing HTML"""
-        return BeautifulSoup(content, "html.parser")
+    def timed(self, stage: str):
+        """Context manager timing a block as one call of stage for this source"""
+        return self.metrics.stage(self.source_name, stage)
+
+    def fetch_and_extract(
+        self, url: str, extract: Callable[[str, requests.Response], Any]
+    ) -> Any:
+        """Fetch url and run extract(url, response) on it
+
+        With a cache configured, the (JSON serializable) result is stored against
+        the body hash and extractor version so an unchanged page skips parsing
+        and extraction entirely.
+        """
+        response = self.make_request(url)
+        if not self.cache:
+            with self.timed("extract"):
+                return extract(url, response)
+
+        extractor = f"{extract.__qualname__}:{self.extractor_version}"
+        if response.unchanged:
+            data = self.cache.get_derived(url, response.body_hash, extractor)
+            if data is not None:
+                self.metrics.count(self.source_name, "extract_cache_hits")
+                return data
+        with self.timed("extract"):
+            data = extract(url, response)
+        if data is not None:
+            self.cache.put_derived(url, response.body_hash, data, extractor)
+        return data
+
+    def parse_html(
+        self, content: str, regions: Optional[ParseRegions] = None
+    ) -> BeautifulSoup:
+        """Common method for parsing HTML, optionally only the given regions"""
+        parse_only = regions if self.partial_parse else None
+        with self.timed("parse"):
+            return BeautifulSoup(content, self.parser, parse_only=parse_only)
 
     @abstractmethod
-    def scrape_events(self) -> List[Event]:
-        """Main method to be implemented by each scraper"""
+    def iter_events(self) -> Iterator[Event]:
+        """Main method to be implemented by each scraper, yielding events as
+        they are scraped so sinks can start on them before the crawl ends"""
         pass
 
-    def save_to_csv(self, events: List[Event], filename: str = None):
-        """Append new events to CSV, avoiding duplicates based on title + start_date + location"""
-        if not filename:
-            filename = f"{self.source_name}_events.csv"
+    def scrape_events(self) -> List[Event]:
+        """Scrape every event into a list"""
+        return list(self.iter_events())
 
+    def save_to_csv(
+        self,
+        events: Union[EventBatch, List[Event]],
+        filename: str = None,
+        store: Optional[EventStore] = None,
+    ):
+        """Save events to the event store and append the new ones to the CSV
+
+        Duplicates are decided on title + start_date + location as before, by
+        the store rather than by reading the whole CSV back each time.
+        """
         if not events:
             print(f"No events to save for {self.source_name}")
             return
 
-        # Convert to DataFrame for easier handling
-        new_df = pd.DataFrame([e.to_dict() for e in events])
-
-        if os.path.exists(filename):
-            existing_df = pd.read_csv(filename)
-
-            # Define uniqueness based on title + start_date + location
-            combined_df = pd.concat([existing_df, new_df], ignore_index=True)
-            combined_df.drop_duplicates(
-                subset=["title", "start_date", "location"], inplace=True
-            )
-        else:
-            combined_df = new_df
-
-        combined_df.to_csv(filename, index=False, encoding="utf-8")
-        print(f"Updated {filename} with {len(combined_df)} total events.")
+        sink = CsvSink(self.source_name, filename, store)
+        sink.write(normalize_dates(EventBatch.of(events)))
+        sink.close()
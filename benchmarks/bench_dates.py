@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""Time date and time normalization, one event at a time vs a batch
+
+Usage:
+    python benchmarks/bench_dates.py [--events 200000]
+
+The events carry the date and time strings the sources write, drawn from a
+few hundred distinct values as a real crawl repeats them. The "per event"
+row parses every event with the caches cleared, the "batch" row runs
+normalize_dates over the columns, parsing each distinct value once.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from date_normalize import (  # noqa: E402
+    normalize_dates,
+    parse_date_range,
+    parse_time,
+    parse_time_range,
+)
+from models import Event, EventBatch  # noqa: E402
+
+TIMES = ["08:30 am\n- 04:00 pm", "8 - 10 pm", "7pm", "10:00 - 22:00", "noon", ""]
+
+
+def date_text(day: date, rng: random.Random) -> str:
+    end = day + timedelta(days=rng.randint(1, 40))
+    return rng.choice(
+        [
+            f"{day.day} {day:%B %Y}",
+            f"{day.day} {day:%B %Y}\n- {end.day} {end:%B %Y}",
+            f"{day.day} {day:%b} – {end.day} {end:%b %Y}",
+            f"From {day.day} {day:%B %Y}",
+            day.isoformat(),
+        ]
+    )
+
+
+def build_events(count: int, seed: int = 17):
+    rng = random.Random(seed)
+    first_day = date(2025, 1, 1)
+    dates = [
+        date_text(first_day + timedelta(days=rng.randrange(365)), rng)
+        for _ in range(500)
+    ]
+    return [
+        Event(
+            title=f"Event {index}",
+            start_date=rng.choice(dates),
+            time=rng.choice(TIMES),
+            source="Synthetic",
+        )
+        for index in range(count)
+    ]
+
+
+def clear_caches():
+    for cached in (parse_date_range, parse_time, parse_time_range):
+        cached.cache_clear()
+
+
+def per_event(events):
+    for event in events:
+        clear_caches()
+        event.iso_start_date, event.iso_end_date = parse_date_range(event.start_date)
+        event.iso_start_time, event.iso_end_time = parse_time_range(event.time)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--events", type=int, default=200_000)
+    args = arg_parser.parse_args()
+
+    events = build_events(args.events)
+    print(f"{'mode':<10}{'seconds':>9}{'events/s':>12}")
+
+    start = time.perf_counter()
+    per_event(events)
+    seconds = time.perf_counter() - start
+    print(f"{'per event':<10}{seconds:>9.2f}{len(events) / seconds:>12,.0f}")
+
+    batch = EventBatch(build_events(args.events))
+    clear_caches()
+    start = time.perf_counter()
+    normalize_dates(batch)
+    seconds = time.perf_counter() - start
+    print(f"{'batch':<10}{seconds:>9.2f}{len(events) / seconds:>12,.0f}")
+
+    expected = [event.iso_start_date for event in events]
+    if batch.columns["iso_start_date"] != expected:
+        print("Batch and per event results differ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+"""Time and score the cross-source duplicate finder on a labelled dataset
+
+Usage:
+    python benchmarks/bench_dedupe.py [--events 100000] [--save dataset.csv]
+
+The dataset is generated from a fixed seed: distinct events spread over a
+year, a share of them listed again by another source the way the sites
+differ (a "Qatar's" prefix, "&" for "and", the year appended, a date range
+instead of a day, a longer venue name, the odd typo), plus recurring events
+that keep their title on other dates and must not be merged. Precision and
+recall are counted over duplicate pairs, against the exact key match of
+title + start_date + location that the CSV and sheet dedupe use.
+"""
+
+import argparse
+import csv
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from itertools import combinations
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from event_dedupe import DuplicateFinder  # noqa: E402
+from models import Event, EventBatch  # noqa: E402
+
+THEMES = (
+    "festival music art culture exhibition concert theatre market food night "
+    "weekend desert museum gallery pearl island workshop kids sports marathon "
+    "beach heritage jazz soul opera comedy film cinema brunch yoga run cup "
+    "championship tournament show fair bazaar fashion design lights garden "
+    "photography poetry calligraphy ceramics robotics science coding chess "
+    "padel tennis golf cycling sailing camel falcon horse equestrian dhow "
+    "symphony orchestra choir piano guitar ballet dance salsa tango "
+    "lecture talk forum summit conference startup expo auction ramadan eid "
+    "national day iftar suhoor lantern henna perfume coffee tea chocolate"
+).split()
+VENUES = {
+    "Katara": "Katara Cultural Village",
+    "Lusail": "Lusail Boulevard",
+    "Old Doha Port": "Mina District, Old Doha Port",
+    "QNCC": "Qatar National Convention Centre",
+    "Aspire Park": "Aspire Park, Al Waab",
+    "Fire Station": "Fire Station Artist in Residence",
+}
+SOURCES = ["ILoveQatar", "VisitQatar", "QatarMuseums"]
+SYLLABLES = "ka ri ma sa lo na de vi ta mo ru el an is or um ha zi be qu".split()
+
+
+def name(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).title()
+
+
+def day_text(day: date, rng: random.Random, as_range: bool = False) -> str:
+    text = f"{day.day} {day:%B %Y}"
+    if as_range:
+        return f"{text} - {(day + timedelta(days=rng.randint(1, 20))):%d %B %Y}"
+    return text
+
+
+def variant_title(title: str, rng: random.Random) -> str:
+    """The same title as another site would list it"""
+    changes = rng.sample(["prefix", "and", "year", "case", "typo", "quote"], 2)
+    if "prefix" in changes:
+        title = f"Qatar's {title}"
+    if "and" in changes:
+        title = title.replace(" & ", " and ") if " & " in title else title
+    if "year" in changes:
+        title = f"{title} 2025"
+    if "case" in changes:
+        title = title.upper()
+    if "typo" in changes and len(title) > 8:
+        i = rng.randrange(1, len(title) - 2)
+        title = title[:i] + title[i + 1] + title[i] + title[i + 2 :]
+    if "quote" in changes:
+        title = title.replace("'", "’")
+    return title
+
+
+def build_dataset(count: int, seed: int = 2025):
+    """Events and the cluster label of each, equal labels being duplicates"""
+    rng = random.Random(seed)
+    first_day = date(2025, 1, 1)
+    events, labels = [], []
+    label = 0
+    while len(events) < count:
+        words = rng.sample(THEMES, rng.randint(2, 3))
+        title = f"{name(rng)} {' & '.join(words[:2]).title()} {' '.join(words[2:]).title()}".strip()
+        day = first_day + timedelta(days=rng.randrange(365))
+        venue = rng.choice(list(VENUES))
+        source = rng.choice(SOURCES)
+        events.append(
+            Event(
+                title=title,
+                start_date=day_text(day, rng),
+                location=venue,
+                source=source,
+                description=" ".join(rng.sample(THEMES, 8)),
+            )
+        )
+        labels.append(label)
+
+        roll = rng.random()
+        if roll < 0.3:
+            # Listed again by another source
+            other = rng.choice([s for s in SOURCES if s != source])
+            events.append(
+                Event(
+                    title=variant_title(title, rng),
+                    start_date=day_text(day, rng, as_range=rng.random() < 0.5),
+                    location=VENUES[venue] if rng.random() < 0.5 else venue,
+                    source=other,
+                )
+            )
+            labels.append(label)
+        elif roll < 0.4:
+            # Weekly event, a different one each time
+            for week in range(1, rng.randint(2, 5)):
+                label += 1
+                events.append(
+                    Event(
+                        title=title,
+                        start_date=day_text(day + timedelta(weeks=week), rng),
+                        location=venue,
+                        source=source,
+                    )
+                )
+                labels.append(label)
+        label += 1
+    return events[:count], labels[:count]
+
+
+def pair_set(groups) -> set:
+    return {pair for members in groups for pair in combinations(sorted(members), 2)}
+
+
+def exact_key_groups(events) -> list:
+    groups = {}
+    for i, event in enumerate(events):
+        key = (event.title, event.start_date, event.location)
+        groups.setdefault(key, []).append(i)
+    return [members for members in groups.values() if len(members) > 1]
+
+
+def score(found: set, truth: set) -> str:
+    hits = len(found & truth)
+    precision = hits / len(found) if found else 1.0
+    recall = hits / len(truth) if truth else 1.0
+    return f"{precision:>10.3f}{recall:>8.3f}"
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--events", type=int, default=100_000)
+    arg_parser.add_argument("--save", help="also write the dataset to this CSV")
+    args = arg_parser.parse_args()
+
+    events, labels = build_dataset(args.events)
+    truth_groups = {}
+    for i, label in enumerate(labels):
+        truth_groups.setdefault(label, []).append(i)
+    truth = pair_set(truth_groups.values())
+
+    if args.save:
+        with open(args.save, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["cluster", "title", "start_date", "location", "source"])
+            for event, label in zip(events, labels):
+                writer.writerow(
+                    [label, event.title, event.start_date, event.location, event.source]
+                )
+        print(f"Wrote {args.save}")
+
+    batch = EventBatch(events)
+    print(f"{len(events)} events, {len(truth)} duplicate pairs")
+    print(f"{'method':<14}{'seconds':>9}{'precision':>10}{'recall':>8}")
+
+    start = time.perf_counter()
+    exact = pair_set(exact_key_groups(events))
+    print(f"{'exact key':<14}{time.perf_counter() - start:>9.2f}{score(exact, truth)}")
+
+    start = time.perf_counter()
+    clusters = DuplicateFinder().find(batch)
+    seconds = time.perf_counter() - start
+    fuzzy = pair_set(cluster.members for cluster in clusters)
+    print(f"{'minhash lsh':<14}{seconds:>9.2f}{score(fuzzy, truth)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""Measure the memory each Event takes, before and after the slotted model
+
+Usage:
+    python benchmarks/bench_event_memory.py [--events N]
+
+Events are built from the saved VisitQatar calendar, decoding the payload again
+for every batch so that, as in a real run, equal values start out as separate
+string objects. The "legacy" row is the original plain dataclass Event.
+"""
+
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import models  # noqa: E402
+import scrapers.visitqatar as visitqatar  # noqa: E402
+
+FIXTURE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "fixtures", "visitqatar_calendar.html"
+)
+
+
+@dataclass
+class LegacyEvent:
+    """Event as it was before slots, interning and raw_data modes"""
+
+    title: str
+    start_date: str
+    source: str
+    end_date: Optional[str] = None
+    time: Optional[str] = None
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+    description: Optional[str] = None
+    location: Optional[str] = None
+    link: Optional[str] = None
+    directions: Optional[str] = None
+    category: Optional[str] = None
+    price: Optional[str] = None
+    tickets: Optional[str] = None
+    image_url: Optional[str] = None
+    age_restriction: Optional[str] = None
+    organizer: Optional[str] = None
+    tags: List[str] = field(default_factory=list)
+    raw_data: Optional[Dict[str, Any]] = None
+
+    def __post_init__(self):
+        if self.end_date is None:
+            self.end_date = self.start_date
+
+
+def build_events(event_cls, raw_data_mode: str, count: int) -> int:
+    """Create count events and return the bytes they keep alive"""
+    with open(FIXTURE, "rb") as f:
+        page = f.read()
+    scraper = visitqatar.VisitQatarScraper()
+    models.Event.set_raw_data_mode(raw_data_mode)
+    models.raw_data_store.clear()
+    visitqatar.Event = event_cls
+
+    gc.collect()
+    tracemalloc.start()
+    events = []
+    while len(events) < count:
+        # Every decode creates new objects, as a new page would
+        raw_events = list(visitqatar.iter_listing_events([page]))
+        events.extend(scraper.transform_event(raw) for raw in raw_events)
+    del raw_events
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    visitqatar.Event = models.Event
+    models.Event.set_raw_data_mode("keep")
+    return size // len(events)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--events", type=int, default=6000)
+    args = arg_parser.parse_args()
+
+    legacy = build_events(LegacyEvent, "keep", args.events)
+    print(f"{'model':<10}{'raw_data':<10}{'bytes/event':>12}{'saving':>9}")
+    print(f"{'legacy':<10}{'keep':<10}{legacy:>12}{'':>9}")
+    for mode in models.RAW_DATA_MODES:
+        per_event = build_events(models.Event, mode, args.events)
+        print(
+            f"{'slotted':<10}{mode:<10}{per_event:>12}"
+            f"{1 - per_event / legacy:>8.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
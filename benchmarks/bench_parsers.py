@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""Compare HTML parser backends and partial parsing on saved pages
+
+Usage:
+    python benchmarks/bench_parsers.py [--pages DIR] [--repeat N]
+
+Every scraper extraction step is run against its saved page with each parser
+backend, with and without partial parsing, and checked to give the same result
+as the original full html.parser tree.
+"""
+import argparse
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scrapers.iloveqatar import ILoveQatarScraper  # noqa: E402
+from scrapers.qatarmuseums import QatarMuseumsScraper  # noqa: E402
+from scrapers.visitqatar import VisitQatarScraper  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# (label, scraper class, saved page, extraction method, url passed to it)
+CASES = [
+    (
+        "ILoveQatar listing",
+        ILoveQatarScraper,
+        "iloveqatar_listing.html",
+        "extract_event_links",
+        "https://www.iloveqatar.net/events/p1",
+    ),
+    (
+        "ILoveQatar detail",
+        ILoveQatarScraper,
+        "iloveqatar_detail.html",
+        "extract_event_page",
+        "https://www.iloveqatar.net/events/music/spring-jazz-festival",
+    ),
+    (
+        "QatarMuseums listing",
+        QatarMuseumsScraper,
+        "qatarmuseums_listing.html",
+        "extract_listing",
+        "https://qm.org.qa/en/calendar/?page=1",
+    ),
+    (
+        "VisitQatar calendar",
+        VisitQatarScraper,
+        "visitqatar_calendar.html",
+        "extract_event_list",
+        "https://visitqatar.com/intl-en/events-calendar/all-events",
+    ),
+]
+
+
+def available_parsers() -> list:
+    parsers = ["html.parser"]
+    try:
+        import lxml  # noqa: F401
+
+        parsers.append("lxml")
+    except ImportError:
+        print("lxml is not installed, only html.parser is benchmarked")
+    return parsers
+
+
+def saved_response(path: str) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response.encoding = "utf-8"
+    with open(path, "rb") as f:
+        response._content = f.read()
+    return response
+
+
+def time_extraction(extract, url, response, repeat: int) -> tuple:
+    result = extract(url, response)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        extract(url, response)
+    return result, (time.perf_counter() - start) / repeat
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--pages", default=FIXTURES_DIR, help="saved pages dir")
+    arg_parser.add_argument("--repeat", type=int, default=50)
+    args = arg_parser.parse_args()
+
+    parsers = available_parsers()
+    print(f"{'page':<22}{'parser':<13}{'partial':<9}{'ms/page':>9}{'speedup':>9}  same")
+    for label, scraper_cls, filename, method, url in CASES:
+        path = os.path.join(args.pages, filename)
+        if not os.path.exists(path):
+            print(f"{label:<22}missing {path}")
+            continue
+        response = saved_response(path)
+
+        baseline_result = baseline_seconds = None
+        for parser in parsers:
+            for partial in (False, True):
+                scraper = scraper_cls(parser=parser, partial_parse=partial)
+                result, seconds = time_extraction(
+                    getattr(scraper, method), url, response, args.repeat
+                )
+                if baseline_result is None:
+                    baseline_result, baseline_seconds = result, seconds
+                print(
+                    f"{label:<22}{parser:<13}{'yes' if partial else 'no':<9}"
+                    f"{seconds * 1000:>9.2f}{baseline_seconds / seconds:>8.1f}x"
+                    f"  {'yes' if result == baseline_result else 'NO'}"
+                )
+
+
+if __name__ == "__main__":
+    main()
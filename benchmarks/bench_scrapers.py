@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+"""Scraper throughput and peak memory on the offline page corpus
+
+Usage:
+    python benchmarks/bench_scrapers.py [--scale 20] [--density 5] [--repeat 5]
+        [--check | --update-baseline] [--tolerance 0.35]
+
+Every scraper runs its extraction path over the scaled fixture corpus (see
+fixture_corpus.py) with no network: ILoveQatar listings and detail pages
+through scrape_event_page, QatarMuseums listings through
+extract_event_from_card, VisitQatar calendars through the events payload
+decoding and transform_event. Pages/s and events/s are the best of --repeat
+runs, peak memory is traced in a separate run. With --check the script fails
+if a scraper does not find every event the corpus holds, or compared to
+scraper_baseline.json is slower by more than --tolerance or peaks higher by
+more than --tolerance. Throughput depends on the machine, record the baseline
+with --update-baseline where the check runs.
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from bench_parsers import saved_response  # noqa: E402
+from fixture_corpus import CorpusPage, iter_corpus  # noqa: E402
+from fixture_corpus import load_manifest, verify_corpus  # noqa: E402
+from host_limits import HostLimiter, HostLimits  # noqa: E402
+from scrapers.iloveqatar import ILoveQatarScraper  # noqa: E402
+from scrapers.qatarmuseums import QatarMuseumsScraper  # noqa: E402
+from scrapers.visitqatar import VisitQatarScraper  # noqa: E402
+
+BASELINE_PATH = os.path.join(BENCH_DIR, "scraper_baseline.json")
+
+# A corpus page with the response it is served as
+SavedPage = Tuple[CorpusPage, requests.Response]
+
+
+class CorpusTransport:
+    """Transport answering from the corpus instead of the network"""
+
+    def __init__(self, pages: List[CorpusPage]):
+        self.responses = {page.url: response_for(page) for page in pages}
+
+    def get(self, url: str, headers=None, stream: bool = False):
+        if url not in self.responses:
+            raise requests.exceptions.HTTPError(f"{url} is not in the corpus")
+        return self.responses[url]
+
+    def iter_body(self, response: requests.Response):
+        yield response.content
+
+
+def response_for(page: CorpusPage) -> requests.Response:
+    response = saved_response(os.devnull)
+    response._content = page.content
+    response.url = page.url
+    return response
+
+
+def run_iloveqatar_listing(pages: List[SavedPage]) -> int:
+    scraper = ILoveQatarScraper()
+    return sum(
+        len(scraper.extract_event_links(page.url, response)) for page, response in pages
+    )
+
+
+def run_iloveqatar_detail(pages: List[SavedPage]) -> int:
+    # No rate limit or robots.txt, the corpus is not a real host
+    scraper = ILoveQatarScraper(
+        transport=CorpusTransport([p for p, _ in pages]),
+        host_limiter=HostLimiter(
+            default=HostLimits(requests_per_minute=None), respect_robots=False
+        ),
+    )
+    events = 0
+    for page, _ in pages:
+        event_data = scraper.scrape_event_page(page.url)
+        if event_data:
+            scraper.transform_event(event_data)
+            events += 1
+    return events
+
+
+def run_qatarmuseums_listing(pages: List[SavedPage]) -> int:
+    scraper = QatarMuseumsScraper()
+    events = 0
+    for page, response in pages:
+        for event_data in scraper.extract_listing(page.url, response)["events"]:
+            scraper.transform_event(event_data)
+            events += 1
+    return events
+
+
+def run_visitqatar_calendar(pages: List[SavedPage]) -> int:
+    scraper = VisitQatarScraper()
+    events = 0
+    for page, response in pages:
+        for raw_event in scraper.extract_event_list(page.url, response):
+            scraper.transform_event(raw_event)
+            events += 1
+    return events
+
+
+# label -> (source, page kind, runner returning the events found)
+SCENARIOS: Dict[str, tuple] = {
+    "ILoveQatar listing": ("ILoveQatar", "listing", run_iloveqatar_listing),
+    "ILoveQatar detail": ("ILoveQatar", "detail", run_iloveqatar_detail),
+    "QatarMuseums listing": ("QatarMuseums", "listing", run_qatarmuseums_listing),
+    "VisitQatar calendar": ("VisitQatar", "listing", run_visitqatar_calendar),
+}
+
+
+def measure(
+    run: Callable, pages: List[SavedPage], repeat: int, min_seconds: float
+) -> Dict:
+    events = run(pages)
+    # Short runs are dominated by timer noise, so each one goes over the pages
+    # until min_seconds have passed
+    best = float("inf")
+    for _ in range(repeat):
+        rounds = 0
+        start = time.perf_counter()
+        while not rounds or time.perf_counter() - start < min_seconds:
+            run(pages)
+            rounds += 1
+        best = min(best, (time.perf_counter() - start) / rounds)
+
+    # Garbage left by the timed runs would otherwise be collected, or not,
+    # part way through the traced run depending on where the GC counters stand
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run(pages)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        "pages": len(pages),
+        "events": events,
+        "pages_per_second": round(len(pages) / best, 1),
+        "events_per_second": round(events / best, 1),
+        "peak_mib": round(peak / 2**20, 2),
+    }
+
+
+def regressions(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    found = []
+    for label, expected in baseline["scenarios"].items():
+        result = results.get(label)
+        if result is None:
+            found.append(f"{label}: not run")
+            continue
+        if result["events"] != result["expected_events"]:
+            found.append(
+                f"{label}: found {result['events']} of the"
+                f" {result['expected_events']} events in the corpus"
+            )
+        floor = expected["events_per_second"] * (1 - tolerance)
+        if result["events_per_second"] < floor:
+            found.append(
+                f"{label}: {result['events_per_second']:.0f} events/s"
+                f" < {floor:.0f}"
+                f" ({expected['events_per_second']:.0f} - {tolerance:.0%})"
+            )
+        ceiling = expected["peak_mib"] * (1 + tolerance)
+        if result["peak_mib"] > ceiling:
+            found.append(
+                f"{label}: peak {result['peak_mib']:.2f} MiB > {ceiling:.2f}"
+                f" ({expected['peak_mib']:.2f} + {tolerance:.0%})"
+            )
+    return found
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--scale", type=int, default=20, help="variants per page")
+    arg_parser.add_argument(
+        "--density", type=int, default=5, help="copies of each listing entry"
+    )
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    arg_parser.add_argument(
+        "--min-seconds", type=float, default=0.5, help="shortest timed run"
+    )
+    arg_parser.add_argument("--tolerance", type=float, default=0.35)
+    arg_parser.add_argument("--check", action="store_true")
+    arg_parser.add_argument("--update-baseline", action="store_true")
+    args = arg_parser.parse_args()
+
+    manifest = load_manifest()
+    problems = verify_corpus(manifest)
+    if problems:
+        print("Corpus does not match its manifest:\n  " + "\n  ".join(problems))
+        print("Run benchmarks/fixture_corpus.py --update-manifest after recapturing.")
+        sys.exit(1)
+    corpus = {
+        "version": manifest["version"],
+        "scale": args.scale,
+        "density": args.density,
+    }
+
+    pages = [
+        (page, response_for(page))
+        for page in iter_corpus(args.scale, args.density, manifest)
+    ]
+    print(
+        f"Corpus v{corpus['version']}, scale {args.scale}, density {args.density}: "
+        f"{len(pages)} pages"
+    )
+    print(
+        f"{'scraper':<22}{'pages':>7}{'events':>8}{'pages/s':>10}"
+        f"{'events/s':>10}{'peak MiB':>10}"
+    )
+    results = {}
+    for label, (source, kind, run) in SCENARIOS.items():
+        selected = [p for p in pages if p[0].source == source and p[0].kind == kind]
+        result = results[label] = measure(run, selected, args.repeat, args.min_seconds)
+        result["expected_events"] = sum(page.events for page, _ in selected)
+        print(
+            f"{label:<22}{result['pages']:>7}{result['events']:>8}"
+            f"{result['pages_per_second']:>10.0f}{result['events_per_second']:>10.0f}"
+            f"{result['peak_mib']:>10.2f}"
+        )
+
+    if args.update_baseline:
+        with open(BASELINE_PATH, "w") as f:
+            json.dump({"corpus": corpus, "scenarios": results}, f, indent=2)
+            f.write("\n")
+        print(f"Wrote {BASELINE_PATH}")
+    if args.check:
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+        if baseline["corpus"] != corpus:
+            print(
+                f"Baseline was recorded on {baseline['corpus']}, not {corpus}; "
+                "rerun with its settings or --update-baseline."
+            )
+            sys.exit(1)
+        found = regressions(results, baseline, args.tolerance)
+        if found:
+            print("Scraper regressions:\n  " + "\n  ".join(found))
+            sys.exit(1)
+        print("No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
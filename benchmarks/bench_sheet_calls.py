@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+"""Run the sheet sync, dedupe and mark-added paths against a fake spreadsheet
+
+Usage:
+    python benchmarks/bench_sheet_calls.py [--rows 50000] [--latency 0.2]
+        [--check | --update-budget]
+
+Counts the Sheets API requests each step makes and the cells it reads, and
+times it; with --check the request counts are compared to
+sheet_call_budget.json and the script fails if any step makes more requests
+than budgeted.
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, "utils"))
+
+from bench_sheet_sync import random_event  # noqa: E402
+from dedupe_events import DedupeKeyIndex, deduplicate_sheets  # noqa: E402
+from fake_gspread import FakeClient, FakeSpreadsheet  # noqa: E402
+from mark_added_events import mark_added_events  # noqa: E402
+from models import Event, EventBatch  # noqa: E402
+from sheet_mirror import SheetKeyMirror  # noqa: E402
+from sheet_sync import append_new_events_to_sheet  # noqa: E402
+from sheets_scheduler import SheetsScheduler  # noqa: E402
+
+BUDGET_PATH = os.path.join(BENCH_DIR, "sheet_call_budget.json")
+SOURCES = ["ILoveQatar", "VisitQatar", "QatarMuseums"]
+
+
+def build_spreadsheet(rows: int, rng: random.Random, **fake_kwargs):
+    """Spreadsheet like the production one, Combined holding rows events"""
+    spreadsheet = FakeSpreadsheet(**fake_kwargs)
+    headers = Event.get_field_names()
+    events = [random_event(rng, i) for i in range(rows)]
+    # A few rows are entered twice so dedupe has something to delete
+    events += [events[rng.randrange(rows)] for _ in range(rows // 100)]
+
+    for title in SOURCES + ["Combined"]:
+        sheet_events = [e for e in events if title in (e.source, "Combined")]
+        worksheet = spreadsheet.create_worksheet(title)
+        worksheet.load(
+            [[""] + headers]
+            + [[""] + row for row in EventBatch(sheet_events).to_sheet_rows(headers)]
+        )
+    return spreadsheet, events
+
+
+def incoming_events(existing: list, rng: random.Random, count: int = 300) -> list:
+    """A scrape's worth of events, a third of them already in the sheets"""
+    events = [
+        random_event(rng, 10_000_000 + rng.randrange(10**6)) for _ in range(count)
+    ]
+    for i in range(0, count, 3):
+        events[i] = existing[rng.randrange(len(existing))]
+    return events
+
+
+def sync(spreadsheet, events: list, mirror, scheduler):
+    """What script.py does with one run's events"""
+    for source in SOURCES:
+        batch = EventBatch([e for e in events if e.source == source])
+        append_new_events_to_sheet(
+            batch.to_dataframe(), spreadsheet._sheets[source], mirror, scheduler
+        )
+    append_new_events_to_sheet(
+        EventBatch(events).to_dataframe(),
+        spreadsheet._sheets["Combined"],
+        mirror,
+        scheduler,
+    )
+    scheduler.flush()
+
+
+def measure(spreadsheet, step) -> dict:
+    spreadsheet.reset_counters()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        step()
+    return {
+        "seconds": time.perf_counter() - start,
+        "read": spreadsheet.requests["read"],
+        "write": spreadsheet.requests["write"],
+        "cells": spreadsheet.cells["read"],
+        "rejected": spreadsheet.rejected,
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--rows", type=int, default=50_000)
+    arg_parser.add_argument("--latency", type=float, default=0.0, help="s/request")
+    arg_parser.add_argument("--seconds-per-cell", type=float, default=0.0)
+    arg_parser.add_argument("--quota", type=int, help="requests/minute each way")
+    arg_parser.add_argument("--check", action="store_true")
+    arg_parser.add_argument("--update-budget", action="store_true")
+    args = arg_parser.parse_args()
+
+    rng = random.Random(args.rows)
+    spreadsheet, existing = build_spreadsheet(
+        args.rows,
+        rng,
+        latency=args.latency,
+        seconds_per_cell=args.seconds_per_cell,
+        reads_per_minute=args.quota,
+        writes_per_minute=args.quota,
+    )
+    client = FakeClient(spreadsheet)
+    rate = args.quota or 10_000
+
+    with tempfile.TemporaryDirectory() as state_dir:
+        mirror = SheetKeyMirror(os.path.join(state_dir, "sheet_mirror.sqlite"))
+        scheduler = SheetsScheduler(
+            reads_per_minute=rate,
+            writes_per_minute=rate,
+            dead_letter_path=os.path.join(state_dir, "dead_letter.jsonl"),
+        )
+        csv_path = os.path.join(state_dir, "events.csv")
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["title_en"])
+            for event in rng.sample(existing, 200):
+                writer.writerow([event.title])
+
+        dedupe_index = DedupeKeyIndex(os.path.join(state_dir, "dedupe_index.sqlite"))
+        first_run = incoming_events(existing, rng)
+        second_run = incoming_events(existing + first_run, rng)
+        third_run = incoming_events(existing + first_run + second_run, rng)
+        steps = [
+            (
+                "sync, cold mirror",
+                lambda: sync(spreadsheet, first_run, mirror, scheduler),
+            ),
+            (
+                "sync, warm mirror",
+                lambda: sync(spreadsheet, second_run, mirror, scheduler),
+            ),
+            (
+                "mark added",
+                lambda: mark_added_events(spreadsheet._sheets["Combined"], csv_path),
+            ),
+            (
+                "dedupe, cold index",
+                lambda: deduplicate_sheets(
+                    ["Combined"] + SOURCES, scheduler, client, dedupe_index
+                ),
+            ),
+            (
+                "sync, after dedupe",
+                lambda: sync(spreadsheet, third_run, mirror, scheduler),
+            ),
+            (
+                "dedupe, warm index",
+                lambda: deduplicate_sheets(
+                    ["Combined"] + SOURCES, scheduler, client, dedupe_index
+                ),
+            ),
+        ]
+        results = {name: measure(spreadsheet, step) for name, step in steps}
+        mirror.close()
+        dedupe_index.close()
+
+    print(f"{args.rows} rows in Combined")
+    print(
+        f"{'step':<20}{'seconds':>9}{'reads':>7}{'writes':>8}{'cells read':>12}{'429s':>6}"
+    )
+    for name, result in results.items():
+        print(
+            f"{name:<20}{result['seconds']:>9.2f}{result['read']:>7}"
+            f"{result['write']:>8}{result['cells']:>12}{result['rejected']:>6}"
+        )
+
+    counts = {
+        name: {"read": result["read"], "write": result["write"]}
+        for name, result in results.items()
+    }
+    if args.update_budget:
+        with open(BUDGET_PATH, "w") as f:
+            json.dump(counts, f, indent=2)
+            f.write("\n")
+        print(f"Wrote {BUDGET_PATH}")
+    if args.check:
+        with open(BUDGET_PATH) as f:
+            budget = json.load(f)
+        over = [
+            f"{name} {kind}: {counts[name][kind]} > {limit}"
+            for name, limits in budget.items()
+            for kind, limit in limits.items()
+            if counts.get(name, {}).get(kind, 0) > limit
+        ]
+        if over:
+            print("Request budget exceeded:\n  " + "\n  ".join(over))
+            sys.exit(1)
+        print("Within request budget.")
+
+
+if __name__ == "__main__":
+    main()
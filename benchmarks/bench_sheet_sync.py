@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+"""Time append_new_events_to_sheet against worksheets of growing size
+
+Usage:
+    python benchmarks/bench_sheet_sync.py [--sizes 1000 10000 100000]
+
+Runs the current implementation and the original one (legacy_sheet_sync.py)
+on the same in-memory worksheet and checks they insert exactly the same rows,
+then times a follow-up run whose existing keys come from the sheet mirror.
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from legacy_sheet_sync import (  # noqa: E402
+    append_new_events_to_sheet as legacy_append,
+)
+from models import Event, EventBatch  # noqa: E402
+from sheet_mirror import SheetKeyMirror  # noqa: E402
+from sheet_sync import append_new_events_to_sheet  # noqa: E402
+
+WORDS = (
+    "doha qatar family festival music art culture souq waqif katara corniche "
+    "lusail exhibition concert theatre market food night weekend desert museum "
+    "national gallery pearl island workshop kids sports marathon beach heritage"
+).split()
+VENUES = ["Katara", "Lusail Boulevard", "Old Doha Port", "QNCC", "Aspire Park"]
+SOURCES = ["ILoveQatar", "VisitQatar", "QatarMuseums"]
+
+
+class StubWorksheet:
+    """Minimal in-memory stand-in for a gspread Worksheet"""
+
+    spreadsheet_id = "bench"
+    id = 0
+
+    def __init__(self, title: str, values: list):
+        self.title = title
+        self.values = [list(row) for row in values]
+        self.row_count = len(values) + 100
+        self.inserted = None
+        self.full_reads = 0
+
+    def get_all_values(self):
+        self.full_reads += 1
+        return [list(row) for row in self.values]
+
+    def get(self, range_name):
+        last_row = int(range_name.split(":")[1])
+        return [list(row) for row in self.values[:last_row]]
+
+    def update(self, values, range_name=None):
+        pass
+
+    def update_cell(self, row, col, value):
+        pass
+
+    def freeze(self, rows=None, cols=None):
+        pass
+
+    def insert_rows(self, values, row=1, value_input_option=None):
+        self.inserted = values
+        self.values[row - 1 : row - 1] = [list(v) for v in values]
+        self.row_count += len(values)
+
+
+def random_event(rng: random.Random, index: int) -> Event:
+    title = " ".join(rng.choice(WORDS) for _ in range(4)).title()
+    if index % 5 == 0:
+        title = title.replace(" ", "'s ", 1)
+    return Event(
+        title=f"{title} {index}",
+        start_date=f"{rng.randint(1, 28)} May 2025",
+        location=rng.choice(VENUES),
+        source=rng.choice(SOURCES),
+        description=" ".join(rng.choice(WORDS) for _ in range(30)),
+        category=rng.choice(["music", "family", None]),
+        tags=["a", "b"] if index % 7 == 0 else [],
+    )
+
+
+def make_case(size: int, incoming: int = 300):
+    rng = random.Random(size)
+    headers = Event.get_field_names()
+    existing = [random_event(rng, i) for i in range(size)]
+    rows = [[""] + headers]
+    for i, row in enumerate(EventBatch(existing).to_sheet_rows(headers)):
+        rows.append([""] + (row[:6] if i % 11 == 0 else row))
+
+    # A third of the incoming events are already in the sheet, with the
+    # case and apostrophes changed
+    new_events = [random_event(rng, size + i) for i in range(incoming)]
+    for i in range(0, incoming, 3):
+        old = existing[rng.randrange(size)]
+        new_events[i] = Event(
+            title=old.title.upper().replace("'", "’"),
+            start_date=old.start_date,
+            location=old.location,
+            source=old.source,
+        )
+    return rows, EventBatch(new_events).to_dataframe()
+
+
+def timed(append, worksheet, events_df, **kwargs):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        append(events_df, worksheet, **kwargs)
+    return time.perf_counter() - start, worksheet.inserted
+
+
+def timed_with_mirror(rows, events_df, reruns_df):
+    """Second run against the same sheet, keys served from a warm mirror"""
+    with tempfile.TemporaryDirectory() as directory:
+        mirror = SheetKeyMirror(os.path.join(directory, "mirror.sqlite"))
+        worksheet = StubWorksheet("Bench", rows)
+        timed(append_new_events_to_sheet, worksheet, events_df, mirror=mirror)
+        worksheet.inserted = None
+        seconds, inserted = timed(
+            append_new_events_to_sheet, worksheet, reruns_df, mirror=mirror
+        )
+        full_reads = worksheet.full_reads
+        mirror.close()
+
+    # Same second run without the mirror, from the sheet as the first run left it
+    worksheet = StubWorksheet("Bench", rows)
+    timed(append_new_events_to_sheet, worksheet, events_df)
+    worksheet.inserted = None
+    _, expected = timed(append_new_events_to_sheet, worksheet, reruns_df)
+    return seconds, inserted == expected and full_reads == 1
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000]
+    )
+    args = arg_parser.parse_args()
+
+    print(
+        f"{'rows':>8}{'legacy s':>10}{'current s':>11}{'speedup':>9}  same"
+        f"{'mirrored s':>12}  same"
+    )
+    for size in args.sizes:
+        rows, events_df = make_case(size)
+        legacy_seconds, legacy_rows = timed(
+            legacy_append, StubWorksheet("Bench", rows), events_df
+        )
+        seconds, inserted = timed(
+            append_new_events_to_sheet, StubWorksheet("Bench", rows), events_df
+        )
+        # The next run sees half of this run's events again
+        reruns_df = pd.concat([events_df.iloc[::2], make_case(size + 1)[1]])
+        mirrored_seconds, mirrored_same = timed_with_mirror(rows, events_df, reruns_df)
+        print(
+            f"{size:>8}{legacy_seconds:>10.3f}{seconds:>11.3f}"
+            f"{legacy_seconds / seconds:>8.1f}x  {'yes' if inserted == legacy_rows else 'NO '}"
+            f"{mirrored_seconds:>12.3f}  {'yes' if mirrored_same else 'NO'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
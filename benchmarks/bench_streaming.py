@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""Compare collecting a scrape into a list with streaming it to the sinks
+
+Usage:
+    python benchmarks/bench_streaming.py [--events 50000] [--delay 0.00002]
+
+A synthetic scraper yields events with a small pause between them, as a crawl
+would. The "list" row scrapes everything with scrape_events and saves it with
+save_to_csv afterwards; the "stream" row feeds iter_events through
+stream_events into a CsvSink. Peak memory is traced with tracemalloc.
+"""
+
+import argparse
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from bench_sheet_sync import random_event  # noqa: E402
+from base_scraper import BaseScraper  # noqa: E402
+from event_store import CsvSink, EventStore  # noqa: E402
+from models import EventBatch  # noqa: E402
+from pipeline import stream_events  # noqa: E402
+
+
+class SyntheticScraper(BaseScraper):
+    def __init__(self, events: int, delay: float):
+        super().__init__("Synthetic")
+        self.events = events
+        self.delay = delay
+
+    def iter_events(self):
+        rng = random.Random(self.events)
+        for index in range(self.events):
+            if self.delay:
+                time.sleep(self.delay)
+            event = random_event(rng, index)
+            event.raw_data = {"html": "x" * 2000}
+            yield event
+
+
+def run_list(scraper, directory: str) -> float:
+    """Seconds until the first event reached the CSV"""
+    start = time.perf_counter()
+    events = scraper.scrape_events()
+    first_write = time.perf_counter() - start
+    store = EventStore(os.path.join(directory, "list.sqlite"))
+    scraper.save_to_csv(
+        EventBatch(events), os.path.join(directory, "list.csv"), store=store
+    )
+    store.close()
+    return first_write
+
+
+def run_stream(scraper, directory: str) -> float:
+    store = EventStore(os.path.join(directory, "stream.sqlite"))
+    sink = CsvSink(scraper.source_name, os.path.join(directory, "stream.csv"), store)
+    start = time.perf_counter()
+    first_write = []
+    write = sink.write
+
+    def timed_write(batch):
+        if not first_write:
+            first_write.append(time.perf_counter() - start)
+        write(batch)
+
+    sink.write = timed_write
+    stream_events(scraper.iter_events(), [sink])
+    sink.close()
+    store.close()
+    return first_write[0]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--events", type=int, default=50_000)
+    arg_parser.add_argument("--delay", type=float, default=0.00002, help="s/event")
+    args = arg_parser.parse_args()
+
+    print(f"{'mode':<8}{'seconds':>9}{'first write s':>15}{'peak MB':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, run in [("list", run_list), ("stream", run_stream)]:
+            scraper = SyntheticScraper(args.events, args.delay)
+            gc.collect()
+            tracemalloc.start()
+            start = time.perf_counter()
+            first_write = run(scraper, directory)
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{name:<8}{seconds:>9.2f}{first_write:>15.2f}{peak / 2**20:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+"""Versioned corpus of saved scraper pages and a generator that scales it up
+
+Usage:
+    python benchmarks/fixture_corpus.py [--verify]
+    python benchmarks/fixture_corpus.py --scale 20 --density 5 --out DIR
+    python benchmarks/fixture_corpus.py --update-manifest
+
+fixtures/manifest.json lists every saved page with its source, kind, URL,
+the number of events it holds and its sha256. A page that changes without the
+manifest being updated fails --verify; --update-manifest hashes the pages
+again and bumps the corpus version, so benchmark baselines recorded against
+the old pages are not compared with the new ones.
+
+The generator makes scale variants of every saved page. A listing variant
+repeats each of its event entries density times, with links made unique, and
+a detail variant gets its own URL and title; variant 0 at density 1 is the
+saved page unchanged.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+from dataclasses import dataclass
+from typing import Dict, Iterator, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+MANIFEST_PATH = os.path.join(FIXTURES_DIR, "manifest.json")
+
+# One event entry of each listing page, matched in the page HTML
+ENTRY_PATTERNS = {
+    "ILoveQatar": re.compile(r'<div class="article-block">\n.*?\n</div>', re.S),
+    "QatarMuseums": re.compile(r'<a class="card card--landscape".*?</a>', re.S),
+}
+# The vq-event-listing attribute holding the HTML escaped JSON array of events
+EVENTS_ATTRIBUTE = re.compile(r'(:events="\[)([^"]*)(\]")')
+HREF = re.compile(r'href="([^"]*?)(/?)"')
+TITLE = re.compile(r"(<h1[^>]*>)(.*?)(</h1>)", re.S)
+
+
+@dataclass
+class CorpusPage:
+    """One page of the corpus, saved or generated"""
+
+    name: str
+    source: str
+    kind: str
+    url: str
+    content: bytes
+    events: int
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> Dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def page_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def verify_corpus(manifest: Dict, directory: str = FIXTURES_DIR) -> List[str]:
+    """Problems with the saved pages, empty when they match the manifest"""
+    problems = []
+    for page in manifest["pages"]:
+        path = os.path.join(directory, page["file"])
+        if not os.path.exists(path):
+            problems.append(f"{page['file']} is missing")
+        elif page_hash(path) != page["sha256"]:
+            problems.append(
+                f"{page['file']} changed since corpus v{manifest['version']}"
+            )
+    return problems
+
+
+def update_manifest(path: str = MANIFEST_PATH) -> Dict:
+    """Hash the saved pages again, bumping the version if any changed"""
+    manifest = load_manifest(path)
+    directory = os.path.dirname(path)
+    changed = False
+    for page in manifest["pages"]:
+        digest = page_hash(os.path.join(directory, page["file"]))
+        if digest != page["sha256"]:
+            page["sha256"] = digest
+            changed = True
+    if changed:
+        manifest["version"] += 1
+        with open(path, "w") as f:
+            json.dump(manifest, f, indent=2)
+            f.write("\n")
+    return manifest
+
+
+def _unique_links(html: str, tag: str) -> str:
+    return HREF.sub(lambda m: f'href="{m.group(1)}-{tag}{m.group(2)}"', html)
+
+
+def _repeat_entries(html: str, source: str, variant: int, density: int) -> str:
+    if source not in ENTRY_PATTERNS:
+        # VisitQatar: repeat the escaped JSON objects inside the array
+        return EVENTS_ATTRIBUTE.sub(
+            lambda m: m.group(1) + ", ".join([m.group(2)] * density) + m.group(3),
+            html,
+            count=1,
+        )
+    entries = list(ENTRY_PATTERNS[source].finditer(html))
+    if not entries:
+        return html
+    copies = []
+    for copy in range(density):
+        for entry in entries:
+            text = entry.group(0)
+            copies.append(
+                text
+                if variant == copy == 0
+                else _unique_links(text, f"v{variant}c{copy}")
+            )
+    start, end = entries[0].start(), entries[-1].end()
+    return html[:start] + "\n".join(copies) + html[end:]
+
+
+def scale_page(page: Dict, html: str, variant: int, density: int) -> CorpusPage:
+    """Variant of a saved page, listings holding density times the events"""
+    url = page["url"]
+    name = page["file"] if variant == 0 else f"{variant}-{page['file']}"
+    if page["kind"] == "listing":
+        if variant or density > 1:
+            html = _repeat_entries(html, page["source"], variant, density)
+        events = page["events"] * density
+    else:
+        if variant:
+            url = f"{url}-{variant}"
+            html = TITLE.sub(
+                lambda m: f"{m.group(1)}{m.group(2)} #{variant}{m.group(3)}",
+                html,
+                count=1,
+            )
+        events = page["events"]
+    return CorpusPage(
+        name, page["source"], page["kind"], url, html.encode("utf-8"), events
+    )
+
+
+def iter_corpus(
+    scale: int = 1,
+    density: int = 1,
+    manifest: Dict = None,
+    directory: str = FIXTURES_DIR,
+) -> Iterator[CorpusPage]:
+    """scale variants of every saved page, by page then variant"""
+    manifest = manifest or load_manifest()
+    for page in manifest["pages"]:
+        with open(os.path.join(directory, page["file"]), encoding="utf-8") as f:
+            html = f.read()
+        for variant in range(scale):
+            yield scale_page(page, html, variant, density)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--scale", type=int, default=1, help="variants per page")
+    arg_parser.add_argument(
+        "--density", type=int, default=1, help="copies of each listing entry"
+    )
+    arg_parser.add_argument("--out", help="write the scaled corpus to this dir")
+    arg_parser.add_argument("--update-manifest", action="store_true")
+    args = arg_parser.parse_args()
+
+    if args.update_manifest:
+        manifest = update_manifest()
+        print(f"Corpus v{manifest['version']}, {len(manifest['pages'])} pages")
+        return
+
+    manifest = load_manifest()
+    problems = verify_corpus(manifest)
+    if problems:
+        print("Corpus does not match its manifest:\n  " + "\n  ".join(problems))
+        sys.exit(1)
+    print(f"Corpus v{manifest['version']} verified, {len(manifest['pages'])} pages")
+
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+        pages = events = size = 0
+        for page in iter_corpus(args.scale, args.density, manifest):
+            with open(os.path.join(args.out, page.name), "wb") as f:
+                f.write(page.content)
+            pages += 1
+            events += page.events
+            size += len(page.content)
+        print(
+            f"Wrote {pages} pages, {events} events, {size / 1024:.0f} KiB to {args.out}"
+        )
+
+
+if __name__ == "__main__":
+    main()
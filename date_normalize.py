@@ -0,0 +1,209 @@
+import calendar
+import re
+from datetime import date
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+from models import EventBatch
+
+MONTHS: Dict[str, int] = {}
+for number in range(1, 13):
+    MONTHS[calendar.month_name[number].lower()] = number
+    MONTHS[calendar.month_abbr[number].lower()] = number
+MONTHS["sept"] = 9
+
+# Every pattern is compiled once, the parsers below run for each distinct
+# string only thanks to their caches
+ISO_DATE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+DASHES = re.compile(r"[‐‑‒–—−]")
+# "4 May 2025 - 7 May 2025", "4 May 2025\n- 7 May 2025", "5 May to 6 June"
+DATE_RANGE_SEPARATOR = re.compile(r"\s*-\s*|\s+(?:to|till|until)\s+", re.IGNORECASE)
+# "25 - 26 December 2023"
+DAY_RANGE = re.compile(r"(\d+)\s*-\s*(\d+)\s*(.*)", re.DOTALL)
+TIME_RANGE_SEPARATOR = re.compile(r"\s*-\s*|\s+to\s+", re.IGNORECASE)
+DATE_TOKEN = re.compile(r"\d+|[^\W\d_]+")
+TIME = re.compile(
+    r"(?P<hour>\d{1,2})(?:[:.](?P<minute>\d{2}))?\s*(?P<meridiem>[ap])?\.?\s*m?\.?\b",
+    re.IGNORECASE,
+)
+# Start or end only: "From 5 May 2025", "Until 30 June 2025"
+OPEN_START = re.compile(r"^\s*(?:from|starts?|starting|opens?)\b", re.IGNORECASE)
+OPEN_END = re.compile(r"^\s*(?:until|till|through|ends?|ending)\b", re.IGNORECASE)
+NAMED_TIMES = {"noon": "12:00", "midday": "12:00", "midnight": "00:00"}
+
+DateParts = Tuple[Optional[int], Optional[int], Optional[int]]
+
+
+def split_date_range(date_str: str) -> Tuple[str, str]:
+    """Split a date or date range into start and end text
+
+    "4 May 2025\\n- 7 May 2025" -> ("4 May 2025", "7 May 2025") and
+    "25 - 26 December 2023" -> ("25 December 2023", "26 December 2023").
+    A single date is returned as both.
+    """
+    date_str = " ".join(DASHES.sub("-", date_str or "").split())
+    if ISO_DATE.fullmatch(date_str):
+        return date_str, date_str
+    day_range = DAY_RANGE.fullmatch(date_str)
+    if day_range:
+        day1, day2, month_year = day_range.groups()
+        return f"{day1} {month_year}".strip(), f"{day2} {month_year}".strip()
+    parts = DATE_RANGE_SEPARATOR.split(date_str)
+    if len(parts) == 2:
+        return parts[0].strip(), parts[1].strip()
+    return date_str, date_str
+
+
+def split_time_range(time_str: str) -> Tuple[str, str]:
+    """Split "08:30 am\\n- 04:00 pm" into ("08:30 am", "04:00 pm")"""
+    time_str = " ".join(DASHES.sub("-", time_str or "").split())
+    parts = TIME_RANGE_SEPARATOR.split(time_str, maxsplit=1)
+    if len(parts) == 2:
+        return parts[0].strip(), parts[1].strip()
+    return time_str, time_str
+
+
+def _date_parts(text: str) -> DateParts:
+    """Day, month and year found in text, each None when missing"""
+    day = month = year = None
+    for token in DATE_TOKEN.findall(text):
+        if token.isdigit():
+            if len(token) == 4:
+                year = year or int(token)
+            elif day is None and int(token) <= 31:
+                day = int(token)
+        elif month is None:
+            month = MONTHS.get(token.lower())
+    return day, month, year
+
+
+def _iso(day: Optional[int], month: Optional[int], year: Optional[int]):
+    if not (day and month and year):
+        return None
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=8192)
+def parse_date_range(text: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """ISO start and end dates of a date or date range as the sources write it
+
+    Handles "4 May 2025", "4 May 2025 - 7 May 2025", "25 - 26 December 2023",
+    "12 Mar - 30 Jun 2025", "20 Dec - 5 Jan 2026", "May 4, 2025",
+    "From 5 May 2025", "Until 30 June 2025" and ISO dates. A date missing its
+    day, such as VisitQatar's "? May 2025", gives None.
+    """
+    if not text:
+        return None, None
+    text = str(text)
+    iso = ISO_DATE.findall(text)
+    if iso:
+        start = _iso(*map(int, reversed(iso[0])))
+        end = _iso(*map(int, reversed(iso[-1])))
+        return _format(start), _format(end)
+
+    start_text, end_text = split_date_range(text)
+    start_day, start_month, start_year = _date_parts(start_text)
+    end_day, end_month, end_year = _date_parts(end_text)
+    # The start takes the month and year the end was written with
+    start_month = start_month or end_month
+    start_year = start_year or end_year
+    end_year = end_year or start_year
+    start = _iso(start_day, start_month, start_year)
+    end = _iso(end_day, end_month or start_month, end_year)
+    if start and end and start > end and start_text != end_text:
+        # "20 Dec - 5 Jan 2026", the start is in the year before
+        start = _iso(start_day, start_month, start_year - 1)
+
+    if OPEN_START.match(text):
+        end = None if start_text == end_text else end
+    elif OPEN_END.match(text):
+        start = None if start_text == end_text else start
+    return _format(start), _format(end)
+
+
+@lru_cache(maxsize=4096)
+def parse_time(text: Optional[str], meridiem: Optional[str] = None) -> Optional[str]:
+    """24 hour "HH:MM" of "08:30 am", "8pm", "20:00" or "noon"
+
+    meridiem ("a" or "p") applies to times written without one, as the start
+    of "8 - 10 pm".
+    """
+    if not text:
+        return None
+    text = str(text).strip().lower()
+    if text in NAMED_TIMES:
+        return NAMED_TIMES[text]
+    match = TIME.search(text)
+    if not match:
+        return None
+    hour, minute = int(match.group("hour")), int(match.group("minute") or 0)
+    meridiem = (match.group("meridiem") or meridiem or "").lower()
+    if meridiem == "p" and hour < 12:
+        hour += 12
+    elif meridiem == "a" and hour == 12:
+        hour = 0
+    if hour > 23 or minute > 59:
+        return None
+    return f"{hour:02d}:{minute:02d}"
+
+
+@lru_cache(maxsize=4096)
+def parse_time_range(text: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """24 hour start and end times of "08:30 am - 04:00 pm" or a single time"""
+    if not text:
+        return None, None
+    start_text, end_text = split_time_range(str(text))
+    end = parse_time(end_text)
+    end_match = TIME.search(end_text)
+    start = parse_time(start_text, end_match and end_match.group("meridiem"))
+    if start and end and start > end:
+        # "10 - 2 pm" starts in the morning
+        start = parse_time(start_text)
+    return start, end
+
+
+def _format(value: Optional[date]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _map_unique(parse: Callable, values: List) -> List:
+    """parse over a column, called once per distinct value"""
+    parsed = {value: parse(value) for value in set(values)}
+    return [parsed[value] for value in values]
+
+
+def normalize_dates(batch: EventBatch) -> EventBatch:
+    """Fill the ISO date and 24 hour time columns of batch from the text ones
+
+    Values a scraper already set are kept. The batch is changed in place and
+    returned.
+    """
+    columns = batch.columns
+    if not len(batch):
+        return batch
+    starts = _map_unique(parse_date_range, columns["start_date"])
+    ends = _map_unique(parse_date_range, columns["end_date"])
+    times = _map_unique(parse_time_range, columns["time"])
+    start_times = _map_unique(parse_time_range, columns["start_time"])
+    end_times = _map_unique(parse_time_range, columns["end_time"])
+
+    def fill(name: str, values):
+        column = columns[name]
+        for i, value in enumerate(values):
+            if column[i] is None:
+                column[i] = value
+
+    fill("iso_start_date", (start[0] for start in starts))
+    fill("iso_end_date", (end[1] or start[1] for start, end in zip(starts, ends)))
+    fill(
+        "iso_start_time",
+        (start[0] or time[0] for start, time in zip(start_times, times)),
+    )
+    fill(
+        "iso_end_time",
+        (end[1] or time[1] for end, time in zip(end_times, times)),
+    )
+    batch._frame = None
+    return batch
@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+import argparse
+import csv
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+import numpy as np
+from models import Event, EventBatch
+from date_normalize import parse_date_range
+
+# Words that say nothing about which event it is, e.g. "Qatar's" in one source's
+# title and not the other's
+TITLE_STOPWORDS = frozenset(
+    "a an and at for in of on the to with qatar doha edition".split()
+)
+
+POSSESSIVE = re.compile(r"['’‘`]s\b")
+QUOTE_TABLE = str.maketrans("", "", "'’‘`")
+TITLE_WORD = re.compile(r"\w+")
+
+# Fields counted when picking the most complete event of a cluster
+CANONICAL_FIELDS = (
+    "end_date",
+    "start_time",
+    "end_time",
+    "description",
+    "location",
+    "link",
+    "category",
+    "price",
+    "tickets",
+    "image_url",
+)
+
+# MinHash values are (a * shingle id + b) mod this Mersenne prime
+_PRIME = np.uint64((1 << 61) - 1)
+
+
+def normalize_title(title: Optional[str]) -> str:
+    """Lowercase words of a title without accents, years or filler words
+
+    "Qatar's Spring Jazz & Soul Festival 2025" -> "spring jazz soul festival"
+    """
+    if not title:
+        return ""
+    text = str(title)
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(c for c in text if not unicodedata.combining(c))
+    text = POSSESSIVE.sub("", text.casefold()).translate(QUOTE_TABLE)
+    words = TITLE_WORD.findall(text)
+    return " ".join(
+        word
+        for word in words
+        if word not in TITLE_STOPWORDS and not (len(word) == 4 and word.isdigit())
+    )
+
+
+def shingles(text: str, size: int = 3) -> frozenset:
+    """Overlapping character size-grams of text, text itself when shorter"""
+    if len(text) <= size:
+        return frozenset([text]) if text else frozenset()
+    return frozenset({text[i : i + size] for i in range(len(text) - size + 1)})
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    common = len(a & b)
+    return common / (len(a) + len(b) - common)
+
+
+@dataclass
+class DuplicateCluster:
+    """Events found to be the same one, by index into the events given"""
+
+    canonical: int
+    members: List[int] = field(default_factory=list)
+    # Lowest title similarity among the matches that joined the cluster
+    similarity: float = 1.0
+
+
+class DuplicateFinder:
+    """Finds the same event listed more than once, across sources or not
+
+    Titles are normalized and cut into character shingles, summarized as
+    MinHash signatures, and split into LSH bands. Two events are only compared
+    when one of their bands hashes the same and their start dates are at most
+    max_day_gap days apart, so the work grows with the number of events rather
+    than the number of pairs. Compared pairs whose title shingles have a
+    Jaccard similarity of at least threshold are linked, and linked events
+    form clusters.
+
+    Args:
+        threshold: Lowest title similarity for two events to be duplicates
+        num_perm: MinHash signature length, a multiple of bands
+        bands: LSH bands, more bands find less similar pairs
+        max_day_gap: Most days between the start dates of duplicates
+        shingle_size: Characters per title shingle
+        cross_source_only: Only link events of different sources
+        source_priority: Sources to prefer for the canonical event, first best
+        max_bucket: Buckets larger than this are matched against their first
+            event only, bounding the pairs checked for very common titles
+        seed: Seed of the MinHash hash functions
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.5,
+        num_perm: int = 48,
+        bands: int = 16,
+        max_day_gap: int = 0,
+        shingle_size: int = 3,
+        cross_source_only: bool = False,
+        source_priority: Sequence[str] = (),
+        max_bucket: int = 50,
+        seed: int = 1,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.max_day_gap = max_day_gap
+        self.shingle_size = shingle_size
+        self.cross_source_only = cross_source_only
+        self.source_priority = {source: i for i, source in enumerate(source_priority)}
+        self.max_bucket = max_bucket
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, num_perm, dtype=np.uint64)
+        self._band_weights = rng.integers(
+            1, 1 << 63, num_perm // bands, dtype=np.uint64
+        ) | np.uint64(1)
+
+    def find(
+        self, events: Union[EventBatch, Iterable[Event]]
+    ) -> List[DuplicateCluster]:
+        """Clusters of two or more duplicate events, largest first"""
+        batch = EventBatch.of(events)
+        titles = [normalize_title(title) for title in batch.columns["title"]]
+        title_shingles = [shingles(title, self.shingle_size) for title in titles]
+        # Far fewer distinct dates than events, parse each once
+        ordinals = {
+            text: date.fromisoformat(iso).toordinal() if iso else -1
+            for text in set(batch.columns["start_date"])
+            for iso in [parse_date_range(text)[0]]
+        }
+        days = np.fromiter(
+            (
+                date.fromisoformat(iso).toordinal() if iso else ordinals[text]
+                for iso, text in zip(
+                    batch.columns["iso_start_date"], batch.columns["start_date"]
+                )
+            ),
+            dtype=np.int64,
+            count=len(batch),
+        )
+        sources = batch.columns["source"]
+
+        signatures, has_signature = self._signatures(title_shingles)
+        parent = list(range(len(batch)))
+        similarity = {}
+
+        def root(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for i, j in self._candidate_pairs(signatures, has_signature, days):
+            if self.cross_source_only and sources[i] == sources[j]:
+                continue
+            score = jaccard(title_shingles[i], title_shingles[j])
+            if score < self.threshold:
+                continue
+            ri, rj = root(i), root(j)
+            if ri != rj:
+                parent[rj] = ri
+                similarity[ri] = min(
+                    score, similarity.get(ri, 1.0), similarity.pop(rj, 1.0)
+                )
+
+        groups: Dict[int, List[int]] = {}
+        for i in range(len(batch)):
+            groups.setdefault(root(i), []).append(i)
+        clusters = [
+            DuplicateCluster(
+                canonical=self._canonical(batch, members),
+                members=members,
+                similarity=similarity.get(r, 1.0),
+            )
+            for r, members in groups.items()
+            if len(members) > 1
+        ]
+        clusters.sort(key=lambda cluster: (-len(cluster.members), cluster.canonical))
+        return clusters
+
+    def _signatures(self, title_shingles: List[frozenset]):
+        """MinHash signature per title, computed on integer ids of the shingles"""
+        vocabulary: Dict[str, int] = {}
+        ids = [
+            vocabulary.setdefault(s, len(vocabulary))
+            for ss in title_shingles
+            for s in ss
+        ]
+        counts = np.fromiter(
+            map(len, title_shingles), dtype=np.int64, count=len(title_shingles)
+        )
+        has_signature = counts > 0
+        signatures = np.zeros((len(title_shingles), self.num_perm), dtype=np.uint32)
+        if not ids:
+            return signatures, has_signature
+
+        # One row of hash values per distinct shingle, then each title keeps
+        # the smallest value of its shingles' rows
+        vocab = np.arange(len(vocabulary), dtype=np.uint64)[:, None]
+        hashes = ((vocab * self._a + self._b) % _PRIME).astype(np.uint32)
+        ids = np.asarray(ids, dtype=np.int64)
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        rows = np.flatnonzero(has_signature)
+        # Bounded chunks of titles keep the gathered hash rows small
+        for start in range(0, len(rows), 20_000):
+            chunk = rows[start : start + 20_000]
+            begin, end = offsets[chunk[0]], offsets[chunk[-1] + 1]
+            gathered = hashes[ids[begin:end]]
+            signatures[chunk] = np.minimum.reduceat(gathered, offsets[chunk] - begin)
+        return signatures, has_signature
+
+    def _candidate_pairs(
+        self, signatures: np.ndarray, has_signature: np.ndarray, days: np.ndarray
+    ) -> Iterable[tuple]:
+        """Pairs sharing an LSH band and a start day bucket, each once"""
+        rows = np.flatnonzero(has_signature)
+        if len(rows) < 2:
+            return []
+        rows_per_band = self.num_perm // self.bands
+        # Each event also goes in the buckets of the next max_day_gap days, so
+        # two events at most that far apart meet in the later one's bucket
+        shifts = np.arange(self.max_day_gap + 1, dtype=np.int64)
+        known = days[rows] >= 0
+        bucket_rows = np.concatenate([rows[known]] * len(shifts) + [rows[~known]])
+        bucket_days = np.concatenate(
+            [days[rows[known]] + shift for shift in shifts] + [days[rows[~known]]]
+        ).astype(np.uint64)
+
+        pairs = []
+        for band in range(self.bands):
+            columns = slice(band * rows_per_band, (band + 1) * rows_per_band)
+            band_keys = (
+                signatures[bucket_rows, columns].astype(np.uint64) @ self._band_weights
+            )
+            keys = band_keys ^ (bucket_days * np.uint64(0x9E3779B97F4A7C15))
+            order = np.argsort(keys)
+            keys, members = keys[order], bucket_rows[order]
+            first = np.concatenate(([True], keys[1:] != keys[:-1]))
+            group = np.cumsum(first) - 1
+            starts = np.flatnonzero(first)
+            sizes = np.diff(np.append(starts, len(keys)))
+            if sizes.max() < 2:
+                continue
+
+            # Members of a bucket are consecutive after sorting, so member p
+            # pairs with p + 1, p + 2, ... while they stay in its bucket
+            small = sizes[group] <= self.max_bucket
+            for offset in range(1, min(sizes.max(), self.max_bucket)):
+                same = (group[:-offset] == group[offset:]) & small[offset:]
+                pairs.append((members[:-offset][same], members[offset:][same]))
+            large = ~small & ~first
+            pairs.append((members[starts[group[large]]], members[large]))
+
+        if not pairs:
+            return []
+        left = np.concatenate([i for i, _ in pairs])
+        right = np.concatenate([j for _, j in pairs])
+        low, high = np.minimum(left, right), np.maximum(left, right)
+        codes = np.unique(low * (len(has_signature) + 1) + high)
+        return zip(*divmod(codes, len(has_signature) + 1))
+
+    def _canonical(self, batch: EventBatch, members: List[int]) -> int:
+        """Member with the most fields filled in, then by source priority"""
+        columns = [batch.columns[name] for name in CANONICAL_FIELDS]
+        sources = batch.columns["source"]
+        unranked = len(self.source_priority)
+        return min(
+            members,
+            key=lambda i: (
+                -sum(1 for column in columns if column[i]),
+                self.source_priority.get(sources[i], unranked),
+                i,
+            ),
+        )
+
+
+def keep_canonical(
+    events: Union[EventBatch, Iterable[Event]], clusters: List[DuplicateCluster]
+) -> EventBatch:
+    """events without the duplicates of each cluster's canonical event"""
+    batch = EventBatch.of(events)
+    dropped = {i for cluster in clusters for i in cluster.members} - {
+        cluster.canonical for cluster in clusters
+    }
+    kept = EventBatch()
+    kept.extend_rows(row for i, row in enumerate(batch.rows()) if i not in dropped)
+    return kept
+
+
+def main():
+    from event_store import EventStore
+
+    parser = argparse.ArgumentParser(
+        description="Find the same event listed under different titles or sources"
+    )
+    parser.add_argument("--db", default="events.sqlite", help="event store file")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--max-day-gap", type=int, default=0)
+    parser.add_argument(
+        "--cross-source-only", action="store_true", help="ignore same-source matches"
+    )
+    parser.add_argument("--clusters", help="write every cluster's events to this CSV")
+    parser.add_argument("--out", help="write the events without duplicates to this CSV")
+    args = parser.parse_args()
+
+    batch = EventBatch()
+    batch.extend_rows(EventStore(args.db).iter_rows())
+    finder = DuplicateFinder(
+        threshold=args.threshold,
+        max_day_gap=args.max_day_gap,
+        cross_source_only=args.cross_source_only,
+    )
+    clusters = finder.find(batch)
+    duplicates = sum(len(cluster.members) - 1 for cluster in clusters)
+    print(f"{len(batch)} events, {len(clusters)} clusters, {duplicates} duplicates")
+
+    if args.clusters:
+        titles, dates, sources = (
+            batch.columns[name] for name in ("title", "start_date", "source")
+        )
+        with open(args.clusters, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["cluster", "canonical", "title", "start_date", "source"])
+            for number, cluster in enumerate(clusters, start=1):
+                for i in cluster.members:
+                    writer.writerow(
+                        [
+                            number,
+                            i == cluster.canonical,
+                            titles[i],
+                            dates[i],
+                            sources[i],
+                        ]
+                    )
+        print(f"Wrote clusters to {args.clusters}")
+    if args.out:
+        kept = keep_canonical(batch, clusters)
+        kept.to_csv(args.out)
+        print(f"Wrote {len(kept)} events to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
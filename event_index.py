@@ -0,0 +1,107 @@
+from datetime import date
+from typing import Iterable, List, Optional, Union
+from models import Event, EventBatch
+from date_normalize import normalize_dates
+from event_store import EventStore
+
+Day = Union[date, str]
+
+
+def _ordinal(day: Day) -> int:
+    if isinstance(day, str):
+        day = date.fromisoformat(day)
+    return day.toordinal()
+
+
+class EventIntervalIndex:
+    """Events by the days they run, for "what's on between X and Y" queries
+
+    Events are sorted by start date and laid out as an implicit balanced
+    tree, each node keeping the latest end date below it, so a query skips
+    every subtree that ends before the range or starts after it. Queries take
+    O(log n + k) for k matches. An event without an end date runs for its
+    start day; events without an ISO start date are left out and counted in
+    undated.
+
+    Args:
+        events: Events to index; missing ISO dates are filled in first
+    """
+
+    def __init__(self, events: Union[EventBatch, Iterable[Event]]):
+        self.batch = normalize_dates(EventBatch.of(events))
+        starts = self.batch.columns["iso_start_date"]
+        ends = self.batch.columns["iso_end_date"]
+        ordinals = {day: _ordinal(day) for day in set(starts) | set(ends) if day}
+        spans = []
+        for position, (start, end) in enumerate(zip(starts, ends)):
+            if not start:
+                continue
+            first = ordinals[start]
+            # A range written backwards still covers its days
+            last = max(ordinals[end], first) if end else first
+            spans.append((first, last, position))
+        spans.sort()
+        self.undated = len(self.batch) - len(spans)
+        self._starts: List[int] = [span[0] for span in spans]
+        self._ends: List[int] = [span[1] for span in spans]
+        self._positions: List[int] = [span[2] for span in spans]
+        self._max_end: List[int] = list(self._ends)
+        self._build(0, len(spans))
+
+    @classmethod
+    def from_store(
+        cls,
+        store: EventStore,
+        source: Optional[str] = None,
+        across_sources: bool = True,
+    ) -> "EventIntervalIndex":
+        """Index the stored events, one row per event across sources by default"""
+        batch = EventBatch()
+        batch.extend_rows(store.iter_rows(source, across_sources and source is None))
+        return cls(batch)
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def _build(self, lo: int, hi: int) -> int:
+        """Latest end date in [lo, hi), stored at the subtree's middle"""
+        if lo >= hi:
+            return -1
+        mid = (lo + hi) // 2
+        latest = max(self._ends[mid], self._build(lo, mid), self._build(mid + 1, hi))
+        self._max_end[mid] = latest
+        return latest
+
+    def _overlapping(self, first: int, last: int) -> List[int]:
+        """Sorted positions in the tree of the spans touching [first, last]"""
+        starts, ends, max_end = self._starts, self._ends, self._max_end
+        found = []
+        stack = [(0, len(starts))]
+        while stack:
+            lo, hi = stack.pop()
+            if lo >= hi or max_end[(lo + hi) // 2] < first:
+                continue
+            mid = (lo + hi) // 2
+            stack.append((lo, mid))
+            # Spans right of mid start no earlier than it
+            if starts[mid] <= last:
+                stack.append((mid + 1, hi))
+                if ends[mid] >= first:
+                    found.append(mid)
+        found.sort()
+        return found
+
+    def overlapping(self, first: Day, last: Day) -> EventBatch:
+        """Events running on any day from first to last, by start date
+
+        Days are dates or ISO strings, both ends included.
+        """
+        found = self._overlapping(_ordinal(first), _ordinal(last))
+        return self.batch.take(self._positions[i] for i in found)
+
+    def on_day(self, day: Day) -> EventBatch:
+        """Events running on day, by start date"""
+        return self.overlapping(day, day)
+
+    def count_overlapping(self, first: Day, last: Day) -> int:
+        return len(self._overlapping(_ordinal(first), _ordinal(last)))
@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+import argparse
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from models import EventBatch
+from event_store import FIELD_NAMES, EventStore
+
+# Matches in a title count three times one in the description
+FIELD_WEIGHTS = {"title": 3, "category": 2, "location": 2, "description": 1}
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from in into is it of on or the this to "
+    "with will you your our we al el".split()
+)
+
+TOKEN = re.compile(r"\w+")
+APOSTROPHES = str.maketrans("", "", "'’‘`ʿʾ")
+# Accents left as separate marks by NFKD, "café" -> "cafe"
+COMBINING_MARKS = re.compile("[\u0300-\u036f]")
+# Harakat, superscript alef and tatweel carry no meaning for search
+ARABIC_MARKS = re.compile("[ً-ٰٟـ]")
+ARABIC_LETTERS = str.maketrans("أإآٱىة", "اااايه")
+DOUBLE_LETTER = re.compile(r"([a-z])\1+")
+# Spellings the sites mix for the same Arabic sound: souq/souk, mushaireb/
+# msheireb, corniche/corneesh
+TRANSLITERATIONS = (("ou", "u"), ("oo", "u"), ("ee", "i"), ("q", "k"))
+
+
+@lru_cache(maxsize=65536)
+def fold_token(token: str) -> str:
+    """One spelling for the ways a word is written, "souqs" -> "suk" """
+    if token.isascii():
+        if token.isalpha():
+            if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+                token = token[:-1]
+            for written, folded in TRANSLITERATIONS:
+                token = token.replace(written, folded)
+            token = DOUBLE_LETTER.sub(r"\1", token)
+        return token
+    token = ARABIC_MARKS.sub("", token).translate(ARABIC_LETTERS)
+    if token.startswith("ال") and len(token) > 4:
+        # Definite article, "المتحف" and "متحف" are the same word
+        token = token[2:]
+    return token
+
+
+def _words(text: str) -> List[str]:
+    text = str(text).casefold()
+    if not text.isascii():
+        text = COMBINING_MARKS.sub("", unicodedata.normalize("NFKD", text))
+    return TOKEN.findall(text.translate(APOSTROPHES))
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Search terms of text, in English or Arabic script"""
+    if not text:
+        return []
+    return [fold_token(word) for word in _words(text) if word not in STOPWORDS]
+
+
+def term_counts(text: Optional[str]) -> Counter:
+    """How often each search term of text appears in it
+
+    Words are counted before folding, so a long description folds each
+    distinct word once.
+    """
+    counts: Counter = Counter()
+    if text:
+        for word, count in Counter(_words(text)).items():
+            if word not in STOPWORDS:
+                counts[fold_token(word)] += count
+    return counts
+
+
+def _pack(strings: List[str]) -> np.ndarray:
+    return np.frombuffer("\0".join(strings).encode("utf-8"), dtype=np.uint8)
+
+
+def _unpack(packed: np.ndarray) -> List[str]:
+    return packed.tobytes().decode("utf-8").split("\0") if len(packed) else []
+
+
+class EventSearchIndex:
+    """BM25 ranked full-text search over stored events
+
+    An inverted index of event title, description, location and category,
+    each field weighted by FIELD_WEIGHTS. Documents are event store rows;
+    refresh indexes the rows stored since the last refresh, so the index grows
+    with the store instead of being rebuilt. Postings are saved as flat numpy
+    arrays, one .npz file that loads without parsing.
+
+    Args:
+        k1: BM25 term frequency saturation
+        b: BM25 document length normalization
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.watermark = 0
+        self._rowids: List[int] = []
+        self._lengths: List[int] = []
+        self._terms: Dict[str, int] = {}
+        # Saved postings, term i at _doc_ids[_offsets[i]:_offsets[i + 1]]
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._doc_ids = np.zeros(0, dtype=np.uint32)
+        self._counts = np.zeros(0, dtype=np.uint16)
+        # Postings added since, by term
+        self._added_ids: Dict[str, List[int]] = defaultdict(list)
+        self._added_counts: Dict[str, List[int]] = defaultdict(list)
+
+    def __len__(self) -> int:
+        return len(self._rowids)
+
+    def add(self, rowid: int, row: Iterable) -> None:
+        """Index one stored row, given in field order"""
+        values = dict(zip(FIELD_NAMES, row))
+        counts: Counter = Counter()
+        for name, weight in FIELD_WEIGHTS.items():
+            for term, count in term_counts(values.get(name)).items():
+                counts[term] += count * weight
+        doc_id = len(self._rowids)
+        self._rowids.append(rowid)
+        self._lengths.append(sum(counts.values()))
+        added_ids, added_counts = self._added_ids, self._added_counts
+        for term, count in counts.items():
+            added_ids[term].append(doc_id)
+            added_counts[term].append(count)
+        self.watermark = max(self.watermark, rowid)
+
+    def refresh(self, store: EventStore) -> int:
+        """Index the rows stored since the last refresh; returns how many"""
+        if self.watermark > store.last_rowid():
+            # A different or recreated store, start over
+            self.__init__(self.k1, self.b)
+        added = 0
+        for rowid, row in store.iter_rows_after(self.watermark):
+            self.add(rowid, row)
+            added += 1
+        return added
+
+    def _postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        parts_ids, parts_counts = [], []
+        index = self._terms.get(term)
+        if index is not None:
+            start, end = self._offsets[index], self._offsets[index + 1]
+            parts_ids.append(self._doc_ids[start:end])
+            parts_counts.append(self._counts[start:end])
+        if term in self._added_ids:
+            parts_ids.append(np.array(self._added_ids[term], dtype=np.uint32))
+            counts = np.array(self._added_counts[term], dtype=np.int64)
+            parts_counts.append(np.minimum(counts, 65535).astype(np.uint16))
+        if not parts_ids:
+            return self._doc_ids[:0], self._counts[:0]
+        if len(parts_ids) == 1:
+            return parts_ids[0], parts_counts[0]
+        return np.concatenate(parts_ids), np.concatenate(parts_counts)
+
+    def search(self, query: str, limit: int = 20) -> List[Tuple[int, float]]:
+        """(rowid, score) of the best matching events, best first"""
+        total = len(self._rowids)
+        terms = set(tokenize(query))
+        if not total or not terms:
+            return []
+        lengths = np.asarray(self._lengths, dtype=np.float32)
+        norm = self.k1 * (1 - self.b + self.b * lengths / max(lengths.mean(), 1.0))
+        scores = np.zeros(total, dtype=np.float32)
+        for term in terms:
+            doc_ids, counts = self._postings(term)
+            if not len(doc_ids):
+                continue
+            idf = np.log1p((total - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            counts = counts.astype(np.float32)
+            # A document appears once per term, so plain indexing adds safely
+            scores[doc_ids] += idf * counts * (self.k1 + 1) / (counts + norm[doc_ids])
+        matched = np.flatnonzero(scores)
+        if len(matched) > limit:
+            matched = matched[np.argpartition(-scores[matched], limit)[:limit]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(self._rowids[i], float(scores[i])) for i in matched]
+
+    def search_events(
+        self, store: EventStore, query: str, limit: int = 20
+    ) -> EventBatch:
+        """The best matching events, best first"""
+        return store.batch_by_rowid(rowid for rowid, _ in self.search(query, limit))
+
+    def save(self, path: str):
+        """Merge the added postings in and write everything to path (.npz)"""
+        terms = sorted(set(self._terms) | set(self._added_ids))
+        offsets = [0]
+        doc_ids, counts = [], []
+        for term in terms:
+            term_ids, term_counts = self._postings(term)
+            doc_ids.append(term_ids)
+            counts.append(term_counts)
+            offsets.append(offsets[-1] + len(term_ids))
+        self._terms = {term: i for i, term in enumerate(terms)}
+        self._offsets = np.array(offsets, dtype=np.int64)
+        self._doc_ids = np.concatenate(doc_ids) if doc_ids else self._doc_ids[:0]
+        self._counts = np.concatenate(counts) if counts else self._counts[:0]
+        self._added_ids.clear()
+        self._added_counts.clear()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{path}.tmp.npz"
+        np.savez(
+            temp_path,
+            terms=_pack(terms),
+            offsets=self._offsets,
+            doc_ids=self._doc_ids,
+            counts=self._counts,
+            rowids=np.array(self._rowids, dtype=np.int64),
+            lengths=np.array(self._lengths, dtype=np.uint32),
+            settings=np.array([self.k1, self.b, self.watermark], dtype=np.float64),
+        )
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "EventSearchIndex":
+        with np.load(path) as saved:
+            k1, b, watermark = saved["settings"]
+            index = cls(k1=float(k1), b=float(b))
+            index.watermark = int(watermark)
+            index._terms = {term: i for i, term in enumerate(_unpack(saved["terms"]))}
+            index._offsets = saved["offsets"]
+            index._doc_ids = saved["doc_ids"]
+            index._counts = saved["counts"]
+            index._rowids = saved["rowids"].tolist()
+            index._lengths = saved["lengths"].tolist()
+        return index
+
+
+def load_search_index(
+    store: EventStore, path: str = ".scraper_state/search_index.npz"
+) -> EventSearchIndex:
+    """Index saved at path, brought up to date with store and saved again"""
+    try:
+        index = EventSearchIndex.load(path)
+    except (OSError, KeyError, ValueError) as e:
+        if os.path.exists(path):
+            print(f"Rebuilding search index, could not load {path}: {e}")
+        index = EventSearchIndex()
+    if index.refresh(store):
+        index.save(path)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search stored events")
+    parser.add_argument("query", nargs="+")
+    parser.add_argument("--db", default="events.sqlite", help="event store file")
+    parser.add_argument(
+        "--index", default=".scraper_state/search_index.npz", help="search index file"
+    )
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument(
+        "--rebuild", action="store_true", help="index every event again"
+    )
+    args = parser.parse_args()
+
+    store = EventStore(args.db)
+    if args.rebuild and os.path.exists(args.index):
+        os.remove(args.index)
+    index = load_search_index(store, args.index)
+    results = index.search(" ".join(args.query), args.limit)
+    events = store.batch_by_rowid(rowid for rowid, _ in results)
+    columns = events.columns
+    for (_, score), title, start, source in zip(
+        results, columns["title"], columns["start_date"], columns["source"]
+    ):
+        start = " ".join((start or "").split())
+        print(f"{score:6.2f}  {title} ({start}, {source})")
+    print(f"{len(results)} of {len(index)} events")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+#!/usr/bin/env python
+import argparse
+import ast
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, Iterator, List, Optional, Union
+from models import Event, EventBatch
+from pipeline import EventSink
+from date_normalize import normalize_dates
+
+FIELD_NAMES = Event.get_field_names()
+
+# Events are the same event when these match, as drop_duplicates decided for
+# the CSV files; each source keeps its own copy
+KEY_FIELDS = ("title", "start_date", "location")
+TAGS_INDEX = FIELD_NAMES.index("tags")
+
+
+def dedupe_key(source: Optional[str], row: dict) -> str:
+    return json.dumps([source] + [row.get(name) for name in KEY_FIELDS])
+
+
+def _tags_from_csv(value: str) -> List[str]:
+    """Tags as pandas wrote them to CSV, e.g. "['a', 'b']" """
+    try:
+        tags = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return [value]
+    return [str(tag) for tag in tags] if isinstance(tags, list) else [value]
+
+
+def _decode_row(row: tuple) -> list:
+    """A stored row with its tags back as a list"""
+    row = list(row)
+    row[TAGS_INDEX] = json.loads(row[TAGS_INDEX] or "[]")
+    return row
+
+
+def _csv_header(filename: str) -> List[str]:
+    with open(filename, newline="", encoding="utf-8") as f:
+        return next(csv.reader(f), [])
+
+
+class EventStore:
+    """SQLite store of every event seen, one row per source and dedupe key
+
+    Saving a batch only writes the events it adds instead of rewriting a CSV
+    of the whole history. The database runs in WAL mode with one connection
+    per thread, so scrapers finishing in parallel can save without blocking
+    each other's reads. The CSV files are produced from it with export_csv.
+
+    Args:
+        path: SQLite database file
+    """
+
+    def __init__(self, path: str = "events.sqlite"):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        columns = ",\n".join(f"{name} TEXT" for name in FIELD_NAMES)
+        db = self._db()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(f"""
+            CREATE TABLE IF NOT EXISTS events (
+                dedupe_key TEXT NOT NULL UNIQUE,
+                {columns},
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL
+            )
+            """)
+        db.execute("CREATE INDEX IF NOT EXISTS events_source ON events (source)")
+        # Stores made before a field was added to Event get its column
+        existing = {row[1] for row in db.execute("PRAGMA table_info(events)")}
+        for name in FIELD_NAMES:
+            if name not in existing:
+                db.execute(f"ALTER TABLE events ADD COLUMN {name} TEXT")
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            # Autocommit mode, transactions are opened explicitly with
+            # BEGIN IMMEDIATE so concurrent writers wait instead of deadlocking
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def upsert(self, events: Union[EventBatch, Iterable[Event]]) -> EventBatch:
+        """Save events, returning the ones not stored before
+
+        Events already stored keep the values they were first saved with, like
+        drop_duplicates did, and only have last_seen updated.
+        """
+        batch = EventBatch.of(events)
+        new_rows = []
+        now = time.time()
+        insert = (
+            f"INSERT OR IGNORE INTO events (dedupe_key, {', '.join(FIELD_NAMES)}, "
+            f"first_seen, last_seen) VALUES ({', '.join('?' * (len(FIELD_NAMES) + 3))})"
+        )
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            for values in batch.rows():
+                row = dict(zip(FIELD_NAMES, values))
+                key = dedupe_key(row["source"], row)
+                row["tags"] = json.dumps(list(row["tags"] or []))
+                cursor = db.execute(insert, (key, *row.values(), now, now))
+                if cursor.rowcount:
+                    new_rows.append(values)
+                else:
+                    db.execute(
+                        "UPDATE events SET last_seen = ? WHERE dedupe_key = ?",
+                        (now, key),
+                    )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        new_events = EventBatch()
+        new_events.extend_rows(new_rows)
+        return new_events
+
+    def import_csv(self, filename: str, source: Optional[str] = None) -> int:
+        """Load a CSV written by the old save_to_csv; returns rows added"""
+        with open(filename, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+        events = []
+        for row in rows:
+            values = {
+                name: (row.get(name) or None) for name in FIELD_NAMES if name != "tags"
+            }
+            if source:
+                values["source"] = source
+            tags = _tags_from_csv(row["tags"]) if row.get("tags") else []
+            events.append(Event(**values, tags=tags))
+        return len(self.upsert(normalize_dates(EventBatch(events))))
+
+    def has_source(self, source: str) -> bool:
+        return (
+            self._db()
+            .execute("SELECT 1 FROM events WHERE source = ? LIMIT 1", (source,))
+            .fetchone()
+            is not None
+        )
+
+    def count(self, source: Optional[str] = None) -> int:
+        if source is None:
+            return self._db().execute("SELECT COUNT(*) FROM events").fetchone()[0]
+        return (
+            self._db()
+            .execute("SELECT COUNT(*) FROM events WHERE source = ?", (source,))
+            .fetchone()[0]
+        )
+
+    def iter_rows(
+        self, source: Optional[str] = None, across_sources: bool = False
+    ) -> Iterator[tuple]:
+        """Stored rows in field order, oldest first
+
+        across_sources keeps only the first row of each title, start date and
+        location whatever its source, as the combined CSV was deduplicated.
+        """
+        query = f"SELECT {', '.join(FIELD_NAMES)} FROM events"
+        where, params = [], []
+        if source is not None:
+            where.append("source = ?")
+            params.append(source)
+        if across_sources:
+            where.append(
+                f"rowid IN (SELECT MIN(rowid) FROM events GROUP BY {', '.join(KEY_FIELDS)})"
+            )
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        for row in self._db().execute(query + " ORDER BY rowid", params):
+            yield _decode_row(row)
+
+    def iter_rows_after(self, rowid: int = 0) -> Iterator[tuple]:
+        """(rowid, row) of the rows stored after rowid, oldest first"""
+        for row in self._db().execute(
+            f"SELECT rowid, {', '.join(FIELD_NAMES)} FROM events WHERE rowid > ? "
+            "ORDER BY rowid",
+            (rowid,),
+        ):
+            yield row[0], _decode_row(row[1:])
+
+    def last_rowid(self) -> int:
+        return self._db().execute("SELECT MAX(rowid) FROM events").fetchone()[0] or 0
+
+    def batch_by_rowid(self, rowids: Iterable[int]) -> EventBatch:
+        """Stored events with the given rowids, in that order"""
+        rowids = [int(rowid) for rowid in rowids]
+        found = {}
+        db = self._db()
+        # Under SQLite's default limit of 999 parameters per query
+        for i in range(0, len(rowids), 900):
+            chunk = rowids[i : i + 900]
+            for row in db.execute(
+                f"SELECT rowid, {', '.join(FIELD_NAMES)} FROM events "
+                f"WHERE rowid IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            ):
+                found[row[0]] = _decode_row(row[1:])
+        batch = EventBatch()
+        batch.extend_rows(found[rowid] for rowid in rowids if rowid in found)
+        return batch
+
+    def export_csv(
+        self, filename: str, source: Optional[str] = None, across_sources: bool = False
+    ) -> int:
+        """Write stored events to filename in the old CSV layout; returns rows written"""
+        written = 0
+        with open(filename, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(FIELD_NAMES)
+            for row in self.iter_rows(source, across_sources):
+                writer.writerow(row)
+                written += 1
+        return written
+
+    def sources(self) -> List[str]:
+        return [
+            source
+            for (source,) in self._db().execute(
+                "SELECT DISTINCT source FROM events ORDER BY source"
+            )
+        ]
+
+    def close(self):
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+
+_default_store: Optional[EventStore] = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_event_store() -> EventStore:
+    """Store used by save_to_csv, opened on first use at events.sqlite"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = EventStore()
+        return _default_store
+
+
+def configure_default_event_store(**kwargs) -> EventStore:
+    """Use a store at another path for every scraper"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is not None:
+            _default_store.close()
+        _default_store = EventStore(**kwargs)
+        return _default_store
+
+
+class CsvSink(EventSink):
+    """Saves a source's events to the store, appending the new ones to its CSV
+
+    Args:
+        source: Source the events come from
+        filename: CSV file, defaults to <source>_events.csv
+        store: Event store, defaults to the shared one
+    """
+
+    def __init__(
+        self,
+        source: str,
+        filename: Optional[str] = None,
+        store: Optional[EventStore] = None,
+    ):
+        super().__init__()
+        self.source = source
+        self.filename = filename or f"{source}_events.csv"
+        self.store = store or get_default_event_store()
+        self.written = 0
+        self._seeded = False
+
+    def write(self, batch: EventBatch):
+        with self.lock:
+            csv_exists = os.path.exists(self.filename)
+            rewrite = not csv_exists
+            if not self._seeded:
+                if csv_exists and not self.store.has_source(self.source):
+                    # First save since the store was added, take over the CSV's history
+                    self.store.import_csv(self.filename, self.source)
+                # A CSV written before Event gained fields is rewritten once
+                # with every column rather than appended to
+                rewrite = rewrite or _csv_header(self.filename) != FIELD_NAMES
+                self._seeded = True
+
+            new_events = self.store.upsert(batch)
+            if rewrite:
+                self.store.export_csv(self.filename, self.source)
+            elif len(new_events):
+                with open(self.filename, "a", newline="", encoding="utf-8") as f:
+                    csv.writer(f).writerows(new_events.rows())
+            self.written += len(batch)
+
+    def close(self):
+        if self.written:
+            print(
+                f"Updated {self.filename} with {self.store.count(self.source)} total events."
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and export the event store")
+    parser.add_argument("--db", default="events.sqlite", help="event store file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="write events to CSV")
+    export.add_argument("--source", help="only this source")
+    export.add_argument(
+        "--out", help="CSV file, default <source>_events.csv or combined_events.csv"
+    )
+    export.add_argument(
+        "--per-source",
+        action="store_true",
+        help="one <source>_events.csv per source, as save_to_csv writes them",
+    )
+
+    import_csv = commands.add_parser("import", help="load an existing CSV")
+    import_csv.add_argument("csv")
+    import_csv.add_argument("--source", help="source to record, default from CSV")
+
+    commands.add_parser("stats", help="events per source")
+    args = parser.parse_args()
+
+    store = EventStore(args.db)
+    if args.command == "export":
+        if args.per_source:
+            for source in store.sources():
+                filename = f"{source}_events.csv"
+                print(
+                    f"Wrote {store.export_csv(filename, source)} events to {filename}"
+                )
+        elif args.source:
+            filename = args.out or f"{args.source}_events.csv"
+            print(
+                f"Wrote {store.export_csv(filename, args.source)} events to {filename}"
+            )
+        else:
+            filename = args.out or "combined_events.csv"
+            written = store.export_csv(filename, across_sources=True)
+            print(f"Wrote {written} unique events to {filename}")
+    elif args.command == "import":
+        print(f"Added {store.import_csv(args.csv, args.source)} events from {args.csv}")
+    else:
+        for source in store.sources():
+            print(f"{source}: {store.count(source)}")
+        print(f"Total: {store.count()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,432 @@
+import json
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Dict, List, Optional
+
+import gspread
+import requests
+from gspread.utils import a1_range_to_grid_range
+
+
+def api_error(code: int, message: str) -> gspread.exceptions.APIError:
+    """An APIError shaped like the ones gspread raises for HTTP errors"""
+    response = requests.Response()
+    response.status_code = code
+    response._content = json.dumps(
+        {"error": {"code": code, "message": message, "status": "FAKE"}}
+    ).encode("utf-8")
+    return gspread.exceptions.APIError(response)
+
+
+def split_range(range_name: str) -> tuple:
+    """('Sheet title' or None, A1 range) from a possibly sheet-qualified range"""
+    if "!" not in range_name:
+        return None, range_name
+    title, a1 = range_name.rsplit("!", 1)
+    if title.startswith("'") and title.endswith("'"):
+        title = title[1:-1].replace("''", "'")
+    return title, a1
+
+
+def trim(rows: List[List[str]]) -> List[List[str]]:
+    """Drop trailing blank cells and rows, as value reads do"""
+    trimmed = []
+    for row in rows:
+        end = len(row)
+        while end and row[end - 1] == "":
+            end -= 1
+        trimmed.append(row[:end])
+    while trimmed and not trimmed[-1]:
+        trimmed.pop()
+    return trimmed
+
+
+class QuotaWindow:
+    """Requests allowed in any 60 second window, None for unlimited"""
+
+    def __init__(self, per_minute: Optional[int]):
+        self.per_minute = per_minute
+        self.times = deque()
+
+    def take(self, kind: str):
+        if self.per_minute is None:
+            return
+        now = time.monotonic()
+        while self.times and now - self.times[0] >= 60:
+            self.times.popleft()
+        if len(self.times) >= self.per_minute:
+            raise api_error(429, f"Quota exceeded for {kind} requests per minute")
+        self.times.append(now)
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet: "FakeSpreadsheet", title: str, sheet_id: int):
+        self.spreadsheet = spreadsheet
+        self.spreadsheet_id = spreadsheet.id
+        self.title = title
+        self.id = sheet_id
+        self.rows: List[List[str]] = []
+        # Column A formats only, the one column the scripts format and read back
+        self.formats: List[Optional[dict]] = []
+        # The grid as the API has it; _properties is gspread's copy, read when
+        # the worksheet was opened and kept current by its own methods only
+        self.grid = {"rowCount": 1000, "columnCount": 26}
+        self._properties = {"sheetId": sheet_id, "title": title, "gridProperties": {}}
+        self._refresh()
+
+    @property
+    def row_count(self) -> int:
+        return self._properties["gridProperties"]["rowCount"]
+
+    @property
+    def col_count(self) -> int:
+        return self._properties["gridProperties"]["columnCount"]
+
+    # Storage helpers, not API calls
+
+    def _refresh(self):
+        """Bring gspread's copy of the grid in line, as reopening the sheet does"""
+        self._properties["gridProperties"] = dict(self.grid)
+
+    def _api_properties(self) -> dict:
+        return {**self._properties, "gridProperties": dict(self.grid)}
+
+    def load(self, rows: List[List[Any]]):
+        """Replace the contents without counting any request"""
+        self.rows = [[str(cell) for cell in row] for row in rows]
+        self.formats = [None] * len(self.rows)
+        self.grid["rowCount"] = max(self.grid["rowCount"], len(self.rows))
+        self._refresh()
+
+    def _grow(self, rows: int):
+        while len(self.rows) < rows:
+            self.rows.append([])
+            self.formats.append(None)
+        self.grid["rowCount"] = max(self.grid["rowCount"], rows)
+
+    def _read(self, a1: str) -> List[List[str]]:
+        grid = a1_range_to_grid_range(a1)
+        start_row = grid.get("startRowIndex", 0)
+        end_row = grid.get("endRowIndex", len(self.rows))
+        start_col = grid.get("startColumnIndex", 0)
+        end_col = grid.get("endColumnIndex")
+        return trim([row[start_col:end_col] for row in self.rows[start_row:end_row]])
+
+    def _write(self, a1: str, values: List[List[Any]]):
+        grid = a1_range_to_grid_range(a1)
+        start_row = grid.get("startRowIndex", 0)
+        start_col = grid.get("startColumnIndex", 0)
+        self._grow(start_row + len(values))
+        for offset, values_row in enumerate(values):
+            row = self.rows[start_row + offset]
+            end = start_col + len(values_row)
+            if len(row) < end:
+                row.extend([""] * (end - len(row)))
+            row[start_col:end] = ["" if v is None else str(v) for v in values_row]
+
+    def _insert(self, start: int, count: int):
+        self.rows[start:start] = [[] for _ in range(count)]
+        self.formats[start:start] = [None] * count
+        self.grid["rowCount"] += count
+
+    def _delete(self, start: int, end: int):
+        del self.rows[start:end]
+        del self.formats[start:end]
+        self.grid["rowCount"] = max(self.grid["rowCount"] - (end - start), 1)
+
+    # gspread Worksheet surface
+
+    def get_all_values(self, **kwargs) -> List[List[str]]:
+        rows = trim(self.rows)
+        width = max((len(row) for row in rows), default=0)
+        self.spreadsheet._request("get_all_values", "read", len(rows) * width)
+        return [row + [""] * (width - len(row)) for row in rows]
+
+    def get(self, range_name: Optional[str] = None, **kwargs) -> List[List[str]]:
+        values = self._read(range_name) if range_name else trim(self.rows)
+        self.spreadsheet._request("get", "read", sum(map(len, values)))
+        return values
+
+    def batch_get(self, ranges: List[str], **kwargs) -> List[List[List[str]]]:
+        values = [self._read(split_range(r)[1]) for r in ranges]
+        cells = sum(len(row) for block in values for row in block)
+        self.spreadsheet._request("batch_get", "read", cells)
+        return values
+
+    def update(self, values, range_name: Optional[str] = None, **kwargs):
+        self.spreadsheet._request("update", "write", sum(map(len, values)))
+        self._write(range_name or "A1", values)
+
+    def update_cell(self, row: int, col: int, value: Any):
+        self.spreadsheet._request("update_cell", "write", 1)
+        self._write(gspread.utils.rowcol_to_a1(row, col), [[value]])
+
+    def freeze(self, rows: Optional[int] = None, cols: Optional[int] = None):
+        self.spreadsheet._request("freeze", "write")
+        if rows is not None:
+            self.grid["frozenRowCount"] = rows
+            self._properties["gridProperties"]["frozenRowCount"] = rows
+
+    def insert_rows(self, values, row: int = 1, value_input_option=None, **kwargs):
+        # gspread sends an insertDimension batch_update then a values append
+        self.spreadsheet._request(
+            "insert_rows", "write", sum(map(len, values)), requests=2
+        )
+        self._insert(row - 1, len(values))
+        self._write(f"A{row}", values)
+        self._properties["gridProperties"]["rowCount"] += len(values)
+
+    def delete_rows(self, start_index: int, end_index: Optional[int] = None):
+        self.spreadsheet._request("delete_rows", "write")
+        end_index = end_index or start_index
+        self._delete(start_index - 1, end_index)
+        grid = self._properties["gridProperties"]
+        grid["rowCount"] = max(grid["rowCount"] - (end_index - start_index + 1), 1)
+
+
+class FakeSpreadsheet:
+    """In-memory spreadsheet counting the Sheets API requests made against it
+
+    Covers the parts of gspread the sheet sync, dedupe and mark-added scripts
+    use, so they can run without a Google account at any sheet size. Requests
+    can be slowed by a fixed latency plus a per-cell cost and are checked
+    against per-minute quotas, which raise the same 429 APIError as the API.
+
+    Args:
+        title: Spreadsheet title, also used to build its id
+        latency: Seconds added to every request
+        seconds_per_cell: Seconds added per cell read or written
+        reads_per_minute: Read quota, None for unlimited
+        writes_per_minute: Write quota, None for unlimited
+    """
+
+    def __init__(
+        self,
+        title: str = "Event Scrapes",
+        latency: float = 0.0,
+        seconds_per_cell: float = 0.0,
+        reads_per_minute: Optional[int] = None,
+        writes_per_minute: Optional[int] = None,
+    ):
+        self.id = f"fake-{title}"
+        self.title = title
+        self.latency = latency
+        self.seconds_per_cell = seconds_per_cell
+        self.quotas = {
+            "read": QuotaWindow(reads_per_minute),
+            "write": QuotaWindow(writes_per_minute),
+        }
+        self.calls = Counter()
+        self.requests = Counter()
+        self.cells = Counter()
+        self.rejected = 0
+        self._sheets: Dict[str, FakeWorksheet] = {}
+        self._lock = threading.RLock()
+
+    def _charge(self, cells: int):
+        if self.seconds_per_cell and cells:
+            time.sleep(cells * self.seconds_per_cell)
+
+    def _request(self, method: str, kind: str, cells: int = 0, requests: int = 1):
+        with self._lock:
+            try:
+                for _ in range(requests):
+                    self.quotas[kind].take(kind)
+            except gspread.exceptions.APIError:
+                self.rejected += 1
+                raise
+            self.calls[method] += 1
+            self.requests[kind] += requests
+            self.cells[kind] += cells
+        if self.latency:
+            time.sleep(self.latency * requests)
+        self._charge(cells)
+
+    def reset_counters(self):
+        self.calls.clear()
+        self.requests.clear()
+        self.cells.clear()
+        self.rejected = 0
+
+    def _sheet(self, title: str) -> FakeWorksheet:
+        try:
+            return self._sheets[title]
+        except KeyError:
+            raise api_error(400, f"Unable to parse range: {title}")
+
+    def _sheet_by_id(self, sheet_id: int) -> FakeWorksheet:
+        for worksheet in self._sheets.values():
+            if worksheet.id == sheet_id:
+                return worksheet
+        raise api_error(400, f"No grid with id: {sheet_id}")
+
+    # gspread Spreadsheet surface
+
+    def worksheet(self, title: str) -> FakeWorksheet:
+        self._request("worksheet", "read")
+        if title not in self._sheets:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        worksheet = self._sheets[title]
+        worksheet._refresh()
+        return worksheet
+
+    def worksheets(self) -> List[FakeWorksheet]:
+        self._request("worksheets", "read")
+        for worksheet in self._sheets.values():
+            worksheet._refresh()
+        return list(self._sheets.values())
+
+    def add_worksheet(self, title: str, rows=1000, cols=26, index=None):
+        self._request("add_worksheet", "write")
+        return self.create_worksheet(title, int(rows), int(cols))
+
+    def create_worksheet(
+        self, title: str, rows: int = 1000, cols: int = 26
+    ) -> FakeWorksheet:
+        """Add a worksheet without counting a request, for test setup"""
+        worksheet = FakeWorksheet(self, title, len(self._sheets))
+        worksheet.grid.update(rowCount=rows, columnCount=cols)
+        worksheet._refresh()
+        self._sheets[title] = worksheet
+        return worksheet
+
+    def batch_update(self, body: dict) -> dict:
+        self._request("batch_update", "write", len(body.get("requests", [])))
+        replies = []
+        for request in body.get("requests", []):
+            ((name, params),) = request.items()
+            if name == "insertDimension":
+                r = params["range"]
+                worksheet = self._sheet_by_id(r["sheetId"])
+                worksheet._insert(r["startIndex"], r["endIndex"] - r["startIndex"])
+            elif name == "deleteDimension":
+                r = params["range"]
+                self._sheet_by_id(r["sheetId"])._delete(r["startIndex"], r["endIndex"])
+            elif name == "updateSheetProperties":
+                properties = params["properties"]
+                worksheet = self._sheet_by_id(properties["sheetId"])
+                worksheet.grid.update(properties.get("gridProperties", {}))
+            elif name == "repeatCell":
+                r = params["range"]
+                worksheet = self._sheet_by_id(r["sheetId"])
+                if r.get("startColumnIndex", 0) == 0:
+                    end = r.get("endRowIndex", len(worksheet.rows))
+                    worksheet._grow(end)
+                    cell_format = params["cell"].get("userEnteredFormat", {})
+                    for row in range(r.get("startRowIndex", 0), end):
+                        worksheet.formats[row] = dict(cell_format)
+            else:
+                raise api_error(400, f"Fake spreadsheet does not support {name}")
+            replies.append({})
+        return {"spreadsheetId": self.id, "replies": replies}
+
+    def values_batch_update(self, body: dict) -> dict:
+        data = body.get("data", [])
+        cells = sum(len(row) for entry in data for row in entry["values"])
+        self._request("values_batch_update", "write", cells)
+        for entry in data:
+            title, a1 = split_range(entry["range"])
+            self._sheet(title)._write(a1, entry["values"])
+        return {"spreadsheetId": self.id, "totalUpdatedCells": cells}
+
+    def values_batch_get(self, ranges: List[str], params=None) -> dict:
+        value_ranges = []
+        for range_name in ranges:
+            title, a1 = split_range(range_name)
+            value_ranges.append(
+                {"range": range_name, "values": self._sheet(title)._read(a1)}
+            )
+        cells = sum(len(row) for entry in value_ranges for row in entry["values"])
+        self._request("values_batch_get", "read", cells)
+        return {"spreadsheetId": self.id, "valueRanges": value_ranges}
+
+    def fetch_sheet_metadata(self, params: Optional[dict] = None) -> dict:
+        """Sheet properties, or the grid data of params['ranges']
+
+        Grid data holds column A effective formats, plus every cell's
+        formattedValue when the fields ask for it. Ranges are grouped by sheet
+        as the API returns them.
+        """
+        params = params or {}
+        ranges = params.get("ranges") or []
+        with_values = "formattedValue" in params.get("fields", "")
+        if not ranges:
+            self._request("fetch_sheet_metadata", "read")
+            return {
+                "spreadsheetId": self.id,
+                "properties": {"title": self.title},
+                "sheets": [
+                    {"properties": worksheet._api_properties()}
+                    for worksheet in self._sheets.values()
+                ],
+            }
+
+        data_by_sheet: Dict[str, list] = {}
+        cells = 0
+        for range_name in ranges:
+            title, a1 = split_range(range_name)
+            worksheet = self._sheet(title)
+            grid = a1_range_to_grid_range(a1)
+            start = grid.get("startRowIndex", 0)
+            end = min(grid.get("endRowIndex", len(worksheet.rows)), len(worksheet.rows))
+            start_col = grid.get("startColumnIndex", 0)
+            end_col = grid.get("endColumnIndex", start_col + 1)
+            row_data = []
+            for row, cell_format in zip(
+                worksheet.rows[start:end], worksheet.formats[start:end]
+            ):
+                values = []
+                if with_values:
+                    for value in row[start_col:end_col]:
+                        values.append({"formattedValue": value} if value else {})
+                if start_col == 0:
+                    effective = dict(cell_format or {})
+                    if "backgroundColor" in effective:
+                        effective["backgroundColorStyle"] = {
+                            "rgbColor": effective["backgroundColor"]
+                        }
+                    if not values:
+                        values.append({})
+                    values[0]["effectiveFormat"] = effective
+                cells += len(values)
+                row_data.append({"values": values})
+            data_by_sheet.setdefault(worksheet.title, []).append(
+                {"startRow": start, "startColumn": start_col, "rowData": row_data}
+            )
+        self._request("fetch_sheet_metadata", "read", cells)
+        return {
+            "spreadsheetId": self.id,
+            "sheets": [
+                {
+                    "properties": worksheet._api_properties(),
+                    "data": data_by_sheet[title],
+                }
+                for title, worksheet in self._sheets.items()
+                if title in data_by_sheet
+            ],
+        }
+
+    def summary(self) -> str:
+        calls = ", ".join(
+            f"{name}={count}" for name, count in sorted(self.calls.items())
+        )
+        return (
+            f"{self.requests['read']} read / {self.requests['write']} write request(s), "
+            f"{self.rejected} rejected by quota ({calls})"
+        )
+
+
+class FakeClient:
+    """Stands in for gspread.authorize(...), opening fake spreadsheets by title"""
+
+    def __init__(self, *spreadsheets: FakeSpreadsheet):
+        self.spreadsheets = {s.title: s for s in spreadsheets}
+
+    def open(self, title: str) -> FakeSpreadsheet:
+        try:
+            spreadsheet = self.spreadsheets[title]
+        except KeyError:
+            raise gspread.exceptions.SpreadsheetNotFound(title)
+        spreadsheet._request("open", "read")
+        return spreadsheet
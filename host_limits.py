@@ -0,0 +1,355 @@
+import random
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Iterator, Optional
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+import requests
+from sheets_scheduler import RETRYABLE_STATUS, TokenBucket
+
+# Statuses where the host asks us to slow down, every request to it pauses
+SLOW_DOWN_STATUS = {429, 503}
+
+
+@dataclass
+class HostLimits:
+    """How hard one host may be hit
+
+    Args:
+        requests_per_minute: Average request rate, a token bucket refilled
+            continuously; robots.txt Crawl-delay lowers it, None for no limit
+        burst: Requests that may go out at once after an idle spell, defaults
+            to max_concurrency
+        max_concurrency: Most requests in flight at once
+        min_concurrency: The in-flight limit never drops below this
+        latency_target: Seconds to the response headers past which the host
+            counts as overloaded
+        max_retries: Retries of a request on 429, 5xx or a connection error
+        backoff_base: First retry waits up to this many seconds, doubling after
+        backoff_max: Longest wait between two retries
+    """
+
+    requests_per_minute: Optional[float] = 120
+    burst: Optional[float] = None
+    max_concurrency: int = 6
+    min_concurrency: int = 1
+    latency_target: float = 5.0
+    max_retries: int = 3
+    backoff_base: float = 1.0
+    backoff_max: float = 60.0
+
+
+def retry_after_seconds(value: Optional[str]) -> float:
+    """Seconds a Retry-After header asks for, as a number or an HTTP date"""
+    if not value:
+        return 0.0
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class AdaptiveConcurrency:
+    """In-flight request limit adjusted by AIMD
+
+    Every response that comes back fast raises the limit by 1/limit, about one
+    more request per round of limit requests; a congested one (slow, 429, 503
+    or failed) halves it, at most once per cooldown so a burst of failures
+    that were already in flight counts as one signal.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.in_flight = 0
+        self._decreased_at = float("-inf")
+        self._cond = threading.Condition()
+
+    def acquire(self) -> float:
+        """Wait for a free slot; returns seconds waited"""
+        start = time.monotonic()
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+        return time.monotonic() - start
+
+    def release(self, congested: bool, cooldown: float):
+        with self._cond:
+            self.in_flight -= 1
+            if congested:
+                now = time.monotonic()
+                if now - self._decreased_at >= cooldown:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self._decreased_at = now
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+class HostScheduler:
+    """Rate, concurrency and pauses of the requests to one host"""
+
+    def __init__(self, host: str, limits: HostLimits, crawl_delay: float = 0):
+        self.host = host
+        self.limits = limits
+        self.crawl_delay = crawl_delay
+        rate = limits.requests_per_minute
+        burst = limits.burst or limits.max_concurrency
+        if crawl_delay:
+            # One request per Crawl-delay seconds, without bursts
+            rate = min(rate or float("inf"), 60.0 / crawl_delay)
+            burst = 1
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.concurrency = AdaptiveConcurrency(
+            limits.max_concurrency, limits.min_concurrency, limits.max_concurrency
+        )
+        self.paused_until = 0.0
+        self.requests = 0
+        self.retries = 0
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds: float):
+        """Hold back every request to the host for seconds"""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def _wait_for_pause(self) -> float:
+        waited = 0.0
+        while True:
+            with self._lock:
+                delay = self.paused_until - time.monotonic()
+            if delay <= 0:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    def acquire(self) -> float:
+        """Wait for a slot, the end of any pause and a token; returns seconds"""
+        waited = self.concurrency.acquire()
+        waited += self._wait_for_pause()
+        if self.bucket:
+            waited += self.bucket.acquire()
+        with self._lock:
+            self.requests += 1
+            self.waited += waited
+        return waited
+
+    def release(self, response: Optional[requests.Response]):
+        """Free the slot, adjusting the limit to how the host answered"""
+        if response is None:
+            congested = True
+        else:
+            latency = response.elapsed.total_seconds() if response.elapsed else 0.0
+            congested = (
+                response.status_code in SLOW_DOWN_STATUS
+                or latency > self.limits.latency_target
+            )
+        self.concurrency.release(congested, self.limits.latency_target)
+
+    def backoff(self, attempt: int, response: Optional[requests.Response]) -> float:
+        """Seconds to wait before retry attempt + 1, pausing the host if asked"""
+        delay = random.uniform(
+            0, min(self.limits.backoff_max, self.limits.backoff_base * 2**attempt)
+        )
+        if response is not None and response.status_code in SLOW_DOWN_STATUS:
+            delay = max(delay, retry_after_seconds(response.headers.get("Retry-After")))
+            self.pause(delay)
+        with self._lock:
+            self.retries += 1
+        return delay
+
+    def summary(self) -> str:
+        delay = f", crawl-delay {self.crawl_delay:g}s" if self.crawl_delay else ""
+        return (
+            f"{self.host}: {self.requests} request(s), {self.retries} retried, "
+            f"{self.waited:.1f}s throttled, limit {self.concurrency.limit:.1f} "
+            f"in flight{delay}"
+        )
+
+
+class HostLimiter:
+    """Per-host schedulers shared by every scraper
+
+    Each host gets the HostLimits configured for it, or default. Unless
+    respect_robots is off, the host's robots.txt is read before its first
+    request and its Crawl-delay or Request-rate for user_agent slows the host
+    down further.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, HostLimits]] = None,
+        default: Optional[HostLimits] = None,
+        respect_robots: bool = True,
+        user_agent: str = "*",
+    ):
+        self.limits = limits or {}
+        self.default = default or HostLimits()
+        self.respect_robots = respect_robots
+        self.user_agent = user_agent
+        self._schedulers: Dict[str, HostScheduler] = {}
+        # Held while a host's scheduler is created, so one host's robots.txt
+        # fetch only holds up requests to that host
+        self._host_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _crawl_delay(self, transport, scheme: str, host: str) -> float:
+        try:
+            response = transport.get(f"{scheme}://{host}/robots.txt")
+        except requests.exceptions.RequestException as e:
+            print(f"Could not read robots.txt of {host}: {e}")
+            return 0.0
+        if response.status_code != 200:
+            return 0.0
+        robots = RobotFileParser()
+        robots.parse(response.text.splitlines())
+        delay = robots.crawl_delay(self.user_agent)
+        if delay:
+            return float(delay)
+        rate = robots.request_rate(self.user_agent)
+        return rate.seconds / rate.requests if rate and rate.requests else 0.0
+
+    def scheduler(self, url: str, transport=None) -> HostScheduler:
+        """Scheduler of url's host, created on first use"""
+        parts = urlsplit(url)
+        host = parts.netloc
+        with self._lock:
+            scheduler = self._schedulers.get(host)
+            if scheduler is not None:
+                return scheduler
+            host_lock = self._host_locks.setdefault(host, threading.Lock())
+        with host_lock:
+            with self._lock:
+                scheduler = self._schedulers.get(host)
+            if scheduler is not None:
+                return scheduler
+            crawl_delay = 0.0
+            if self.respect_robots and transport is not None:
+                crawl_delay = self._crawl_delay(transport, parts.scheme, host)
+            limits = self.limits.get(host, self.default)
+            scheduler = HostScheduler(host, limits, crawl_delay)
+            with self._lock:
+                self._schedulers[host] = scheduler
+            return scheduler
+
+    def get(
+        self,
+        transport,
+        url: str,
+        on_retry: Optional[Callable[[float], None]] = None,
+        **kwargs,
+    ) -> requests.Response:
+        """transport.get(url, **kwargs) within the host's limits, retried on
+        429, 5xx and connection errors
+
+        on_retry is called with the seconds waited before each retry. The last
+        response is returned whatever its status, a connection error on the
+        last attempt is raised. With stream=True the request keeps its slot
+        until the response is closed, which iter_body does once the body is
+        read.
+        """
+        scheduler = self.scheduler(url, transport)
+        limits = scheduler.limits
+        stream = kwargs.get("stream", False)
+        for attempt in range(limits.max_retries + 1):
+            scheduler.acquire()
+            try:
+                response = transport.get(url, **kwargs)
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+            ) as e:
+                scheduler.release(None)
+                if attempt == limits.max_retries:
+                    raise
+                print(f"Request to {url} failed ({e}), retrying")
+                response = None
+            except BaseException:
+                scheduler.release(None)
+                raise
+            else:
+                last = attempt == limits.max_retries
+                if response.status_code not in RETRYABLE_STATUS or last:
+                    if stream:
+                        _release_on_close(scheduler, response)
+                    else:
+                        scheduler.release(response)
+                    return response
+                if stream:
+                    # Hands the unread connection back to the pool
+                    response.close()
+                scheduler.release(response)
+            delay = scheduler.backoff(attempt, response)
+            if on_retry:
+                on_retry(delay)
+            time.sleep(delay)
+
+    def bind(self, transport, on_retry: Optional[Callable[[float], None]] = None):
+        """transport with every get going through the host limits"""
+        return LimitedTransport(self, transport, on_retry)
+
+    def summary(self) -> str:
+        with self._lock:
+            schedulers = list(self._schedulers.values())
+        return "; ".join(s.summary() for s in schedulers) or "no requests"
+
+
+def _release_on_close(scheduler: HostScheduler, response: requests.Response):
+    """Free the scheduler slot of a streamed response when it is first closed"""
+    close = response.close
+    released = threading.Event()
+
+    def close_and_release():
+        try:
+            close()
+        finally:
+            if not released.is_set():
+                released.set()
+                scheduler.release(response)
+
+    response.close = close_and_release
+
+
+class LimitedTransport:
+    """Transport whose gets wait on a HostLimiter, for the HTTP cache"""
+
+    def __init__(self, limiter: HostLimiter, transport, on_retry=None):
+        self.limiter = limiter
+        self.transport = transport
+        self.on_retry = on_retry
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.limiter.get(self.transport, url, self.on_retry, **kwargs)
+
+    def iter_body(self, response: requests.Response) -> Iterator[bytes]:
+        return self.transport.iter_body(response)
+
+
+_default_host_limiter: Optional[HostLimiter] = None
+_default_host_limiter_lock = threading.Lock()
+
+
+def get_default_host_limiter() -> HostLimiter:
+    """Limiter shared by every scraper that is not given its own"""
+    global _default_host_limiter
+    with _default_host_limiter_lock:
+        if _default_host_limiter is None:
+            _default_host_limiter = HostLimiter()
+        return _default_host_limiter
+
+
+def configure_default_host_limiter(**kwargs) -> HostLimiter:
+    """Replace the shared limiter, e.g. to set limits per host"""
+    global _default_host_limiter
+    with _default_host_limiter_lock:
+        _default_host_limiter = HostLimiter(**kwargs)
+        return _default_host_limiter
@@ -0,0 +1,344 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+
+class HttpCache:
+    """Disk-backed HTTP response cache with conditional revalidation
+
+    Bodies are kept as files next to a small SQLite index holding the ETag,
+    Last-Modified and a sha256 of each body. Within a source's TTL the stored
+    body is returned without touching the network; after it a conditional GET
+    is sent and a 304 is answered from disk. The least recently used entries
+    are evicted once the bodies exceed max_bytes.
+
+    Every returned response carries three extra attributes:
+        from_cache: The body was read from disk (fresh hit or 304)
+        body_hash: sha256 of the body
+        unchanged: The body is identical to the one seen on the previous fetch
+
+    Args:
+        directory: Where the index and bodies are stored
+        max_bytes: Total body size kept before LRU eviction kicks in
+        ttl: Seconds a stored page is served without revalidation, per source
+        default_ttl: TTL for sources missing from ttl, 0 always revalidates
+    """
+
+    def __init__(
+        self,
+        directory: str = ".scraper_state/http_cache",
+        max_bytes: int = 200 * 1024 * 1024,
+        ttl: Optional[Dict[str, float]] = None,
+        default_ttl: float = 0,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl or {}
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        os.makedirs(os.path.join(directory, "bodies"), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            os.path.join(directory, "index.sqlite"), check_same_thread=False
+        )
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                source TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                content_type TEXT,
+                body_hash TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_last_access
+                ON responses (last_access);
+            """)
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(derived)")]
+        if columns and "extractor" not in columns:
+            # Results cached before extractors were versioned, none can be trusted
+            self._db.execute("DROP TABLE derived")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS derived (
+                url TEXT PRIMARY KEY,
+                body_hash TEXT NOT NULL,
+                extractor TEXT NOT NULL,
+                data TEXT NOT NULL
+            );
+            """)
+
+    def _body_path(self, url: str) -> str:
+        name = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, "bodies", name)
+
+    def _lookup(self, url: str) -> Optional[tuple]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT etag, last_modified, content_type, body_hash, stored_at "
+                "FROM responses WHERE url = ?",
+                (url,),
+            ).fetchone()
+        if row and not os.path.exists(self._body_path(url)):
+            self._forget(url)
+            return None
+        return row
+
+    def _forget(self, url: str):
+        """Drop the index row of a body that can no longer be read"""
+        with self._lock:
+            self._db.execute("DELETE FROM responses WHERE url = ?", (url,))
+            self._db.execute("DELETE FROM derived WHERE url = ?", (url,))
+            self._db.commit()
+
+    def fetch(
+        self,
+        transport,
+        url: str,
+        headers: Optional[dict] = None,
+        source: str = "",
+        stream: bool = False,
+    ) -> requests.Response:
+        """GET url through transport, answering from disk where possible
+
+        With stream=True a downloaded body is left unread: read it from the
+        response's body_chunks, which stores it in the cache as it goes by.
+        Responses answered from disk get body_chunks too. body_hash and
+        unchanged of a streamed download are set once it has been read.
+        """
+        entry = self._lookup(url)
+        now = time.time()
+        if entry:
+            etag, last_modified, content_type, body_hash, stored_at = entry
+            if now - stored_at < self.ttl.get(source, self.default_ttl):
+                response = self._from_disk(url, content_type, body_hash)
+                if response is not None:
+                    with self._lock:
+                        self.hits += 1
+                    return response
+                entry = None
+
+        request_headers = dict(headers or {})
+        if entry:
+            if etag:
+                request_headers["If-None-Match"] = etag
+            if last_modified:
+                request_headers["If-Modified-Since"] = last_modified
+
+        response = transport.get(url, headers=request_headers, stream=stream)
+        if response.status_code == 304 and entry:
+            if stream:
+                response.close()
+            cached = self._from_disk(url, content_type, body_hash)
+            if cached is not None:
+                with self._lock:
+                    self.revalidated += 1
+                    self._db.execute(
+                        "UPDATE responses SET stored_at = ? WHERE url = ?", (now, url)
+                    )
+                    self._db.commit()
+                return cached
+            # The body went missing after the lookup, so ask for all of it
+            entry = None
+            response = transport.get(url, headers=dict(headers or {}), stream=stream)
+
+        with self._lock:
+            self.misses += 1
+        response.from_cache = False
+        if stream:
+            response.body_hash = None
+            response.unchanged = False
+            response.body_chunks = self._stream_and_store(
+                transport, url, source, response, entry
+            )
+            return response
+        response.body_hash = hashlib.sha256(response.content).hexdigest()
+        response.unchanged = bool(entry) and entry[3] == response.body_hash
+        if response.status_code == 200:
+            self._store(url, source, response)
+        return response
+
+    def _from_disk(
+        self, url: str, content_type: Optional[str], body_hash: str
+    ) -> Optional[requests.Response]:
+        """Response of the stored body, None if it was evicted or unreadable"""
+        try:
+            with open(self._body_path(url), "rb") as f:
+                body = f.read()
+        except OSError as e:
+            print(f"Cached body of {url} could not be read, fetching it again: {e}")
+            self._forget(url)
+            return None
+        with self._lock:
+            self._db.execute(
+                "UPDATE responses SET last_access = ? WHERE url = ?", (time.time(), url)
+            )
+            self._db.commit()
+
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.url = url
+        response.headers = CaseInsensitiveDict()
+        if content_type:
+            response.headers["Content-Type"] = content_type
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = body
+        response.body_chunks = iter((body,))
+        response.from_cache = True
+        response.body_hash = body_hash
+        response.unchanged = True
+        return response
+
+    def _store(self, url: str, source: str, response: requests.Response):
+        path = self._body_path(url)
+        tmp_path = f"{path}.tmp{threading.get_ident()}"
+        with open(tmp_path, "wb") as f:
+            f.write(response.content)
+        os.replace(tmp_path, path)
+        self._index(url, source, response, len(response.content))
+
+    def _stream_and_store(
+        self,
+        transport,
+        url: str,
+        source: str,
+        response: requests.Response,
+        entry: Optional[tuple],
+    ) -> Iterator[bytes]:
+        """Yield a streamed body, stored once it has been read to the end"""
+        if response.status_code != 200:
+            yield from transport.iter_body(response)
+            return
+        path = self._body_path(url)
+        tmp_path = f"{path}.tmp{threading.get_ident()}"
+        digest = hashlib.sha256()
+        size = 0
+        complete = False
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in transport.iter_body(response):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+                    yield chunk
+            complete = True
+        finally:
+            if not complete:
+                # Left part way through, a partial body is never stored
+                try:
+                    os.remove(tmp_path)
+                except FileNotFoundError:
+                    pass
+        os.replace(tmp_path, path)
+        response.body_hash = digest.hexdigest()
+        response.unchanged = bool(entry) and entry[3] == response.body_hash
+        self._index(url, source, response, size)
+
+    def _index(self, url: str, source: str, response: requests.Response, size: int):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    url,
+                    source,
+                    response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"),
+                    response.headers.get("Content-Type"),
+                    response.body_hash,
+                    size,
+                    now,
+                    now,
+                ),
+            )
+            self._db.commit()
+            self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries until bodies fit in max_bytes"""
+        (total,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute(
+            "SELECT url, size FROM responses ORDER BY last_access"
+        ).fetchall()
+        for url, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM responses WHERE url = ?", (url,))
+            self._db.execute("DELETE FROM derived WHERE url = ?", (url,))
+            try:
+                os.remove(self._body_path(url))
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._db.commit()
+
+    def get_derived(
+        self, url: str, body_hash: str, extractor: str = ""
+    ) -> Optional[Any]:
+        """Result previously extracted from this exact body of url by this
+        version of the extractor, if any
+
+        A result from another extractor version is deleted, so a changed
+        extractor never gets its old output back.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT body_hash, extractor, data FROM derived WHERE url = ?",
+                (url,),
+            ).fetchone()
+            if row and row[1] != extractor:
+                self._db.execute("DELETE FROM derived WHERE url = ?", (url,))
+                self._db.commit()
+                return None
+        return json.loads(row[2]) if row and row[0] == body_hash else None
+
+    def put_derived(self, url: str, body_hash: str, data: Any, extractor: str = ""):
+        """Remember the (JSON serializable) result extractor got from a body"""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO derived VALUES (?, ?, ?, ?)",
+                (url, body_hash, extractor, json.dumps(data)),
+            )
+            self._db.commit()
+
+    def summary(self) -> str:
+        return (
+            f"{self.hits} fresh hits, {self.revalidated} revalidated (304), "
+            f"{self.misses} downloaded"
+        )
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_default_cache: Optional[HttpCache] = None
+
+
+def get_default_cache() -> Optional[HttpCache]:
+    """Cache used by scrapers that are not given one, None disables caching"""
+    return _default_cache
+
+
+def configure_default_cache(**kwargs) -> HttpCache:
+    """Enable the shared on-disk cache for every scraper"""
+    global _default_cache
+    if _default_cache is not None:
+        _default_cache.close()
+    _default_cache = HttpCache(**kwargs)
+    return _default_cache
@@ -1,32 +1,61 @@
 from scrapers.iloveqatar import ILoveQatarScraper
 from scrapers.visitqatar import VisitQatarScraper
-from models import Event
-from typing import List
-import csv
-from datetime import datetime
-
-
-def run_scrapers() -> List[Event]:
+from models import Event, EventBatch
+from transport import get_default_transport
+from host_limits import get_default_host_limiter
+from runner import print_timing_summary, run_sources
+from run_metrics import get_default_metrics
+from run_profile import PROFILE_MODES, RunProfiler
+from pipeline import DataFrameSink
+from event_store import CsvSink, EventStore
+from event_index import EventIntervalIndex
+from typing import List, Optional, Union
+import argparse
+import time
+from datetime import date, datetime
+
+RUN_REPORT_PATH = ".scraper_state/run_report.json"
+
+
+def run_scrapers(
+    report_path: Optional[str] = None,
+    textfile_path: Optional[str] = None,
+    profiler: Optional[RunProfiler] = None,
+) -> EventBatch:
+    """Scrape every source into one batch
+
+    The run's stage timings and counters are written to report_path as JSON
+    and to textfile_path for node exporter, when given. With a profiler the
+    sources run one after another, each profiled into its own files.
+    """
     scrapers = [ILoveQatarScraper(), VisitQatarScraper()]
-
-    all_events = []
-    for scraper in scrapers:
-        try:
-            print(f"\n{'=' * 50}")
-            print(f"Running {scraper.source_name} scraper...")
-            events = scraper.scrape_events()
-            all_events.extend(events)
-            print(f"Found {len(events)} events from {scraper.source_name}")
-
-            # Save individual scraper results
-            scraper.save_to_csv(events)
-        except Exception as e:
-            print(f"Error with {scraper.source_name} scraper: {e}")
-
-    return all_events
-
-
-def save_combined_csv(events: List[Event], filename: str = None):
+    start = time.perf_counter()
+
+    # Individual scraper results are saved while each scraper runs, and every
+    # event is also collected column-wise for the combined CSV
+    collected = DataFrameSink()
+    runs = run_sources(
+        scrapers,
+        sinks=lambda scraper: [CsvSink(scraper.source_name)],
+        shared_sinks=[collected],
+        profiler=profiler,
+    )
+    total_seconds = time.perf_counter() - start
+    print_timing_summary(runs, total_seconds)
+
+    metrics = get_default_metrics()
+    print(f"Stages: {metrics.summary()}")
+    if report_path:
+        metrics.write_report(report_path, runs, total_seconds)
+    if textfile_path:
+        metrics.write_prometheus(textfile_path, runs, total_seconds)
+    if profiler:
+        print(f"Profiles: {profiler.summary()}")
+
+    return collected.batch
+
+
+def save_combined_csv(events: Union[EventBatch, List[Event]], filename: str = None):
     if not events:
         print("No events to save")
         return
@@ -35,15 +64,11 @@ def save_combined_csv(events: List[Event], filename: str = None):
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"combined_events_{timestamp}.csv"
 
-    with open(filename, "w", newline="", encoding="utf-8") as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=Event.get_field_names())
-        writer.writeheader()
-        for event in events:
-            writer.writerow(event.to_dict())
+    EventBatch.of(events).to_csv(filename)
     print(f"\nSaved {len(events)} events to {filename}")
 
 
-def display_stats(events: List[Event]):
+def display_stats(events: Union[EventBatch, List[Event]]):
     if not events:
         print("No events to display")
         return
@@ -51,12 +76,13 @@ def display_stats(events: List[Event]):
     print("\nEvent Statistics:")
     print(f"Total events: {len(events)}")
 
+    batch = EventBatch.of(events)
     sources = {}
     categories = {}
-    for event in events:
-        sources[event.source] = sources.get(event.source, 0) + 1
-        if event.category:
-            for cat in event.category.split(", "):
+    for source, category in zip(batch.columns["source"], batch.columns["category"]):
+        sources[source] = sources.get(source, 0) + 1
+        if category:
+            for cat in category.split(", "):
                 categories[cat] = categories.get(cat, 0) + 1
 
     print("\nBy source:")
@@ -68,9 +94,105 @@ def display_stats(events: List[Event]):
         print(f"- {category}: {count}")
 
 
-if __name__ == "__main__":
+def display_whats_on(events: EventBatch):
+    """One line per event: its dates, title, venue and source"""
+    columns = events.columns
+    for start, end, title, location, source in zip(
+        columns["iso_start_date"],
+        columns["iso_end_date"],
+        columns["title"],
+        columns["location"],
+        columns["source"],
+    ):
+        dates = start if not end or end == start else f"{start} to {end}"
+        print(f"{dates:<24} {title} @ {location or '-'} ({source})")
+
+
+def whats_on(args):
+    """Print the stored events running on a day or between two days"""
+    index = EventIntervalIndex.from_store(EventStore(args.db), args.source)
+    if args.on:
+        events = index.on_day(args.on)
+        print(f"{len(events)} events on {args.on}\n")
+    else:
+        first = args.start or date.today()
+        last = args.end or first
+        events = index.overlapping(first, last)
+        print(f"{len(events)} events between {first} and {last}\n")
+    display_whats_on(events)
+    if args.out:
+        save_combined_csv(events, args.out)
+    display_stats(events)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrape Qatar events")
+    commands = parser.add_subparsers(dest="command")
+    scrape = commands.add_parser("scrape", help="scrape every source (the default)")
+    scrape.add_argument(
+        "--report",
+        default=RUN_REPORT_PATH,
+        help="JSON run report with per-stage timings and counters",
+    )
+    scrape.add_argument(
+        "--textfile", help="also write the metrics here for node exporter (*.prom)"
+    )
+    scrape.add_argument(
+        "--profile",
+        nargs="?",
+        const="cprofile",
+        choices=PROFILE_MODES,
+        help="profile each source on its own, with cProfile (the default) or "
+        "by sampling stacks",
+    )
+    scrape.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help="also trace allocations with tracemalloc, slowing the run down",
+    )
+    scrape.add_argument(
+        "--profile-dir",
+        default=".scraper_state/profiles",
+        help="profiles go to a timestamped dir in here",
+    )
+
+    query = commands.add_parser(
+        "whats-on", help="stored events running on a day or between two days"
+    )
+    query.add_argument("--db", default="events.sqlite", help="event store file")
+    query.add_argument("--on", type=date.fromisoformat, help="YYYY-MM-DD")
+    query.add_argument(
+        "--from",
+        dest="start",
+        type=date.fromisoformat,
+        help="YYYY-MM-DD, default today",
+    )
+    query.add_argument(
+        "--to", dest="end", type=date.fromisoformat, help="YYYY-MM-DD, default --from"
+    )
+    query.add_argument("--source", help="only this source")
+    query.add_argument("--out", help="also write the events to this CSV")
+    args = parser.parse_args()
+    if args.command is None:
+        args = parser.parse_args(["scrape"])
+
+    if args.command == "whats-on":
+        whats_on(args)
+        return
+
     print("Starting event scraping...")
-    events = run_scrapers()
+    profiler = None
+    if args.profile or args.profile_memory:
+        profiler = RunProfiler(
+            args.profile_dir, args.profile or "cprofile", args.profile_memory
+        )
+    events = run_scrapers(args.report, args.textfile, profiler)
     save_combined_csv(events)
     display_stats(events)
+    print(f"\nHTTP: {get_default_transport().stats.summary()}")
+    print(f"Hosts: {get_default_host_limiter().summary()}")
     print("\nScraping complete!")
+
+
+if __name__ == "__main__":
+    main()
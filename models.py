@@ -1,9 +1,83 @@
-from dataclasses import dataclass, asdict, field
-from typing import List, Optional, Dict, Any
+from dataclasses import dataclass, field, fields
+from typing import Any, ClassVar, Dict, Iterable, Iterator, List, Optional, Union
 from datetime import datetime
+import csv
+import itertools
+import json
+import operator
+import threading
+import zlib
+import pandas as pd
 
 
-@dataclass
+class RawDataRef:
+    """Handle to raw_data parked in a RawDataStore"""
+
+    __slots__ = ("key",)
+
+    def __init__(self, key: int):
+        self.key = key
+
+
+class RawDataStore:
+    """Side store keeping events' raw_data compressed until it is asked for"""
+
+    def __init__(self):
+        self._blobs: Dict[int, bytes] = {}
+        self._keys = itertools.count()
+        self._lock = threading.Lock()
+
+    def put(self, data: Dict[str, Any]) -> RawDataRef:
+        blob = zlib.compress(json.dumps(data, default=str).encode("utf-8"))
+        with self._lock:
+            key = next(self._keys)
+            self._blobs[key] = blob
+        return RawDataRef(key)
+
+    def get(self, ref: RawDataRef) -> Dict[str, Any]:
+        return json.loads(zlib.decompress(self._blobs[ref.key]))
+
+    def clear(self):
+        with self._lock:
+            self._blobs.clear()
+
+
+raw_data_store = RawDataStore()
+
+# Fields whose values repeat across many events, one string object is shared
+INTERNED_FIELDS = (
+    "source",
+    "start_date",
+    "end_date",
+    "time",
+    "start_time",
+    "end_time",
+    "location",
+    "category",
+    "price",
+    "tickets",
+)
+RAW_DATA_MODES = ("keep", "store", "drop")
+
+# Shared string of each value of those fields. sys.intern drops a string
+# again once its last event is gone, so every batch of events re-added its
+# values and the interpreter's intern table kept filling up and resizing
+# part way through a scrape; values seen once stay here until the table is
+# full and starts over
+_interned: Dict[str, str] = {}
+MAX_INTERNED = 100_000
+
+
+def _intern(value: str) -> str:
+    shared = _interned.get(value)
+    if shared is None:
+        if len(_interned) >= MAX_INTERNED:
+            _interned.clear()
+        shared = _interned.setdefault(value, value)
+    return shared
+
+
+@dataclass(slots=True)
 class Event:
     # Core fields (should be provided by all scrapers)
     title: str
@@ -29,23 +103,149 @@ class Event:
     organizer: Optional[str] = None
     tags: List[str] = field(default_factory=list)
 
-    # Raw data storage for debugging/processing
+    # ISO dates and 24 hour "HH:MM" times read from the text fields above,
+    # filled in by date_normalize.normalize_dates
+    iso_start_date: Optional[str] = None
+    iso_end_date: Optional[str] = None
+    iso_start_time: Optional[str] = None
+    iso_end_time: Optional[str] = None
+
+    # Raw data storage for debugging/processing, see raw_data_mode
     raw_data: Optional[Dict[str, Any]] = None
 
+    # "keep" leaves raw_data on the event, "store" parks it compressed in
+    # raw_data_store (read it back with load_raw_data) and "drop" discards it
+    raw_data_mode: ClassVar[str] = "keep"
+
+    @classmethod
+    def set_raw_data_mode(cls, mode: str):
+        if mode not in RAW_DATA_MODES:
+            raise ValueError(f"raw_data mode must be one of {RAW_DATA_MODES}")
+        cls.raw_data_mode = mode
+
+    def load_raw_data(self) -> Optional[Dict[str, Any]]:
+        """raw_data as a dict, fetched from the side store if it was parked there"""
+        if isinstance(self.raw_data, RawDataRef):
+            return raw_data_store.get(self.raw_data)
+        return self.raw_data
+
     def to_dict(self) -> dict:
         """Convert Event to dictionary for CSV export, excluding raw_data"""
-        data = asdict(self)
+        # Build directly rather than through asdict, which deep copies raw_data
+        data = {f.name: getattr(self, f.name) for f in fields(self)}
         data.pop("raw_data", None)  # Remove raw_data from export
+        data["tags"] = list(self.tags)
         return data
 
     @classmethod
     def get_field_names(cls) -> List[str]:
         """Get all field names for CSV header, excluding raw_data"""
-        fields = list(cls.__annotations__.keys())
-        fields.remove("raw_data")
-        return fields
+        return [f.name for f in fields(cls) if f.name != "raw_data"]
 
     def __post_init__(self):
-        """Set end_date = start_date if not provided"""
+        """Set end_date = start_date if not provided, compact repeated values"""
         if self.end_date is None:
             self.end_date = self.start_date
+
+        for name in INTERNED_FIELDS:
+            value = getattr(self, name)
+            if type(value) is str:
+                setattr(self, name, _intern(value))
+
+        if self.raw_data is not None and not isinstance(self.raw_data, RawDataRef):
+            if Event.raw_data_mode == "drop":
+                self.raw_data = None
+            elif Event.raw_data_mode == "store":
+                self.raw_data = raw_data_store.put(self.raw_data)
+
+
+class EventBatch:
+    """Events stored column-wise as they are collected
+
+    Converts to a DataFrame, CSV rows or Google Sheets rows straight from the
+    columns, without building a dict per event. Column lists are shared rather
+    than copied, so several sinks can read one batch; treat them as read-only.
+    """
+
+    field_names: ClassVar[List[str]] = Event.get_field_names()
+    _getter: ClassVar = operator.attrgetter(*Event.get_field_names())
+
+    def __init__(self, events: Iterable[Event] = ()):
+        self.columns: Dict[str, list] = {name: [] for name in self.field_names}
+        self._frame = None
+        self.extend(events)
+
+    @classmethod
+    def of(cls, events: Union["EventBatch", Iterable[Event]]) -> "EventBatch":
+        """Return events as a batch, without copying if it already is one"""
+        return events if isinstance(events, cls) else cls(events)
+
+    @classmethod
+    def concat(cls, batches: Iterable["EventBatch"]) -> "EventBatch":
+        combined = cls()
+        for batch in batches:
+            for name, column in combined.columns.items():
+                column.extend(batch.columns[name])
+        return combined
+
+    def __len__(self) -> int:
+        return len(self.columns["title"])
+
+    def append(self, event: Event):
+        self.extend((event,))
+
+    def extend(self, events: Iterable[Event]):
+        self.extend_rows(map(self._getter, events))
+
+    def extend_rows(self, rows: Iterable[tuple]):
+        """Add rows given as tuples in field_names order"""
+        rows = list(rows)
+        if not rows:
+            return
+        for column, values in zip(self.columns.values(), zip(*rows)):
+            column.extend(values)
+        self._frame = None
+
+    def rows(self) -> Iterator[tuple]:
+        """Row tuples in field_names order"""
+        return zip(*self.columns.values())
+
+    def take(self, positions: Iterable[int]) -> "EventBatch":
+        """New batch of the events at positions, in that order"""
+        positions = list(positions)
+        taken = EventBatch()
+        for name, column in self.columns.items():
+            taken.columns[name] = [column[i] for i in positions]
+        return taken
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """DataFrame with one column per Event field, built once per batch state"""
+        if self._frame is None:
+            self._frame = pd.DataFrame(self.columns, columns=self.field_names)
+        return self._frame
+
+    def to_csv(self, filename: str):
+        with open(filename, "w", newline="", encoding="utf-8") as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(self.field_names)
+            writer.writerows(self.rows())
+
+    def to_sheet_rows(self, headers: List[str]) -> List[List[str]]:
+        """Rows of cell strings ordered by headers, lists joined with ", " """
+        cells = []
+        for header in headers:
+            column = self.columns.get(header)
+            if column is None:
+                cells.append([""] * len(self))
+            else:
+                cells.append(
+                    [
+                        (
+                            ", ".join(str(v) for v in value)
+                            if isinstance(value, list)
+                            else str(value)
+                        )
+                        for value in column
+                    ]
+                )
+        return [list(row) for row in zip(*cells)]
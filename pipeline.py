@@ -0,0 +1,131 @@
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+import pandas as pd
+from models import Event, EventBatch
+from date_normalize import normalize_dates
+from run_metrics import get_default_metrics
+
+# Marks the end of a stream on the writer queue
+_DONE = object()
+
+
+@dataclass
+class StreamStats:
+    """What stream_events did with one source's events"""
+
+    events: int = 0
+    # Time the sinks spent writing, overlapping the scrape
+    sink_seconds: float = 0.0
+    error: Optional[str] = None
+
+
+class EventSink:
+    """Receives events a chunk at a time while a scraper is still running
+
+    write is called from stream_events' writer thread, and for a sink shared
+    between sources from several writer threads at once, so subclasses hold
+    self.lock while they change their state. close is called once by whoever
+    created the sink, after the last write.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    def write(self, batch: EventBatch):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class DataFrameSink(EventSink):
+    """Keeps every event written, column-wise, for a DataFrame at the end"""
+
+    def __init__(self):
+        super().__init__()
+        self.batch = EventBatch()
+
+    def __len__(self) -> int:
+        return len(self.batch)
+
+    def write(self, batch: EventBatch):
+        with self.lock:
+            self.batch.extend_rows(batch.rows())
+
+    def to_dataframe(self) -> pd.DataFrame:
+        with self.lock:
+            return self.batch.to_dataframe()
+
+
+def stream_events(
+    events: Iterable[Event],
+    sinks: List[EventSink],
+    chunk_size: int = 250,
+    max_pending: int = 4,
+    source: str = "unknown",
+) -> StreamStats:
+    """Hand events to the sinks in chunks as the scraper yields them
+
+    Each chunk has its dates normalized, then the sinks write it, on a
+    separate thread. At most max_pending chunks wait
+    for them, past that the scraper blocks until they catch up, so events do
+    not pile up in memory when a sink is slower than the crawl. A failing
+    scraper or sink stops the stream and is reported in the stats; chunks
+    already handed over are still written. Normalizing and writing are
+    timed as the transform and sink stages of source in the run metrics.
+    """
+    stats = StreamStats()
+    metrics = get_default_metrics()
+    pending = queue.Queue(maxsize=max_pending)
+    sink_errors = []
+
+    def writer():
+        while True:
+            batch = pending.get()
+            if batch is _DONE:
+                return
+            if sink_errors:
+                continue  # keep draining so the scraper is never left blocked
+            start = time.perf_counter()
+            try:
+                with metrics.stage(source, "transform"):
+                    normalize_dates(batch)
+                for sink in sinks:
+                    with metrics.stage(source, "sink"):
+                        sink.write(batch)
+            except Exception as e:
+                sink_errors.append(f"sink failed: {e}")
+                print(f"Error writing events: {e}")
+            stats.sink_seconds += time.perf_counter() - start
+
+    thread = threading.Thread(target=writer, daemon=True)
+    thread.start()
+    events = iter(events)
+    chunk = []
+    try:
+        for event in events:
+            chunk.append(event)
+            stats.events += 1
+            if len(chunk) >= chunk_size:
+                pending.put(EventBatch(chunk))
+                chunk = []
+                if sink_errors:
+                    break
+    except Exception as e:
+        stats.error = f"scrape failed: {e}"
+        print(f"Error scraping events: {e}")
+    finally:
+        if chunk:
+            pending.put(EventBatch(chunk))
+        pending.put(_DONE)
+        thread.join()
+        # Stops a generator left part way through by a failed sink
+        close = getattr(events, "close", None)
+        if close:
+            close()
+    if sink_errors:
+        stats.error = sink_errors[0]
+    return stats
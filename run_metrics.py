@@ -0,0 +1,315 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from transport import get_default_transport
+
+STAGES = ("fetch", "parse", "extract", "transform", "sink")
+
+# Upper bounds in seconds, from one transform_event call to a slow page download
+LATENCY_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+# Help text of the counters exported as Prometheus gauges
+COUNTERS = {
+    "requests": "Pages requested in the last run, cache hits included",
+    "cache_hits": "Pages read from the HTTP cache in the last run",
+    "extract_cache_hits": "Pages whose extraction the HTTP cache held",
+    "response_bytes": "Decoded response body bytes of the last run",
+    "fetch_errors": "Requests that failed in the last run",
+    "retries": "Requests retried in the last run",
+    "events": "Events scraped in the last run",
+}
+
+PROMETHEUS_PREFIX = "qatar_events_scraper"
+
+
+class Histogram:
+    """Latency histogram with fixed buckets, counted per bucket"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        # The last count is for values above every bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> List[int]:
+        """Values at or below each bucket, then the total, as Prometheus has it"""
+        totals, running = [], 0
+        for count in self.counts:
+            running += count
+            totals.append(running)
+        return totals
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "buckets": dict(zip([*map(str, self.buckets), "+Inf"], self.cumulative())),
+        }
+
+
+class RunMetrics:
+    """Counters and per-stage latency histograms of a run, for each source
+
+    Stages are timed with stage(); a stage started inside another one is taken
+    out of the outer stage's time, so parse time is not also counted as
+    extract time and the stage times of a source add up. Safe to use from
+    several threads at once.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counters: Dict[Tuple[str, str], float] = {}
+        self._histograms: Dict[Tuple[str, str], Histogram] = {}
+
+    def count(self, source: str, name: str, value: float = 1):
+        with self._lock:
+            key = (source, name)
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, source: str, stage: str, seconds: float):
+        with self._lock:
+            histogram = self._histograms.get((source, stage))
+            if histogram is None:
+                histogram = self._histograms[(source, stage)] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def _open_stages(self) -> List[float]:
+        """Nested stage time of every stage open on this thread, innermost last"""
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def _timer(self, result: List[float]):
+        stack = self._open_stages()
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            result.append(elapsed - nested)
+
+    @contextmanager
+    def stage(self, source: str, stage: str):
+        """Time the block as one call of stage for source"""
+        result: List[float] = []
+        try:
+            with self._timer(result):
+                yield
+        finally:
+            self.observe(source, stage, result[0])
+
+    def timed_iter(self, source: str, stage: str, items: Iterable) -> Iterator:
+        """Yield items, the time spent producing them observed once as stage"""
+        result: List[float] = []
+        iterator = iter(items)
+        try:
+            while True:
+                with self._timer(result):
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                yield item
+        finally:
+            self.observe(source, stage, sum(result))
+            # Lets a generator left part way through clean up now
+            close = getattr(iterator, "close", None)
+            if close:
+                close()
+
+    def counters(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            by_source: Dict[str, Dict[str, float]] = {}
+            for (source, name), value in sorted(self._counters.items()):
+                by_source.setdefault(source, {})[name] = value
+            return by_source
+
+    def stages(self) -> Dict[str, Dict[str, Dict]]:
+        with self._lock:
+            by_source: Dict[str, Dict[str, Dict]] = {}
+            for (source, stage), histogram in sorted(self._histograms.items()):
+                by_source.setdefault(source, {})[stage] = histogram.to_dict()
+            return by_source
+
+    def report(
+        self, runs: Iterable = (), total_seconds: Optional[float] = None
+    ) -> Dict:
+        """JSON serializable run report, with the runner's SourceRun results"""
+        http = get_default_transport().stats
+        return {
+            "started": self.started,
+            "finished": time.time(),
+            "total_seconds": total_seconds,
+            "runs": [
+                {
+                    "source": run.source,
+                    "events": run.event_count,
+                    "scrape_seconds": round(run.scrape_seconds, 6),
+                    "sink_seconds": round(run.sink_seconds, 6),
+                    "error": run.error,
+                }
+                for run in runs
+            ],
+            "counters": self.counters(),
+            "stages": self.stages(),
+            "http": {
+                "requests": http.requests,
+                "connections": http.connections,
+                "wire_bytes": http.wire_bytes,
+                "content_bytes": http.content_bytes,
+            },
+        }
+
+    def write_report(
+        self, path: str, runs: Iterable = (), total_seconds: Optional[float] = None
+    ):
+        report = self.report(runs, total_seconds)
+        _write_atomic(path, json.dumps(report, indent=2) + "\n")
+
+    def prometheus_text(
+        self, runs: Iterable = (), total_seconds: Optional[float] = None
+    ) -> str:
+        """Metrics of the run in the Prometheus text format
+
+        Everything describes the last run, so counters are exported as gauges.
+        """
+        prefix = PROMETHEUS_PREFIX
+        lines = []
+
+        def family(name: str, kind: str, help_text: str):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+
+        family(
+            "stage_seconds",
+            "histogram",
+            "Time in each stage of the last run, nested stages left out",
+        )
+        for source, stages in self.stages().items():
+            for stage, histogram in stages.items():
+                labels = f'source="{_label(source)}",stage="{_label(stage)}"'
+                for bound, count in histogram["buckets"].items():
+                    lines.append(
+                        f'{prefix}_stage_seconds_bucket{{{labels},le="{bound}"}} {count}'
+                    )
+                lines.append(
+                    f"{prefix}_stage_seconds_sum{{{labels}}} {histogram['sum']}"
+                )
+                lines.append(
+                    f"{prefix}_stage_seconds_count{{{labels}}} {histogram['count']}"
+                )
+
+        counters = self.counters()
+        names = list(COUNTERS) + sorted(
+            {name for values in counters.values() for name in values} - set(COUNTERS)
+        )
+        for name in names:
+            sources = [source for source, values in counters.items() if name in values]
+            if not sources:
+                continue
+            family(name, "gauge", COUNTERS.get(name, f"{name} in the last run"))
+            for source in sources:
+                value = counters[source][name]
+                lines.append(f'{prefix}_{name}{{source="{_label(source)}"}} {value}')
+
+        runs = list(runs)
+        if runs:
+            family("source_up", "gauge", "1 if the source ran without an error")
+            for run in runs:
+                lines.append(
+                    f'{prefix}_source_up{{source="{_label(run.source)}"}} '
+                    f"{0 if run.error else 1}"
+                )
+        if total_seconds is not None:
+            family("run_seconds", "gauge", "Wall-clock time of the last run")
+            lines.append(f"{prefix}_run_seconds {total_seconds:.3f}")
+        family("last_run_timestamp_seconds", "gauge", "When the last run finished")
+        lines.append(f"{prefix}_last_run_timestamp_seconds {time.time():.0f}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(
+        self, path: str, runs: Iterable = (), total_seconds: Optional[float] = None
+    ):
+        """Write a textfile for node exporter's textfile collector (*.prom)"""
+        _write_atomic(path, self.prometheus_text(runs, total_seconds))
+
+    def summary(self) -> str:
+        totals = {stage: 0.0 for stage in STAGES}
+        with self._lock:
+            for (_, stage), histogram in self._histograms.items():
+                totals[stage] = totals.get(stage, 0.0) + histogram.sum
+        return ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in totals.items())
+
+
+def _label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _write_atomic(path: str, text: str):
+    """Write through a temporary file so readers never see half a file"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+
+_default_metrics: Optional[RunMetrics] = None
+_default_metrics_lock = threading.Lock()
+
+
+def get_default_metrics() -> RunMetrics:
+    """Metrics shared by every scraper that is not given its own"""
+    global _default_metrics
+    with _default_metrics_lock:
+        if _default_metrics is None:
+            _default_metrics = RunMetrics()
+        return _default_metrics
+
+
+def configure_default_metrics(**kwargs) -> RunMetrics:
+    """Start a fresh set of shared metrics, e.g. for the next run"""
+    global _default_metrics
+    with _default_metrics_lock:
+        _default_metrics = RunMetrics(**kwargs)
+        return _default_metrics
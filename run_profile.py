@@ -0,0 +1,309 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+PROFILE_MODES = ("cprofile", "sample")
+
+# Since 3.12 cProfile runs on sys.monitoring: only one profile can be enabled
+# in the process and it sees every thread, so one profile covers them all
+PROCESS_WIDE_CPROFILE = sys.version_info >= (3, 12)
+
+# Where a source's time goes, each group matched on (end of file path,
+# function name). A group's functions must not call one another, cProfile
+# times are summed over them
+TIME_GROUPS: Dict[str, Tuple[Tuple[str, str], ...]] = {
+    "network": (
+        ("socket.py", "readinto"),
+        ("socket.py", "create_connection"),
+        ("ssl.py", "do_handshake"),
+    ),
+    "html parsing": (("bs4/__init__.py", "__init__"),),
+    "soup searches": (
+        ("bs4/element.py", "_find_all"),
+        ("bs4/css.py", "select"),
+        ("bs4/css.py", "select_one"),
+    ),
+}
+
+
+def _group_of(filename: str, function: str) -> Optional[str]:
+    filename = filename.replace(os.sep, "/")
+    for group, functions in TIME_GROUPS.items():
+        for suffix, name in functions:
+            if function == name and filename.endswith(suffix):
+                return group
+    return None
+
+
+def _frame_name(code) -> str:
+    """function (dir/file.py:line), the collapsed stack name of a code object"""
+    path = code.co_filename.replace(os.sep, "/").split("/")
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({'/'.join(path[-2:])}:{code.co_firstlineno})"
+
+
+class SourceProfiler:
+    """Profile one source while it runs, in its thread and every thread it starts
+
+    cProfile mode writes <source>.pstats, sample mode samples the stacks every
+    interval seconds and writes <source>.collapsed, one "frame;frame count"
+    line per stack as flamegraph.pl and speedscope read them. Both write
+    <source>.txt with the time per TIME_GROUPS group and the top functions;
+    with memory the allocations still held when the source finishes are
+    traced and written to <source>.alloc.txt by line.
+
+    New threads are picked up through threading.setprofile, each with its own
+    cProfile before 3.12, so only one source can be profiled at a time.
+    """
+
+    def __init__(
+        self,
+        source: str,
+        directory: str,
+        mode: str = "cprofile",
+        memory: bool = False,
+        interval: float = 0.005,
+        top: int = 40,
+    ):
+        if mode not in PROFILE_MODES:
+            raise ValueError(
+                f"Unknown profile mode {mode!r}, use one of {PROFILE_MODES}"
+            )
+        self.source = source
+        self.directory = directory
+        self.mode = mode
+        self.memory = memory
+        self.interval = interval
+        self.top = top
+        self.artifacts: List[str] = []
+        self._lock = threading.Lock()
+        self._threads = set()
+        self._profiles: List[cProfile.Profile] = []
+        self._stacks: Counter = Counter()
+        # Code object of each frame name in the stacks
+        self._codes: Dict[str, object] = {}
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._traced_here = False
+        self._memory_start = None
+
+    def _thread_started(self, frame, event, arg):
+        """Profile hook of threads started while profiling, runs once in each"""
+        with self._lock:
+            self._threads.add(threading.get_ident())
+        if self.mode == "cprofile" and not PROCESS_WIDE_CPROFILE:
+            profile = cProfile.Profile()
+            with self._lock:
+                self._profiles.append(profile)
+            # Replaces this hook for the rest of the thread
+            profile.enable()
+        else:
+            sys.setprofile(None)
+
+    def _sample(self):
+        codes = self._codes
+        names = {}
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                threads = list(self._threads)
+            for ident in threads:
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    name = names.get(code)
+                    if name is None:
+                        name = names[code] = _frame_name(code)
+                        codes[name] = code
+                    stack.append(name)
+                    frame = frame.f_back
+                if stack:
+                    self._stacks[";".join(reversed(stack))] += 1
+
+    def __enter__(self) -> "SourceProfiler":
+        self._threads.add(threading.get_ident())
+        if self.memory:
+            self._traced_here = not tracemalloc.is_tracing()
+            if self._traced_here:
+                tracemalloc.start(25)
+            tracemalloc.reset_peak()
+            self._memory_start = tracemalloc.take_snapshot()
+        if self.mode == "sample":
+            # Started before the hook is set so it does not sample itself
+            self._sampler = threading.Thread(target=self._sample, daemon=True)
+            self._sampler.start()
+        self._started = time.perf_counter()
+        threading.setprofile(self._thread_started)
+        if self.mode == "cprofile":
+            profile = cProfile.Profile()
+            self._profiles.append(profile)
+            profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        threading.setprofile(None)
+        if self.mode == "cprofile":
+            self._profiles[0].disable()
+        else:
+            self._stop.set()
+            self._sampler.join()
+        self.seconds = time.perf_counter() - self._started
+        os.makedirs(self.directory, exist_ok=True)
+        if self.mode == "cprofile":
+            self._write_cprofile()
+        else:
+            self._write_samples()
+        if self.memory:
+            self._write_allocations()
+        return False
+
+    def _path(self, suffix: str) -> str:
+        path = os.path.join(self.directory, f"{self.source}{suffix}")
+        self.artifacts.append(path)
+        return path
+
+    def _header(self) -> str:
+        return f"{self.source}: {self.seconds:.2f}s wall-clock, profiled with {self.mode}\n"
+
+    def _write_cprofile(self):
+        with self._lock:
+            profiles = list(self._profiles)
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            # Threads still running have their calls so far merged in
+            stats.add(profile)
+        stats.dump_stats(self._path(".pstats"))
+
+        group_seconds = Counter()
+        for (filename, _, function), row in stats.stats.items():
+            group = _group_of(filename, function)
+            if group:
+                group_seconds[group] += row[3]
+        report = io.StringIO()
+        report.write(self._header())
+        report.write(
+            f"Time in all {len(self._threads)} thread(s), waiting included:\n"
+            + "".join(
+                f"  {group:<16}{group_seconds[group]:>9.2f}s\n" for group in TIME_GROUPS
+            )
+        )
+        stats.stream = report
+        report.write("\nBy cumulative time:\n")
+        stats.sort_stats("cumulative").print_stats(self.top)
+        report.write("\nBy own time:\n")
+        stats.sort_stats("tottime").print_stats(self.top)
+        with open(self._path(".txt"), "w", encoding="utf-8") as f:
+            f.write(report.getvalue())
+
+    def _write_samples(self):
+        with open(self._path(".collapsed"), "w", encoding="utf-8") as f:
+            for stack, count in self._stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        total = sum(self._stacks.values()) or 1
+        group_samples = Counter()
+        own = Counter()
+        inclusive = Counter()
+        for stack, count in self._stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for name in set(frames):
+                inclusive[name] += count
+            for name in frames:
+                code = self._codes[name]
+                group = _group_of(code.co_filename, code.co_name)
+                if group:
+                    group_samples[group] += count
+                    break
+
+        def table(counts: Counter) -> str:
+            return "".join(
+                f"  {count / total:>6.1%}  {name}\n"
+                for name, count in counts.most_common(self.top)
+            )
+
+        with open(self._path(".txt"), "w", encoding="utf-8") as f:
+            f.write(self._header())
+            f.write(
+                f"{total} samples every {self.interval * 1000:g}ms over "
+                f"{len(self._threads)} thread(s), waiting included:\n"
+            )
+            for group in TIME_GROUPS:
+                f.write(f"  {group:<16}{group_samples[group] / total:>7.1%}\n")
+            f.write(f"\nOn the stack (inclusive):\n{table(inclusive)}")
+            f.write(f"\nRunning (own):\n{table(own)}")
+
+    def _write_allocations(self):
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        if self._traced_here:
+            tracemalloc.stop()
+        snapshot = snapshot.filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+        by_line = snapshot.compare_to(self._memory_start, "lineno")
+        by_traceback = snapshot.compare_to(self._memory_start, "traceback")
+        with open(self._path(".alloc.txt"), "w", encoding="utf-8") as f:
+            f.write(self._header())
+            f.write(f"Peak traced memory {peak / 2**20:.1f} MiB\n")
+            f.write("\nStill allocated when the source finished, by line:\n")
+            for stat in by_line[: self.top]:
+                f.write(f"  {stat}\n")
+            f.write("\nLargest by traceback:\n")
+            for stat in by_traceback[:5]:
+                f.write(
+                    f"  {stat.size_diff / 1024:.1f} KiB in {stat.count_diff} blocks\n"
+                )
+                for line in stat.traceback.format(limit=10):
+                    f.write(f"    {line}\n")
+
+
+class RunProfiler:
+    """Profiles of every source of a run, under directory/<timestamp>
+
+    Args:
+        directory: Each run's profiles go to a new timestamped dir in here
+        mode: "cprofile" for exact call counts and times, "sample" for
+            low overhead stack samples
+        memory: Also trace allocations with tracemalloc
+        interval: Seconds between stack samples in sample mode
+    """
+
+    def __init__(
+        self,
+        directory: str = ".scraper_state/profiles",
+        mode: str = "cprofile",
+        memory: bool = False,
+        interval: float = 0.005,
+    ):
+        if mode not in PROFILE_MODES:
+            raise ValueError(
+                f"Unknown profile mode {mode!r}, use one of {PROFILE_MODES}"
+            )
+        self.directory = os.path.join(
+            directory, datetime.now().strftime("%Y%m%d_%H%M%S")
+        )
+        self.mode = mode
+        self.memory = memory
+        self.interval = interval
+        self.profiles: List[SourceProfiler] = []
+
+    def source(self, source: str) -> SourceProfiler:
+        profiler = SourceProfiler(
+            source, self.directory, self.mode, self.memory, self.interval
+        )
+        self.profiles.append(profiler)
+        return profiler
+
+    def summary(self) -> str:
+        artifacts = [path for p in self.profiles for path in p.artifacts]
+        return f"{len(artifacts)} profile file(s) in {self.directory}"
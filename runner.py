@@ -0,0 +1,163 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+import time
+from models import EventBatch
+from pipeline import EventSink, stream_events
+from date_normalize import normalize_dates
+from run_metrics import get_default_metrics
+from run_profile import RunProfiler
+
+
+@dataclass
+class SourceRun:
+    """Outcome and timings of one scraper within a run"""
+
+    source: str
+    # Events found, column-wise with their ISO dates filled in, as handed to
+    # on_source_done
+    batch: Optional[EventBatch] = None
+    # Events found, also set when they were streamed to sinks instead of kept
+    event_count: int = 0
+    scrape_seconds: float = 0.0
+    sink_seconds: float = 0.0
+    error: Optional[str] = None
+
+
+def _run_source(
+    scraper,
+    on_source_done: Optional[Callable],
+    sinks: Optional[Callable[..., List[EventSink]]],
+    shared_sinks: List[EventSink],
+    profiler: Optional[RunProfiler] = None,
+) -> SourceRun:
+    run = SourceRun(source=scraper.source_name)
+    print(f"\n{'=' * 50}\nRunning {scraper.source_name} scraper...")
+    with profiler.source(run.source) if profiler else nullcontext():
+        if sinks or shared_sinks:
+            run = _stream_source(scraper, run, sinks, shared_sinks)
+        else:
+            run = _collect_source(scraper, run, on_source_done)
+    get_default_metrics().count(run.source, "events", run.event_count)
+    return run
+
+
+def _collect_source(
+    scraper, run: SourceRun, on_source_done: Optional[Callable]
+) -> SourceRun:
+    """Scrape every event into the SourceRun, then hand them to on_source_done"""
+    start = time.perf_counter()
+    try:
+        # Only the column-wise copy is kept, the Event objects are dropped
+        run.batch = normalize_dates(EventBatch(scraper.scrape_events()))
+        run.event_count = len(run.batch)
+        print(f"Found {run.event_count} events from {scraper.source_name}")
+    except Exception as e:
+        run.error = f"scrape failed: {e}"
+        print(f"Error with {scraper.source_name} scraper: {e}")
+    run.scrape_seconds = time.perf_counter() - start
+
+    # Sink this source right away instead of waiting for the slower ones
+    if on_source_done and not run.error:
+        start = time.perf_counter()
+        try:
+            with get_default_metrics().stage(run.source, "sink"):
+                on_source_done(scraper, run.batch)
+        except Exception as e:
+            run.error = f"sink failed: {e}"
+            print(f"Error saving {scraper.source_name} results: {e}")
+        run.sink_seconds = time.perf_counter() - start
+
+    return run
+
+
+def _stream_source(
+    scraper,
+    run: SourceRun,
+    sinks: Optional[Callable[..., List[EventSink]]],
+    shared_sinks: List[EventSink],
+) -> SourceRun:
+    """Feed the scraper's events to its sinks as they come, keeping none"""
+    source_sinks = sinks(scraper) if sinks else []
+    start = time.perf_counter()
+    stats = stream_events(
+        scraper.iter_events(), source_sinks + shared_sinks, source=run.source
+    )
+    run.scrape_seconds = time.perf_counter() - start
+    run.event_count = stats.events
+    run.sink_seconds = stats.sink_seconds
+    run.error = stats.error
+    print(f"Found {stats.events} events from {scraper.source_name}")
+
+    # Events written before a failed scrape are still saved
+    if not (run.error or "").startswith("sink failed"):
+        start = time.perf_counter()
+        try:
+            for sink in source_sinks:
+                with get_default_metrics().stage(run.source, "sink"):
+                    sink.close()
+        except Exception as e:
+            run.error = f"sink failed: {e}"
+            print(f"Error saving {scraper.source_name} results: {e}")
+        run.sink_seconds += time.perf_counter() - start
+
+    return run
+
+
+def run_sources(
+    scrapers: list,
+    on_source_done: Optional[Callable] = None,
+    max_workers: Optional[int] = None,
+    sinks: Optional[Callable[..., List[EventSink]]] = None,
+    shared_sinks: Optional[List[EventSink]] = None,
+    profiler: Optional[RunProfiler] = None,
+) -> List[SourceRun]:
+    """Run every scraper at the same time, isolating their failures
+
+    Args:
+        scrapers: Scraper instances to run
+        on_source_done: Called as on_source_done(scraper, batch) in the
+            scraper's worker as soon as that scraper finishes
+        max_workers: Sources run at once, defaults to all of them
+        sinks: Called as sinks(scraper) for the sinks that source's events
+            are streamed to while it runs, closed when it finishes. Given
+            this or shared_sinks, events are not kept in the SourceRun and
+            on_source_done is not called
+        shared_sinks: Sinks every source streams to, closed by the caller
+        profiler: Profile each source into its own files; sources then run
+            one at a time so the profiles do not mix
+
+    Returns:
+        List[SourceRun]: One entry per scraper, in the order given
+    """
+    if not scrapers:
+        return []
+    if profiler:
+        max_workers = 1
+    with ThreadPoolExecutor(max_workers=max_workers or len(scrapers)) as executor:
+        futures = [
+            executor.submit(
+                _run_source,
+                scraper,
+                on_source_done,
+                sinks,
+                shared_sinks or [],
+                profiler,
+            )
+            for scraper in scrapers
+        ]
+        return [future.result() for future in futures]
+
+
+def print_timing_summary(runs: List[SourceRun], total_seconds: float):
+    print(f"\n{'=' * 50}")
+    print("Timing summary:")
+    print(f"{'source':<15}{'events':>8}{'scrape s':>10}{'sink s':>9}  status")
+    for run in runs:
+        status = run.error or "ok"
+        print(
+            f"{run.source:<15}{run.event_count:>8}{run.scrape_seconds:>10.2f}"
+            f"{run.sink_seconds:>9.2f}  {status}"
+        )
+    print(f"Total wall-clock: {total_seconds:.2f}s")
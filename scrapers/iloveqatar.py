@@ -1,46 +1,107 @@
-from typing import List, Dict, Optional
+from typing import Dict, Iterator, List, Optional
+from concurrent.futures import ThreadPoolExecutor
 from models import Event
-from base_scraper import BaseScraper
+from base_scraper import BaseScraper, ParseRegions
+from date_normalize import parse_date_range, parse_time_range
 import re
 
 
 class ILoveQatarScraper(BaseScraper):
-    def __init__(self, pages: int = 1):
-        super().__init__("ILoveQatar")
+    # 2: detail pages keep the original date string for the ISO fields
+    extractor_version = 2
+    # Only these parts of the pages are built into a tree when partial_parse is on
+    listing_regions = ParseRegions(("a", "article-block__title"))
+    detail_regions = ParseRegions(("h1", None), ("div", "events-page-info"))
+
+    def __init__(self, pages: int = 1, max_workers: int = 8, **kwargs):
+        """kwargs are passed on to BaseScraper (transport, cache, parser, ...)"""
+        super().__init__("ILoveQatar", **kwargs)
         self.base_url = "https://www.iloveqatar.net/events/p{page_num}"
         self.pages = pages
+        # Number of detail/listing pages fetched at once, 1 fetches serially
+        self.max_workers = max_workers
+
+    def iter_events(self) -> Iterator[Event]:
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            listing_future = executor.submit(self.fetch_event_links, 1)
+            for page in range(1, self.pages + 1):
+                print(f"Scraping page {page}...")
+                try:
+                    event_links = listing_future.result()
+                except Exception as e:
+                    print(f"Error scraping page {page}: {e}")
+                    event_links = []
+
+                # Older pages can only hold known events once this one does
+                last_page = page == self.pages
+                if self.seen_index and self.seen_index.all_known(event_links):
+                    print(f"Page {page} only lists known events, stopping here.")
+                    last_page = True
+
+                # Queue the next listing before this page's detail pages so it
+                # is fetched while they are still in flight
+                if not last_page:
+                    listing_future = executor.submit(self.fetch_event_links, page + 1)
 
-    def scrape_events(self) -> List[Event]:
-        all_events = []
-        for page in range(1, self.pages + 1):
-            print(f"Scraping page {page}...")
-            url = self.base_url.format(page_num=page)
-            try:
-                response = self.make_request(url)
-                soup = self.parse_html(response.content)
-                event_links = [
-                    a["href"]
-                    for a in soup.find_all("a", class_="article-block__title")
-                    if a.has_attr("href")
-                ]
+                # Recently fetched events are not fetched again but are still
+                # yielded, from what was extracted last time, so a sink that
+                # failed on them gets them again
+                fresh = self.seen_index.fresh(event_links) if self.seen_index else {}
+                if fresh:
+                    print(f"Not refetching {len(fresh)} recently fetched events.")
 
+                detail_futures = []
                 for link in event_links:
+                    future = None
+                    if link not in fresh:
+                        future = executor.submit(self.scrape_event_page, link)
+                    detail_futures.append((link, future))
+
+                # Collect in listing order regardless of completion order
+                for link, future in detail_futures:
                     try:
-                        event_data = self.scrape_event_page(link)
-                        if event_data:
+                        event_data = fresh[link] if future is None else future.result()
+                        if not event_data:
+                            continue
+                        with self.timed("transform"):
                             event = self.transform_event(event_data)
-                            all_events.append(event)
+                        if self.seen_index and future is not None:
+                            # raw_data is only for debugging a fresh scrape
+                            kept = {
+                                k: v for k, v in event_data.items() if k != "raw_data"
+                            }
+                            self.seen_index.record(link, kept, self.source_name)
                     except Exception as e:
                         print(f"Error scraping event {link}: {e}")
-            except Exception as e:
-                print(f"Error scraping page {page}: {e}")
+                        continue
+                    yield event
+
+                if last_page:
+                    break
+
+    def fetch_event_links(self, page: int) -> List[str]:
+        """Fetch a listing page and return its event detail links in order"""
+        url = self.base_url.format(page_num=page)
+        return self.fetch_and_extract(url, self.extract_event_links)
 
-        return all_events
+    def extract_event_links(self, url: str, response) -> List[str]:
+        soup = self.parse_html(response.content, self.listing_regions)
+        return [
+            a["href"]
+            for a in soup.find_all("a", class_="article-block__title")
+            if a.has_attr("href")
+        ]
 
     def scrape_event_page(self, url: str) -> Optional[Dict]:
         try:
-            response = self.make_request(url)
-            soup = self.parse_html(response.content)
+            return self.fetch_and_extract(url, self.extract_event_page)
+        except Exception as e:
+            print(f"Error scraping event page {url}: {e}")
+            return None
+
+    def extract_event_page(self, url: str, response) -> Optional[Dict]:
+        try:
+            soup = self.parse_html(response.content, self.detail_regions)
 
             category = "general"
             url_parts = url.split("/")
@@ -106,6 +167,7 @@ class ILoveQatarScraper(BaseScraper):
 
             return {
                 "title": title,
+                "date": date,  # Original date string
                 "start_date": start_date,
                 "end_date": end_date,
                 "start_time": start_time,
@@ -183,7 +245,14 @@ class ILoveQatarScraper(BaseScraper):
         return start_date, end_date, start_time, end_time
 
     def transform_event(self, raw_event: Dict) -> Event:
-        """Transform raw event data into standardized Event object"""
+        """Transform raw event data into standardized Event object
+
+        The text fields keep the split above, which dedupe keys are built on;
+        the ISO fields are read from the whole date and time strings so
+        ranges such as "25 - 26 December 2023" get both ends.
+        """
+        iso_start_date, iso_end_date = parse_date_range(raw_event.get("date"))
+        iso_start_time, iso_end_time = parse_time_range(raw_event["time"])
         return Event(
             title=raw_event["title"],
             start_date=raw_event["start_date"],
@@ -199,4 +268,8 @@ class ILoveQatarScraper(BaseScraper):
             link=raw_event["link"],
             source=self.source_name,
             raw_data=raw_event.get("raw_data"),
+            iso_start_date=iso_start_date,
+            iso_end_date=iso_end_date,
+            iso_start_time=iso_start_time,
+            iso_end_time=iso_end_time,
         )
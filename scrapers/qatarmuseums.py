@@ -1,17 +1,22 @@
-from typing import List, Dict, Optional
+from typing import Dict, Iterator, Optional
 from models import Event
-from base_scraper import BaseScraper
+from base_scraper import BaseScraper, ParseRegions
 import re
 
 
 class QatarMuseumsScraper(BaseScraper):
-    def __init__(self, pages: int = 1):
-        super().__init__("QatarMuseums")
+    # Only the pagination and event cards are built when partial_parse is on
+    listing_regions = ParseRegions(
+        (None, "number-button__span"), ("a", "card--landscape")
+    )
+
+    def __init__(self, pages: int = 1, **kwargs):
+        """kwargs are passed on to BaseScraper (transport, cache, parser, ...)"""
+        super().__init__("QatarMuseums", **kwargs)
         self.base_url = "https://qm.org.qa/en/calendar/?page={page_num}"
         self.pages = pages
 
-    def scrape_events(self) -> List[Event]:
-        all_events = []
+    def iter_events(self) -> Iterator[Event]:
         upperbound = 1
         for page in range(1, self.pages + 1):
             print(f"Scraping page {page}...")
@@ -20,30 +25,38 @@ class QatarMuseumsScraper(BaseScraper):
             if page > upperbound:
                 break
             try:
-                response = self.make_request(url)
-                soup = self.parse_html(response.content)
-                pages = [
-                    int(a.get_text())
-                    for a in soup.select(".number-button__span")
-                    if a.get_text().isdigit()
-                ]
-                upperbound = max(pages) if pages else 1
-
-                # Find all event cards
-                event_cards = soup.find_all("a", class_="card--landscape")
-
-                for card in event_cards:
-                    try:
-                        event_data = self.extract_event_from_card(card)
-                        if event_data:
-                            event = self.transform_event(event_data)
-                            all_events.append(event)
-                    except Exception as e:
-                        print(f"Error processing event card: {e}")
+                listing = self.fetch_and_extract(url, self.extract_listing)
+                upperbound = listing["upperbound"]
             except Exception as e:
                 print(f"Error scraping page {page}: {e}")
+                continue
+
+            for event_data in listing["events"]:
+                try:
+                    with self.timed("transform"):
+                        event = self.transform_event(event_data)
+                except Exception as e:
+                    print(f"Error processing event card: {e}")
+                    continue
+                yield event
+
+    def extract_listing(self, url: str, response) -> Dict:
+        """Extract the last page number and every event card of a listing page"""
+        soup = self.parse_html(response.content, self.listing_regions)
+        pages = [
+            int(a.get_text())
+            for a in soup.select(".number-button__span")
+            if a.get_text().isdigit()
+        ]
+
+        # Find all event cards
+        events = []
+        for card in soup.find_all("a", class_="card--landscape"):
+            event_data = self.extract_event_from_card(card)
+            if event_data:
+                events.append(event_data)
 
-        return all_events
+        return {"upperbound": max(pages) if pages else 1, "events": events}
 
     def extract_event_from_card(self, card) -> Optional[Dict]:
         try:
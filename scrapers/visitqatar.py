@@ -1,43 +1,218 @@
+import codecs
+import html
 import json
-from typing import List, Dict, Optional
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 from models import Event
 from base_scraper import BaseScraper
 
+# Entities still present in the JSON once the attribute itself is unescaped,
+# and raw newlines which are not valid inside JSON strings. "&amp;" followed by
+# one of the later entities collapses fully, as applying the replacements one
+# after the other in this order used to do.
+PAYLOAD_REPLACEMENTS = {
+    "&#34;": '"',
+    "&amp;": "&",
+    "&nbsp;": " ",
+    "&lt;": "<",
+    "&gt;": ">",
+    "&#39;": "'",
+    "\n": "",
+}
+PAYLOAD_ENTITY_RE = re.compile(
+    r"&amp;(nbsp|lt|gt|#39);|&#34;|&amp;|&nbsp;|&lt;|&gt;|&#39;|\n"
+)
+
+
+def _replace_payload_entity(match: re.Match) -> str:
+    if match.group(1):
+        return PAYLOAD_REPLACEMENTS[f"&{match.group(1)};"]
+    return PAYLOAD_REPLACEMENTS[match.group(0)]
+
+
+def unescape_payload(text: str) -> str:
+    """Apply PAYLOAD_REPLACEMENTS in a single pass over text"""
+    return PAYLOAD_ENTITY_RE.sub(_replace_payload_entity, text)
+
+
+def _split_entity_tail(text: str, max_entity_len: int) -> Tuple[str, str]:
+    """Hold back a trailing '&...' that may be an entity cut off by a chunk edge"""
+    cut = text.rfind("&", max(len(text) - max_entity_len, 0))
+    if cut == -1:
+        return text, ""
+    return text[:cut], text[cut:]
+
+
+def _find_with_carry(buffer: bytes, marker: bytes) -> Tuple[int, bytes]:
+    """Index of marker in buffer, or -1 and the tail that may start a match"""
+    index = buffer.find(marker)
+    if index == -1:
+        return -1, buffer[-(len(marker) - 1) :]
+    return index, b""
+
+
+def iter_attribute_bytes(
+    chunks: Iterable[bytes], tag: bytes, attribute: bytes
+) -> Iterator[bytes]:
+    """Yield the raw bytes of one attribute of the first tag, straight from chunks"""
+    buffer = b""
+    state = "tag"
+    quote = b""
+    for chunk in chunks:
+        buffer += chunk
+        while buffer:
+            if state == "tag":
+                index, buffer_tail = _find_with_carry(buffer, tag)
+                if index == -1:
+                    buffer = buffer_tail
+                    break
+                buffer = buffer[index + len(tag) :]
+                state = "attribute"
+            elif state == "attribute":
+                index, buffer_tail = _find_with_carry(buffer, attribute)
+                if index == -1 or len(buffer) <= index + len(attribute):
+                    buffer = buffer_tail if index == -1 else buffer[index:]
+                    break
+                quote = buffer[index + len(attribute) : index + len(attribute) + 1]
+                buffer = buffer[index + len(attribute) + 1 :]
+                state = "value"
+            else:
+                index = buffer.find(quote)
+                if index == -1:
+                    yield buffer
+                    buffer = b""
+                    break
+                if index:
+                    yield buffer[:index]
+                return
+
+
+class JsonArrayStream:
+    """Incrementally decode the elements of a JSON array fed in as text pieces"""
 
-class VisitQatarScraper(BaseScraper):
     def __init__(self):
-        super().__init__("VisitQatar")
-        self.base_url = "https://visitqatar.com/intl-en/events-calendar/all-events"
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.started = False
+        self.finished = False
+        # Buffer length to reach before retrying an element that was cut off,
+        # doubling keeps re-parsing of large elements linear overall
+        self.retry_length = 0
 
-    def scrape_events(self) -> List[Event]:
-        try:
-            response = self.make_request(self.base_url)
-            soup = self.parse_html(response.text)
+    def feed(self, text: str, final: bool = False) -> Iterator[Any]:
+        if self.finished:
+            return
+        self.buffer += text
+        position = 0
+        buffer = self.buffer
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if not self.started:
+                while position < len(buffer) and buffer[position] in " \t\r\n'":
+                    position += 1
+                if position == len(buffer):
+                    break
+                if buffer[position] != "[":
+                    raise ValueError("Events payload is not a JSON array")
+                self.started = True
+                position += 1
+                continue
+            if position == len(buffer):
+                break
+            if buffer[position] == "]":
+                self.finished = True
+                break
+            if not final and len(buffer) - position < self.retry_length:
+                break
+            try:
+                element, end = self.decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if final:
+                    raise
+                self.retry_length = 2 * (len(buffer) - position)
+                break
+            self.retry_length = 0
+            position = end
+            yield element
+        self.buffer = buffer[position:]
+        if final and not self.finished:
+            raise ValueError("Events payload ended before the JSON array was closed")
 
-            # Extract the raw events data from the vq-event-listing tag
-            event_listing_tag = soup.find("vq-event-listing")
-            if not event_listing_tag:
-                print("Could not find the 'vq-event-listing' tag on the page.")
-                return []
 
-            raw_events_data = event_listing_tag.get(":events")
-            raw_events_data = str(raw_events_data)[1:-1]
-            if not raw_events_data:
-                print(
-                    "The ':events' attribute was not found on the vq-event-listing tag."
-                )
-                return []
+def iter_listing_events(
+    chunks: Iterable[bytes], encoding: Optional[str] = None
+) -> Iterator[Dict]:
+    """Yield the raw event dicts of the vq-event-listing ':events' attribute
+
+    Works on the response bytes directly: the attribute is located without
+    building a DOM, entities are decoded as the bytes arrive and each event is
+    yielded as soon as it is decoded, so memory does not grow with the page.
+    """
+    decoder = codecs.getincrementaldecoder(encoding or "utf-8")(errors="replace")
+    array = JsonArrayStream()
+    attribute_tail = ""
+    payload_tail = ""
+    found = False
+    for raw in iter_attribute_bytes(chunks, b"<vq-event-listing", b":events="):
+        found = True
+        # Undo the attribute escaping the way an HTML parser would, then the
+        # entities that were escaped inside the JSON strings themselves
+        text, attribute_tail = _split_entity_tail(
+            attribute_tail + decoder.decode(raw), 40
+        )
+        text, payload_tail = _split_entity_tail(payload_tail + html.unescape(text), 10)
+        yield from array.feed(unescape_payload(text))
 
-            # Clean and parse the raw data
-            cleaned_data = self.clean_raw_data(raw_events_data)
-            event_list = json.loads(f"[{cleaned_data}]")
+    if not found:
+        print("Could not find the ':events' attribute of the vq-event-listing tag.")
+        return
+    text = payload_tail + html.unescape(attribute_tail + decoder.decode(b"", True))
+    yield from array.feed(unescape_payload(text), final=True)
 
-            return [self.transform_event(event) for event in event_list if event]
 
+class VisitQatarScraper(BaseScraper):
+    def __init__(self, **kwargs):
+        """kwargs are passed on to BaseScraper (transport, cache, parser, ...)"""
+        super().__init__("VisitQatar", **kwargs)
+        self.base_url = "https://visitqatar.com/intl-en/events-calendar/all-events"
+
+    def scrape_events(self) -> List[Event]:
+        try:
+            return list(self.iter_events())
         except Exception as e:
             print(f"Error scraping visitqatar events: {e}")
             return []
 
+    def iter_events(self) -> Iterator[Event]:
+        """Yield events while the calendar page is still being downloaded"""
+        response = self.make_request(self.base_url, stream=True)
+        body = self.iter_body(response)
+        # Decoding happens as the events are pulled, download time excluded
+        event_list = self.metrics.timed_iter(
+            self.source_name,
+            "extract",
+            iter_listing_events(body, response.encoding),
+        )
+
+        try:
+            for event in event_list:
+                if event:
+                    with self.timed("transform"):
+                        event = self.transform_event(event)
+                    yield event
+            if self.cache:
+                # The cache stores the page as it streams by, but only a whole one
+                for _ in body:
+                    pass
+        finally:
+            # Frees the connection and the host slot even if we stopped early
+            body.close()
+
+    def extract_event_list(self, url: str, response) -> List[Dict]:
+        """Pull the raw event dicts out of the events-calendar page"""
+        return list(iter_listing_events([response.content], response.encoding))
+
     def clean_raw_data(self, raw_data: str) -> str:
         """Clean the raw events data string"""
         # Remove surrounding quotes if present
@@ -45,20 +220,7 @@ class VisitQatarScraper(BaseScraper):
             raw_data = raw_data[1:-1]
 
         # Replace HTML entities
-        replacements = {
-            "&#34;": '"',
-            "&amp;": "&",
-            "&nbsp;": " ",
-            "&lt;": "<",
-            "&gt;": ">",
-            "&#39;": "'",
-            "\n": "",
-        }
-
-        for old, new in replacements.items():
-            raw_data = raw_data.replace(old, new)
-
-        return raw_data
+        return unescape_payload(raw_data)
 
     def transform_event(self, raw_event: Dict) -> Event:
         """Transform raw event data into standardized Event object"""
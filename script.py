@@ -3,12 +3,72 @@ from scrapers.iloveqatar import ILoveQatarScraper
 from scrapers.visitqatar import VisitQatarScraper
 from scrapers.qatarmuseums import QatarMuseumsScraper
 from models import Event
+from transport import configure_default_transport
+from http_cache import configure_default_cache
+from url_index import configure_default_seen_index
+from runner import SourceRun, print_timing_summary, run_sources
+from sheet_sync import SheetSink
+from event_store import CsvSink
+from sheet_mirror import configure_default_sheet_mirror
+from sheets_scheduler import configure_default_sheets_scheduler
+from run_metrics import configure_default_metrics
+from run_profile import RunProfiler
+from host_limits import HostLimits, configure_default_host_limiter
 from typing import List
-import pandas as pd
+import time
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 
 ####### Configuration #######
+# HTTP connection pooling shared by all scrapers, timeout is (connect, read) seconds
+transport = configure_default_transport(pool_maxsize=10, timeout=(5, 30))
+
+# On-disk HTTP cache, pages are revalidated with conditional GETs unless they are
+# younger than their source's TTL in seconds, e.g. {"QatarMuseums": 3 * 3600}
+http_cache = configure_default_cache(directory=".scraper_state/http_cache", ttl={})
+
+# Requests to each host, shared by every scraper hitting it: a token bucket
+# caps the rate, the number in flight is halved on 429/503 or responses slower
+# than latency_target and grows back while the host keeps up, and Retry-After
+# pauses the host. A Crawl-delay in the host's robots.txt slows it further
+host_limiter = configure_default_host_limiter(
+    limits={
+        "www.iloveqatar.net": HostLimits(requests_per_minute=120, max_concurrency=8),
+        "qm.org.qa": HostLimits(requests_per_minute=60, max_concurrency=4),
+        "visitqatar.com": HostLimits(requests_per_minute=60, max_concurrency=4),
+    },
+    default=HostLimits(requests_per_minute=60),
+)
+
+# Detail pages fetched within this many seconds are skipped, and listing pages
+# stop being walked once one only links to events seen before
+configure_default_seen_index(path=".scraper_state/seen_urls.sqlite", freshness=6 * 3600)
+
+# Keys already in each worksheet are kept locally and only re-read in full when
+# the sheet's row count or first rows changed since the last run
+sheet_mirror = configure_default_sheet_mirror(path=".scraper_state/sheet_mirror.sqlite")
+
+# Sheet reads and writes share the API's per-minute quotas, writes are sent in
+# batches at the end of the run and retried on quota errors. Writes that still
+# fail are saved under .scraper_state and sent first thing on the next run
+sheets = configure_default_sheets_scheduler(reads_per_minute=60, writes_per_minute=60)
+
+# Fetch, parse, extract, transform and sink timings and counters of each source
+# are written as a JSON report, and as a textfile for node exporter's textfile
+# collector (point --collector.textfile.directory at its directory); None skips
+metrics = configure_default_metrics()
+run_report = ".scraper_state/run_report.json"
+metrics_textfile = ".scraper_state/metrics/qatar_events.prom"
+
+# "cprofile" or "sample" profiles each source into its own files under
+# .scraper_state/profiles, the sources then run one at a time. profile_memory
+# also traces allocations, which slows the run down several times
+profile_mode = None
+profile_memory = False
+
+# raw_data is only needed when debugging scrapers, drop it in the hourly job
+Event.set_raw_data_mode("drop")
+
 # Choose which scrapers to run
 # You can remove a scraper by prefixing it with #, eg #ILoveQatarScraper(),
 scrapers = [
@@ -34,250 +94,86 @@ spreadsheet = client.open("Event Scrapes")
 worksheet_names = ["ILoveQatar", "VisitQatar", "QatarMuseums"]
 worksheets = {}
 
-for name in worksheet_names:
+for name in worksheet_names + ["Combined"]:
     try:
-        worksheets[name] = spreadsheet.worksheet(name)
+        worksheets[name] = sheets.read(spreadsheet.worksheet, name)
     except gspread.exceptions.WorksheetNotFound:
-        worksheets[name] = spreadsheet.add_worksheet(title=name, rows="1000", cols="20")
-
-try:
-    worksheets["Combined"] = spreadsheet.worksheet("Combined")
-except gspread.exceptions.WorksheetNotFound:
-    worksheets["Combined"] = spreadsheet.add_worksheet(
-        title="Combined", rows="1000", cols="20"
-    )
-
-
-####### Function Definitions #######
-def run_scrapers(scrapers: list) -> List[Event]:
-    all_events = []
-    for scraper in scrapers:
-        try:
-            print(f"\n{'=' * 50}")
-            print(f"Running {scraper.source_name} scraper...")
-            events = scraper.scrape_events()
-            if save_to_google_sheets:
-                events_df = pd.DataFrame([event.to_dict() for event in events])
-                worksheet = worksheets[scraper.source_name]
-                append_new_events_to_sheet(events_df, worksheet)
-            all_events.extend(events)
-            print(f"Found {len(events)} events from {scraper.source_name}")
-
-            # Save individual scraper results
-            if save_individual_results:
-                scraper.save_to_csv(events)
-        except Exception as e:
-            print(f"Error with {scraper.source_name} scraper: {e}")
-
-    # Update combined worksheet after all scrapers run
-    if save_to_google_sheets and all_events:
-        combined_df = pd.DataFrame([event.to_dict() for event in all_events])
-        append_new_events_to_sheet(combined_df, worksheets["Combined"])
-
-    return all_events
-
-
-def append_new_events_to_sheet(events_df: pd.DataFrame, worksheet: gspread.Worksheet):
-    if events_df.empty:
-        print(f"No new events DataFrame to process for worksheet '{worksheet.title}'.")
-        return
-
-    def prepare_key_component(value: any) -> str:
-        s = str(value).strip().lower()
-
-        # Characters to remove for key generation
-        # Focus on apostrophes and similar quote-like characters as per user feedback
-        chars_to_remove = ["'", "’", "‘", "`", '"']
-        for char in chars_to_remove:
-            s = s.replace(char, "")
-        return s
-
-    # 1. Sanitize incoming DataFrame (for list conversion, etc.)
-    sanitized_df = events_df.copy()
-
-    def sanitize_df_values(value):  # Converts lists in cells to strings
-        if isinstance(value, list):
-            return ", ".join(str(v) for v in value)
-        return value
-
-    for col in sanitized_df.columns:
-        sanitized_df[col] = sanitized_df[col].apply(sanitize_df_values)
-
-    required_key_cols = ["title", "start_date", "location", "source"]
-    missing_key_cols = [
-        col for col in required_key_cols if col not in sanitized_df.columns
-    ]
-    if missing_key_cols:
-        print(
-            f"Warning: Incoming DataFrame for '{worksheet.title}' is missing key columns: {missing_key_cols}. Adding as empty strings for key generation."
-        )
-        for col in missing_key_cols:
-            sanitized_df[col] = ""
-
-    # Create unique keys for new events using prepared (stripped) components
-    sanitized_df["unique_key"] = (
-        sanitized_df["title"].apply(prepare_key_component)
-        + sanitized_df["start_date"].apply(prepare_key_component)
-        + sanitized_df["location"].apply(prepare_key_component)
-        + sanitized_df["source"].apply(prepare_key_component)
-    )
-
-    # 2. Get existing data from the sheet
-    try:
-        all_sheet_cells = worksheet.get_all_values()
-    except gspread.exceptions.APIError as e:
-        print(
-            f"Error fetching data from worksheet '{worksheet.title}': {e}. Quota likely exceeded or API issue."
+        worksheets[name] = sheets.write(
+            spreadsheet.add_worksheet, title=name, rows="1000", cols="20"
         )
-        return
 
-    sheet_header_row_from_a1 = []
-    sheet_data_rows_from_col_a = []
+sheets.replay_dead_letters(spreadsheet)
 
-    if all_sheet_cells and all_sheet_cells != [[]]:
-        sheet_header_row_from_a1 = all_sheet_cells[0]
-        if len(all_sheet_cells) > 1:
-            sheet_data_rows_from_col_a = all_sheet_cells[1:]
 
-    data_headers_b_onwards = (
-        sheet_header_row_from_a1[1:] if len(sheet_header_row_from_a1) > 0 else []
-    )
-    new_events_to_add_df = pd.DataFrame()
-
-    # 3. Handle sheet initialization or prepare existing data for comparison
-    if not data_headers_b_onwards:  # If B1 onwards is unheadered
-        print(
-            f"Sheet '{worksheet.title}' has no data headers from B1 onwards. Initializing headers."
-        )
-        headers_for_b1_onwards = [
-            col for col in sanitized_df.columns if col != "unique_key"
-        ]
-        if not headers_for_b1_onwards:
-            print(
-                f"Cannot initialize headers for '{worksheet.title}': no data columns in DataFrame (excluding unique_key)."
-            )
-            return
-
-        worksheet.update([headers_for_b1_onwards], range_name="B1")
-        if not sheet_header_row_from_a1:  # If A1 was also empty
-            worksheet.update_cell(1, 1, "")
-        worksheet.freeze(rows=1)
-        print(
-            f"Initialized data headers for '{worksheet.title}' from B1 and froze the first row. Column A1 is blank or preserved."
-        )
-
-        data_headers_b_onwards = headers_for_b1_onwards
-        new_events_to_add_df = sanitized_df.copy()  # All incoming events are new
-        existing_sheet_df = pd.DataFrame(
-            columns=data_headers_b_onwards
-        )  # For consistent flow
-
-    else:  # Sheet has existing data headers from B1 onwards
-        data_for_df_b_onwards = []
-        for r_idx, row_data_from_a in enumerate(sheet_data_rows_from_col_a):
-            actual_row_data_b_onwards = (
-                row_data_from_a[1:] if len(row_data_from_a) > 0 else []
-            )
-            len_diff = len(data_headers_b_onwards) - len(actual_row_data_b_onwards)
-            if len_diff > 0:
-                actual_row_data_b_onwards.extend([""] * len_diff)
-            elif len_diff < 0:
-                actual_row_data_b_onwards = actual_row_data_b_onwards[
-                    : len(data_headers_b_onwards)
-                ]
-            data_for_df_b_onwards.append(actual_row_data_b_onwards)
-
-        if not data_for_df_b_onwards:
-            existing_sheet_df = pd.DataFrame(columns=data_headers_b_onwards)
-        else:
-            existing_sheet_df = pd.DataFrame(
-                data_for_df_b_onwards, columns=data_headers_b_onwards
-            )
-
-        sheet_has_key_cols = all(
-            col in existing_sheet_df.columns for col in required_key_cols
-        )
-
-        if sheet_has_key_cols and not existing_sheet_df.empty:
-            # Ensure key columns are strings before applying preparation
-            for col in required_key_cols:
-                if col not in existing_sheet_df.columns:
-                    existing_sheet_df[col] = ""
-                existing_sheet_df[col] = existing_sheet_df[col].astype(str)
-
-            # Create unique keys for existing events using prepared (stripped) components
-            existing_sheet_df["unique_key"] = (
-                existing_sheet_df["title"].apply(prepare_key_component)
-                + existing_sheet_df["start_date"].apply(prepare_key_component)
-                + existing_sheet_df["location"].apply(prepare_key_component)
-                + existing_sheet_df["source"].apply(prepare_key_component)
-            )
-            new_events_to_add_df = sanitized_df[
-                ~sanitized_df["unique_key"].isin(existing_sheet_df["unique_key"])
-            ]
-        elif existing_sheet_df.empty:
-            new_events_to_add_df = sanitized_df.copy()  # All incoming events are new
-        else:
-            print(
-                f"Warning: Existing sheet '{worksheet.title}' (data from B onwards) is missing one or more key columns ({required_key_cols}) in its headers. Duplicate check might be incomplete."
-            )
-            # Fallback if unique_key somehow exists (less likely to be prepared/stripped consistently)
-            if (
-                "unique_key" in existing_sheet_df.columns
-                and "unique_key" in sanitized_df.columns
-            ):
-                new_events_to_add_df = sanitized_df[
-                    ~sanitized_df["unique_key"].isin(existing_sheet_df["unique_key"])
-                ]
-            else:
-                new_events_to_add_df = (
-                    sanitized_df.copy()
-                )  # Assume all new if robust check isn't possible
-
-    if new_events_to_add_df.empty:
-        print(f"No new events to add to '{worksheet.title}' after duplicate checking.")
-        return
-
-    # 4. Prepare rows for GSpread insertion (using original, non-stripped data for sheet cells)
-    final_rows_to_insert = []
-    # df_for_insertion contains original (or list-sanitized) data, NOT the key-stripped data
-    df_for_insertion = new_events_to_add_df.drop(
-        columns=["unique_key"], errors="ignore"
+####### Function Definitions #######
+def run_scrapers(scrapers: list) -> List[SourceRun]:
+    start = time.perf_counter()
+
+    def source_sinks(scraper) -> list:
+        sinks = []
+        if save_to_google_sheets:
+            sinks.append(SheetSink(worksheets[scraper.source_name]))
+
+        # Save individual scraper results
+        if save_individual_results:
+            sinks.append(CsvSink(scraper.source_name))
+        return sinks
+
+    # Sources scrape in parallel and stream their events to the sinks as they
+    # go, each one's sheet write starts when it finishes
+    combined_sink = SheetSink(worksheets["Combined"]) if save_to_google_sheets else None
+    profiler = None
+    if profile_mode or profile_memory:
+        profiler = RunProfiler(mode=profile_mode or "cprofile", memory=profile_memory)
+    runs = run_sources(
+        scrapers,
+        sinks=source_sinks,
+        shared_sinks=[combined_sink] if combined_sink else [],
+        profiler=profiler,
     )
+    if profiler:
+        print(f"Profiles: {profiler.summary()}")
 
-    for _, event_series in df_for_insertion.iterrows():
-        row_for_b_onwards = []
-        for header_b in (
-            data_headers_b_onwards
-        ):  # Iterate based on sheet's data headers (B1 onwards)
-            # Get the original value for the cell, not the stripped one used in the key
-            row_for_b_onwards.append(str(event_series.get(header_b, "")))
-        final_row_with_blank_a = [
-            ""
-        ] + row_for_b_onwards  # Prepend empty string for Column A
-        final_rows_to_insert.append(final_row_with_blank_a)
-
-    if not final_rows_to_insert:
-        print(f"No event rows prepared for insertion into '{worksheet.title}'.")
-        return
-
-    # 5. Insert new rows into Google Sheet
-    try:
-        worksheet.insert_rows(
-            final_rows_to_insert, row=2, value_input_option="USER_ENTERED"
-        )
-        print(
-            f"Successfully inserted {len(final_rows_to_insert)} new event(s) into '{worksheet.title}' (data from Col B, Col A is blank)."
-        )
-    except gspread.exceptions.APIError as e:
-        print(
-            f"API Error inserting rows into '{worksheet.title}': {e}. This could be a quota issue or data format problem."
-        )
-    except Exception as e:
-        print(
-            f"An unexpected error occurred during row insertion into '{worksheet.title}': {e}"
-        )
+    # Update combined worksheet after all scrapers run
+    if combined_sink and len(combined_sink):
+        combined = SourceRun(source="Combined", event_count=len(combined_sink))
+        sink_start = time.perf_counter()
+        try:
+            with metrics.stage("Combined", "sink"):
+                combined_sink.close()
+        except Exception as e:
+            combined.error = f"sink failed: {e}"
+            print(f"Error updating Combined worksheet: {e}")
+        combined.sink_seconds = time.perf_counter() - sink_start
+        runs.append(combined)
+
+    # Queued sheet writes of every worksheet go out together
+    if save_to_google_sheets:
+        flush = SourceRun(source="Sheets flush")
+        sink_start = time.perf_counter()
+        with metrics.stage("Sheets", "sink"):
+            failed = sheets.flush()
+        if failed:
+            flush.error = f"{failed} write(s) saved for the next run"
+        flush.sink_seconds = time.perf_counter() - sink_start
+        runs.append(flush)
+        metrics.count("Sheets", "requests", sheets.calls)
+        metrics.count("Sheets", "retries", sheets.retries)
+
+    total_seconds = time.perf_counter() - start
+    print_timing_summary(runs, total_seconds)
+    if run_report:
+        metrics.write_report(run_report, runs, total_seconds)
+    if metrics_textfile:
+        metrics.write_prometheus(metrics_textfile, runs, total_seconds)
+    return runs
 
 
 ####### Run #######
-all_events = run_scrapers(scrapers)
+runs = run_scrapers(scrapers)
+print(f"\nHTTP: {transport.stats.summary()}")
+print(f"HTTP cache: {http_cache.summary()}")
+print(f"Hosts: {host_limiter.summary()}")
+print(f"Sheet mirror: {sheet_mirror.summary()}")
+print(f"Sheets API: {sheets.summary()}")
+print(f"Stages: {metrics.summary()}")
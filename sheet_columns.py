@@ -0,0 +1,81 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import gspread
+from gspread.utils import rowcol_to_a1
+
+ROW_NUMBER = re.compile(r"\d+$")
+
+
+@dataclass
+class ColumnRead:
+    """Header row, the first rows in full and the named columns of a worksheet
+
+    Columns hold the data rows only, padded to data_rows, the number of rows
+    down to the last one with a value in any of the columns read.
+    """
+
+    headers: List[str]
+    top_rows: List[List[str]] = field(default_factory=list)
+    columns: Dict[str, List[str]] = field(default_factory=dict)
+    data_rows: int = 0
+
+
+def column_letter(index: int) -> str:
+    """Sheet column letter of a 0-based index, 0 -> "A" """
+    return ROW_NUMBER.sub("", rowcol_to_a1(1, index + 1))
+
+
+def column_ranges(headers: List[str], columns: List[str]) -> Dict[str, str]:
+    """A1 range of each of columns found in headers, below the header row"""
+    ranges = {}
+    for name in columns:
+        if name in headers:
+            letter = column_letter(headers.index(name))
+            ranges[name] = f"{letter}2:{letter}"
+    return ranges
+
+
+def read_columns(
+    worksheet: gspread.Worksheet,
+    columns: List[str],
+    scheduler=None,
+    headers: Optional[List[str]] = None,
+    top_rows: int = 0,
+) -> ColumnRead:
+    """Read only the named columns of worksheet, plus its header row
+
+    The header row and top_rows rows below it come with one batch_get; the
+    columns are located in the header and fetched with a second one. With a
+    header row expected (from the sheet mirror, say) the columns are fetched in
+    the first batch_get, and only read again if the sheet has them elsewhere.
+    Columns missing from the header are left out.
+    """
+
+    def batch_get(ranges: List[str]) -> List[List[List[str]]]:
+        if scheduler:
+            return scheduler.read(worksheet.batch_get, ranges)
+        return worksheet.batch_get(ranges)
+
+    guessed = column_ranges(headers, columns) if headers else {}
+    blocks = batch_get([f"1:{top_rows + 1}"] + list(guessed.values()))
+    top = [list(row) for row in blocks[0]]
+    actual_headers = top[0] if top else []
+    ranges = column_ranges(actual_headers, columns)
+    if ranges == guessed:
+        found = dict(zip(guessed, blocks[1:]))
+    else:
+        found = dict(zip(ranges, batch_get(list(ranges.values())))) if ranges else {}
+
+    values = {
+        name: [row[0] if row else "" for row in block] for name, block in found.items()
+    }
+    data_rows = max((len(column) for column in values.values()), default=0)
+    for column in values.values():
+        column.extend([""] * (data_rows - len(column)))
+    return ColumnRead(
+        headers=actual_headers,
+        top_rows=top,
+        columns=values,
+        data_rows=max(data_rows, len(top) - 1),
+    )
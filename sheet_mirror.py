@@ -0,0 +1,229 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional, Set
+
+import gspread
+
+
+@dataclass
+class SheetSnapshot:
+    """What append_new_events_to_sheet needs to know about a worksheet"""
+
+    headers: List[str]
+    data_rows: int
+    keys: Set[str] = field(default_factory=set)
+
+
+def top_rows_fingerprint(rows: List[List[str]]) -> str:
+    """Hash of the first rows of a sheet, insensitive to trailing blank cells
+
+    get_all_values pads every row to the sheet width while a range read trims
+    trailing blanks, so both are normalized the same way before hashing.
+    """
+    trimmed = []
+    for row in rows:
+        row = list(row)
+        while row and row[-1] == "":
+            row.pop()
+        trimmed.append(row)
+    while trimmed and not trimmed[-1]:
+        trimmed.pop()
+    payload = json.dumps(trimmed, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SheetKeyMirror:
+    """Local copy of each worksheet's header row and duplicate-check keys
+
+    New events are inserted at row 2 and rows are only ever removed by the
+    dedupe utility, so a sheet whose grid row count and first few rows are
+    unchanged since the last sync still holds the keys recorded locally.
+    Checking that costs one small range read instead of get_all_values.
+
+    Args:
+        path: SQLite file holding the mirror
+        top_rows: Data rows below the header compared to detect edits
+    """
+
+    def __init__(
+        self, path: str = ".scraper_state/sheet_mirror.sqlite", top_rows: int = 5
+    ):
+        self.top_rows = top_rows
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS sheets (
+                sheet TEXT PRIMARY KEY,
+                row_count INTEGER NOT NULL,
+                data_rows INTEGER NOT NULL,
+                headers TEXT NOT NULL,
+                fingerprint TEXT NOT NULL
+            )
+            """)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS sheet_keys (
+                sheet TEXT NOT NULL,
+                key TEXT NOT NULL,
+                PRIMARY KEY (sheet, key)
+            ) WITHOUT ROWID
+            """)
+
+    @staticmethod
+    def sheet_id(worksheet: gspread.Worksheet) -> str:
+        return f"{worksheet.spreadsheet_id}/{worksheet.id}"
+
+    def _read_top_rows(self, worksheet: gspread.Worksheet, scheduler=None):
+        range_name = f"1:{self.top_rows + 1}"
+        if scheduler:
+            return scheduler.read(worksheet.get, range_name)
+        return worksheet.get(range_name)
+
+    def snapshot(
+        self, worksheet: gspread.Worksheet, scheduler=None
+    ) -> Optional[SheetSnapshot]:
+        """Mirrored state of worksheet, or None if missing or the sheet drifted
+
+        worksheet.row_count is the grid size gspread read when the worksheet
+        was opened, kept current by gspread (and SheetsScheduler) for rows
+        inserted through it. Reads go through scheduler when one is given.
+        """
+        sheet = self.sheet_id(worksheet)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT row_count, data_rows, headers, fingerprint FROM sheets WHERE sheet = ?",
+                (sheet,),
+            ).fetchone()
+            if row is None or row[0] != worksheet.row_count:
+                self.misses += 1
+                return None
+
+        try:
+            top_rows = self._read_top_rows(worksheet, scheduler)
+        except gspread.exceptions.APIError as e:
+            print(f"Could not check mirror of '{worksheet.title}': {e}")
+            with self._lock:
+                self.misses += 1
+            return None
+        if top_rows_fingerprint(top_rows) != row[3]:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            keys = {
+                key
+                for (key,) in self._db.execute(
+                    "SELECT key FROM sheet_keys WHERE sheet = ?", (sheet,)
+                )
+            }
+            self.hits += 1
+        return SheetSnapshot(headers=json.loads(row[2]), data_rows=row[1], keys=keys)
+
+    def store(
+        self,
+        worksheet: gspread.Worksheet,
+        all_values: List[List[str]],
+        keys: Iterable[str],
+        data_rows: Optional[int] = None,
+    ):
+        """Replace the mirror of worksheet after reading all of its keys
+
+        all_values needs the header and top rows only when data_rows, the
+        sheet's row count below the header, is given.
+        """
+        headers = all_values[0] if all_values else []
+        if data_rows is None:
+            data_rows = max(len(all_values) - 1, 0)
+        fingerprint = top_rows_fingerprint(all_values[: self.top_rows + 1])
+        sheet = self.sheet_id(worksheet)
+        with self._lock:
+            self._db.execute("DELETE FROM sheet_keys WHERE sheet = ?", (sheet,))
+            self._write(worksheet, headers, data_rows, fingerprint, keys)
+
+    def known_headers(self, worksheet: gspread.Worksheet) -> Optional[List[str]]:
+        """Header row recorded at the last sync, whether or not still current"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT headers FROM sheets WHERE sheet = ?",
+                (self.sheet_id(worksheet),),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def record_insert(
+        self,
+        worksheet: gspread.Worksheet,
+        headers: List[str],
+        data_rows: int,
+        keys: Iterable[str],
+        scheduler=None,
+    ):
+        """Add rows just inserted at row 2, re-reading the top rows as Sheets shows them"""
+        try:
+            fingerprint = top_rows_fingerprint(
+                self._read_top_rows(worksheet, scheduler)
+            )
+        except gspread.exceptions.APIError as e:
+            print(f"Could not update mirror of '{worksheet.title}': {e}")
+            self.forget(worksheet)
+            return
+        with self._lock:
+            self._write(worksheet, headers, data_rows, fingerprint, keys)
+
+    def _write(self, worksheet, headers, data_rows, fingerprint, keys):
+        sheet = self.sheet_id(worksheet)
+        self._db.execute(
+            "INSERT OR REPLACE INTO sheets VALUES (?, ?, ?, ?, ?)",
+            (
+                sheet,
+                worksheet.row_count,
+                data_rows,
+                json.dumps(headers, ensure_ascii=False),
+                fingerprint,
+            ),
+        )
+        self._db.executemany(
+            "INSERT OR IGNORE INTO sheet_keys VALUES (?, ?)",
+            ((sheet, key) for key in keys),
+        )
+        self._db.commit()
+
+    def forget(self, worksheet: gspread.Worksheet):
+        """Drop the mirror of worksheet so the next run reads it in full"""
+        sheet = self.sheet_id(worksheet)
+        with self._lock:
+            self._db.execute("DELETE FROM sheets WHERE sheet = ?", (sheet,))
+            self._db.execute("DELETE FROM sheet_keys WHERE sheet = ?", (sheet,))
+            self._db.commit()
+
+    def summary(self) -> str:
+        return f"{self.hits} sheet(s) checked from mirror, {self.misses} read in full"
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_default_mirror: Optional[SheetKeyMirror] = None
+
+
+def get_default_sheet_mirror() -> Optional[SheetKeyMirror]:
+    """Mirror used when none is passed in, None reads every sheet in full"""
+    return _default_mirror
+
+
+def configure_default_sheet_mirror(**kwargs) -> SheetKeyMirror:
+    """Mirror the duplicate-check keys of every worksheet written to"""
+    global _default_mirror
+    if _default_mirror is not None:
+        _default_mirror.close()
+    _default_mirror = SheetKeyMirror(**kwargs)
+    return _default_mirror
@@ -0,0 +1,323 @@
+from typing import Dict, List, Optional, Set
+import pandas as pd
+import gspread
+from pipeline import DataFrameSink
+from sheet_columns import read_columns
+from sheet_mirror import SheetKeyMirror, SheetSnapshot, get_default_sheet_mirror
+from sheets_scheduler import SheetsScheduler, get_default_sheets_scheduler
+
+# Columns combined into the key used to spot events already in a sheet
+KEY_COLUMNS = ["title", "start_date", "location", "source"]
+
+# Characters to remove for key generation
+# Focus on apostrophes and similar quote-like characters as per user feedback
+KEY_STRIP_CHARS = "'’‘`\""
+KEY_STRIP_TABLE = str.maketrans("", "", KEY_STRIP_CHARS)
+KEY_SEPARATOR = "\x00"
+
+
+def prepare_key_component(value: any) -> str:
+    """Normalize a single value the way build_unique_keys does a column"""
+    return str(value).strip().lower().translate(KEY_STRIP_TABLE)
+
+
+def build_unique_keys(df: pd.DataFrame) -> pd.Series:
+    """prepare_key_component over KEY_COLUMNS, concatenated per row
+
+    Components are only stripped and lowercased one by one; the quote
+    characters are removed from all keys at once, joined into one string,
+    since removing characters gives the same result before or after joining.
+    """
+    components = [
+        [str(value).strip().lower() for value in df[col].tolist()]
+        for col in KEY_COLUMNS
+    ]
+    keys = ["".join(parts) for parts in zip(*components)]
+
+    joined = KEY_SEPARATOR.join(keys)
+    if joined.count(KEY_SEPARATOR) == max(len(keys) - 1, 0):
+        for char in KEY_STRIP_CHARS:
+            joined = joined.replace(char, "")
+        keys = joined.split(KEY_SEPARATOR) if keys else []
+    else:
+        # A value contains the separator itself, strip key by key
+        keys = [key.translate(KEY_STRIP_TABLE) for key in keys]
+    return pd.Series(keys, index=df.index, dtype=object)
+
+
+def join_list_values(df: pd.DataFrame) -> pd.DataFrame:
+    """Copy of df with list cells turned into ", " joined strings for Sheets"""
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype != object:
+            continue
+        is_list = [isinstance(value, list) for value in df[col]]
+        if any(is_list):
+            df.loc[is_list, col] = [
+                ", ".join(str(v) for v in value) for value in df.loc[is_list, col]
+            ]
+    return df
+
+
+def sheet_column(rows: List[List[str]], index: int) -> List[str]:
+    """One column of ragged sheet rows, short rows read as empty cells"""
+    return [row[index] if len(row) > index else "" for row in rows]
+
+
+def build_sheet_rows(df: pd.DataFrame, headers: List[str]) -> List[List[str]]:
+    """Cell strings ordered by headers, prefixed with a blank column A"""
+    cells = df.reindex(columns=headers, fill_value="").astype(str)
+    cells.insert(0, "__column_a__", "")
+    return cells.to_numpy().tolist()
+
+
+def sheet_keys(header_row: List[str], data_rows: List[List[str]]) -> Set[str]:
+    """Duplicate-check keys of sheet rows, from the key columns if present"""
+    data_headers = header_row[1:]
+    if not data_rows:
+        return set()
+    if all(col in data_headers for col in KEY_COLUMNS):
+        # Only the key columns are read out of the sheet rows; +1 skips column A
+        existing_keys_df = pd.DataFrame(
+            {
+                col: sheet_column(data_rows, data_headers.index(col) + 1)
+                for col in KEY_COLUMNS
+            }
+        )
+        return set(build_unique_keys(existing_keys_df))
+    if "unique_key" in data_headers:
+        return set(sheet_column(data_rows, data_headers.index("unique_key") + 1))
+    return set()
+
+
+def column_keys(columns: Dict[str, List[str]]) -> Set[str]:
+    """Duplicate-check keys from the key columns of a sheet, if all were read"""
+    if all(col in columns for col in KEY_COLUMNS):
+        return set(
+            build_unique_keys(pd.DataFrame({col: columns[col] for col in KEY_COLUMNS}))
+        )
+    if "unique_key" in columns:
+        return set(columns["unique_key"])
+    return set()
+
+
+def read_sheet_snapshot(all_sheet_cells: List[List[str]]) -> SheetSnapshot:
+    """Header row, data row count and keys of a full get_all_values read"""
+    if not all_sheet_cells or all_sheet_cells == [[]]:
+        return SheetSnapshot(headers=[], data_rows=0)
+    header_row, data_rows = all_sheet_cells[0], all_sheet_cells[1:]
+    return SheetSnapshot(
+        headers=header_row,
+        data_rows=len(data_rows),
+        keys=sheet_keys(header_row, data_rows),
+    )
+
+
+def append_new_events_to_sheet(
+    events_df: pd.DataFrame,
+    worksheet: gspread.Worksheet,
+    mirror: Optional[SheetKeyMirror] = None,
+    scheduler: Optional[SheetsScheduler] = None,
+):
+    """Insert the events not already in worksheet at row 2
+
+    Existing keys come from the sheet mirror while the sheet is unchanged
+    since the last sync, otherwise from a full get_all_values read. With a
+    scheduler the writes are only queued and go out on scheduler.flush().
+    """
+    if events_df.empty:
+        print(f"No new events DataFrame to process for worksheet '{worksheet.title}'.")
+        return
+    mirror = mirror or get_default_sheet_mirror()
+    scheduler = scheduler or get_default_sheets_scheduler()
+    if scheduler and scheduler.has_pending(worksheet):
+        # The sheet has to be up to date before its keys are read
+        scheduler.flush()
+
+    # 1. Sanitize incoming DataFrame (for list conversion, etc.)
+    sanitized_df = join_list_values(events_df)
+
+    missing_key_cols = [col for col in KEY_COLUMNS if col not in sanitized_df.columns]
+    if missing_key_cols:
+        print(
+            f"Warning: Incoming DataFrame for '{worksheet.title}' is missing key columns: {missing_key_cols}. Adding as empty strings for key generation."
+        )
+        for col in missing_key_cols:
+            sanitized_df[col] = ""
+
+    # Create unique keys for new events using prepared (stripped) components
+    sanitized_df["unique_key"] = build_unique_keys(sanitized_df)
+
+    # 2. Get existing headers and keys, from the mirror if it is still current,
+    # otherwise reading only the key columns
+    snapshot = mirror.snapshot(worksheet, scheduler) if mirror else None
+    if snapshot is None:
+        try:
+            read = read_columns(
+                worksheet,
+                KEY_COLUMNS + ["unique_key"],
+                scheduler,
+                # Where the sync itself would have put the columns
+                headers=(mirror and mirror.known_headers(worksheet))
+                or [""] + [col for col in sanitized_df.columns if col != "unique_key"],
+                top_rows=mirror.top_rows if mirror else 0,
+            )
+        except gspread.exceptions.APIError as e:
+            print(
+                f"Error fetching data from worksheet '{worksheet.title}': {e}. Quota likely exceeded or API issue."
+            )
+            return
+        data_headers = read.headers[1:]
+        if all(col in data_headers for col in KEY_COLUMNS):
+            read.columns.pop("unique_key", None)
+        snapshot = SheetSnapshot(
+            headers=read.headers,
+            data_rows=read.data_rows,
+            keys=column_keys(read.columns) if read.data_rows else set(),
+        )
+        if mirror:
+            mirror.store(worksheet, read.top_rows, snapshot.keys, read.data_rows)
+
+    sheet_header_row_from_a1 = snapshot.headers
+    data_headers_b_onwards = (
+        sheet_header_row_from_a1[1:] if len(sheet_header_row_from_a1) > 0 else []
+    )
+
+    # 3. Handle sheet initialization or compare against existing keys
+    if not data_headers_b_onwards:  # If B1 onwards is unheadered
+        print(
+            f"Sheet '{worksheet.title}' has no data headers from B1 onwards. Initializing headers."
+        )
+        headers_for_b1_onwards = [
+            col for col in sanitized_df.columns if col != "unique_key"
+        ]
+        if not headers_for_b1_onwards:
+            print(
+                f"Cannot initialize headers for '{worksheet.title}': no data columns in DataFrame (excluding unique_key)."
+            )
+            return
+
+        if scheduler:
+            scheduler.update_values(worksheet, "B1", [headers_for_b1_onwards])
+            if not sheet_header_row_from_a1:  # If A1 was also empty
+                scheduler.update_values(worksheet, "A1", [[""]])
+            scheduler.freeze(worksheet, rows=1)
+        else:
+            worksheet.update([headers_for_b1_onwards], range_name="B1")
+            if not sheet_header_row_from_a1:  # If A1 was also empty
+                worksheet.update_cell(1, 1, "")
+            worksheet.freeze(rows=1)
+        print(
+            f"Initialized data headers for '{worksheet.title}' from B1 and froze the first row. Column A1 is blank or preserved."
+        )
+
+        data_headers_b_onwards = headers_for_b1_onwards
+        sheet_header_row_from_a1 = (
+            sheet_header_row_from_a1[:1] or [""]
+        ) + headers_for_b1_onwards
+        new_events_to_add_df = sanitized_df  # All incoming events are new
+
+    elif not snapshot.data_rows:
+        new_events_to_add_df = sanitized_df  # All incoming events are new
+
+    elif all(col in data_headers_b_onwards for col in KEY_COLUMNS):
+        new_events_to_add_df = sanitized_df[
+            ~sanitized_df["unique_key"].isin(snapshot.keys)
+        ]
+
+    else:
+        print(
+            f"Warning: Existing sheet '{worksheet.title}' (data from B onwards) is missing one or more key columns ({KEY_COLUMNS}) in its headers. Duplicate check might be incomplete."
+        )
+        # Fallback if unique_key somehow exists (less likely to be prepared/stripped consistently)
+        if "unique_key" in data_headers_b_onwards:
+            new_events_to_add_df = sanitized_df[
+                ~sanitized_df["unique_key"].isin(snapshot.keys)
+            ]
+        else:
+            # Assume all new if robust check isn't possible
+            new_events_to_add_df = sanitized_df
+
+    if new_events_to_add_df.empty:
+        print(f"No new events to add to '{worksheet.title}' after duplicate checking.")
+        return
+
+    # 4. Prepare rows for GSpread insertion (using original, non-stripped data for sheet cells)
+    # df_for_insertion contains original (or list-sanitized) data, NOT the key-stripped data
+    df_for_insertion = new_events_to_add_df.drop(
+        columns=["unique_key"], errors="ignore"
+    )
+    final_rows_to_insert = build_sheet_rows(df_for_insertion, data_headers_b_onwards)
+
+    if not final_rows_to_insert:
+        print(f"No event rows prepared for insertion into '{worksheet.title}'.")
+        return
+
+    def record_insert():
+        if mirror:
+            mirror.record_insert(
+                worksheet,
+                sheet_header_row_from_a1,
+                snapshot.data_rows + len(final_rows_to_insert),
+                sheet_keys(sheet_header_row_from_a1, final_rows_to_insert),
+                scheduler,
+            )
+
+    # 5. Insert new rows into Google Sheet
+    if scheduler:
+
+        def inserted():
+            print(
+                f"Successfully inserted {len(final_rows_to_insert)} new event(s) into '{worksheet.title}' (data from Col B, Col A is blank)."
+            )
+            record_insert()
+
+        scheduler.insert_rows(worksheet, final_rows_to_insert, row=2, on_done=inserted)
+        print(
+            f"Queued {len(final_rows_to_insert)} new event(s) for '{worksheet.title}'."
+        )
+        return
+
+    try:
+        worksheet.insert_rows(
+            final_rows_to_insert, row=2, value_input_option="USER_ENTERED"
+        )
+        print(
+            f"Successfully inserted {len(final_rows_to_insert)} new event(s) into '{worksheet.title}' (data from Col B, Col A is blank)."
+        )
+    except gspread.exceptions.APIError as e:
+        print(
+            f"API Error inserting rows into '{worksheet.title}': {e}. This could be a quota issue or data format problem."
+        )
+        return
+    except Exception as e:
+        print(
+            f"An unexpected error occurred during row insertion into '{worksheet.title}': {e}"
+        )
+        return
+
+    record_insert()
+
+
+class SheetSink(DataFrameSink):
+    """Collects a worksheet's events while they are scraped, syncing on close
+
+    The duplicate check and insert run once, when every source feeding the
+    sink is done, so the sheet still gets a single queued insert per run.
+    """
+
+    def __init__(
+        self,
+        worksheet: gspread.Worksheet,
+        mirror: Optional[SheetKeyMirror] = None,
+        scheduler: Optional[SheetsScheduler] = None,
+    ):
+        super().__init__()
+        self.worksheet = worksheet
+        self.mirror = mirror
+        self.scheduler = scheduler
+
+    def close(self):
+        append_new_events_to_sheet(
+            self.to_dataframe(), self.worksheet, self.mirror, self.scheduler
+        )
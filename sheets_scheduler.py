@@ -0,0 +1,503 @@
+import json
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import gspread
+import requests
+from gspread.utils import absolute_range_name, a1_range_to_grid_range, rowcol_to_a1
+
+# Status codes worth retrying: quota exceeded and transient server errors
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, gspread.exceptions.APIError):
+        return error.code in RETRYABLE_STATUS
+    return isinstance(
+        error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+    )
+
+
+def retry_after(error: Exception) -> float:
+    """Seconds the API asked us to wait, 0 if it did not say"""
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("Retry-After", 0))
+    except (AttributeError, TypeError, ValueError):
+        return 0.0
+
+
+class TokenBucket:
+    """Blocking token bucket refilled continuously at rate_per_minute
+
+    The Sheets API counts requests per minute, so the bucket holds at most a
+    minute's worth of tokens and then lets requests through at the average rate.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1) -> float:
+        """Take tokens, sleeping until they are available; returns seconds waited"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+@dataclass
+class SheetOp:
+    """A queued write, flushed together with the other writes to its spreadsheet
+
+    Inserted rows are written in two steps, an insertDimension request in the
+    spreadsheet batch_update then their values in values_batch_update.
+    """
+
+    spreadsheet: Any
+    worksheet: Any = None
+    requests: List[dict] = field(default_factory=list)
+    range_name: Optional[str] = None
+    values: Optional[List[List[str]]] = None
+    insert_row: Optional[int] = None
+    frozen_rows: Optional[int] = None
+    on_done: List[Callable] = field(default_factory=list)
+    replayable: bool = True
+    structure_failed: bool = False
+    values_failed: bool = False
+
+    def value_ranges(self, max_cells: int, shift: int = 0) -> List[dict]:
+        """values_batch_update data for this op, long blocks split by rows
+
+        shift is the number of rows inserted above this block by later ops.
+        """
+        if not self.values:
+            return []
+        title = self.worksheet.title
+        if self.insert_row is None:
+            return [
+                {
+                    "range": absolute_range_name(title, self.range_name),
+                    "values": self.values,
+                }
+            ]
+        width = max(len(row) for row in self.values) or 1
+        rows_per_range = max(1, max_cells // width)
+        ranges = []
+        for offset in range(0, len(self.values), rows_per_range):
+            rows = self.values[offset : offset + rows_per_range]
+            first = self.insert_row + shift + offset
+            a1 = f"A{first}:{rowcol_to_a1(first + len(rows) - 1, width)}"
+            ranges.append({"range": absolute_range_name(title, a1), "values": rows})
+        return ranges
+
+
+class SheetsScheduler:
+    """Single path for Google Sheets reads and writes
+
+    Reads run immediately; writes are queued and sent by flush() in as few
+    batch_update and values_batch_update calls per spreadsheet as the payload
+    limits allow. Every call waits on a token bucket sized to the per-minute
+    quota and is retried with jittered exponential backoff on 429 and 5xx
+    errors. Writes that still fail are appended to a dead-letter file and
+    sent again by replay_dead_letters() on the next run.
+
+    Args:
+        reads_per_minute: Read requests allowed per minute
+        writes_per_minute: Write requests allowed per minute
+        max_retries: Retries of a call before giving up on it
+        backoff_base: First retry waits up to this many seconds, doubling after
+        backoff_max: Longest wait between two retries
+        max_requests_per_batch: batch_update requests sent in one call
+        max_cells_per_batch: Cells written in one values_batch_update call
+        dead_letter_path: JSON lines file for writes that could not be sent
+    """
+
+    def __init__(
+        self,
+        reads_per_minute: float = 60,
+        writes_per_minute: float = 60,
+        max_retries: int = 6,
+        backoff_base: float = 1.0,
+        backoff_max: float = 64.0,
+        max_requests_per_batch: int = 500,
+        max_cells_per_batch: int = 50_000,
+        dead_letter_path: str = ".scraper_state/sheets_dead_letter.jsonl",
+    ):
+        self.read_bucket = TokenBucket(reads_per_minute)
+        self.write_bucket = TokenBucket(writes_per_minute)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_requests_per_batch = max_requests_per_batch
+        self.max_cells_per_batch = max_cells_per_batch
+        self.dead_letter_path = dead_letter_path
+        self.calls = 0
+        self.retries = 0
+        self.waited = 0.0
+        self.dead_lettered = 0
+        self._pending: List[SheetOp] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    # Immediate calls
+
+    def _call(self, bucket: TokenBucket, fn: Callable, *args, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            waited = bucket.acquire()
+            # Parallel sinks share the scheduler, the counts are kept under
+            # the lock so none are lost
+            with self._lock:
+                self.waited += waited
+                self.calls += 1
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.max_retries:
+                    raise
+                delay = random.uniform(
+                    0, min(self.backoff_max, self.backoff_base * 2**attempt)
+                )
+                delay = max(delay, retry_after(e))
+                print(f"Sheets API error ({e}), retrying in {delay:.1f}s")
+                with self._lock:
+                    self.retries += 1
+                    self.waited += delay
+                time.sleep(delay)
+
+    def read(self, fn: Callable, *args, **kwargs):
+        """Call a gspread read method under the read quota"""
+        return self._call(self.read_bucket, fn, *args, **kwargs)
+
+    def write(self, fn: Callable, *args, **kwargs):
+        """Call a gspread write method under the write quota, unbatched"""
+        return self._call(self.write_bucket, fn, *args, **kwargs)
+
+    # Queued writes
+
+    def _queue(self, op: SheetOp):
+        with self._lock:
+            self._pending.append(op)
+
+    def has_pending(self, worksheet) -> bool:
+        with self._lock:
+            return any(op.worksheet is worksheet for op in self._pending)
+
+    def _pending_structure_from(self, worksheet) -> Optional[int]:
+        with self._lock:
+            rows = [
+                op.insert_row or 1
+                for op in self._pending
+                if op.worksheet is worksheet and op.requests
+            ]
+        return min(rows) if rows else None
+
+    def insert_rows(
+        self,
+        worksheet,
+        rows: List[List[str]],
+        row: int = 2,
+        on_done: Optional[Callable] = None,
+    ):
+        """Queue rows to be inserted above row, like Worksheet.insert_rows"""
+        with self._lock:
+            last = next(
+                (op for op in reversed(self._pending) if op.worksheet is worksheet),
+                None,
+            )
+            if last is not None and last.insert_row == row:
+                # Two inserts at the same row end up with the later rows on top
+                last.values = [list(r) for r in rows] + last.values
+                last.requests[0]["insertDimension"]["range"]["endIndex"] += len(rows)
+                if on_done:
+                    last.on_done.append(on_done)
+                return
+        request = {
+            "insertDimension": {
+                "range": {
+                    "sheetId": worksheet.id,
+                    "dimension": "ROWS",
+                    "startIndex": row - 1,
+                    "endIndex": row - 1 + len(rows),
+                },
+                # As gspread's insert_rows: new rows must not take the row above's
+                # formatting, a column A highlight ranks a duplicate in dedupe
+                "inheritFromBefore": False,
+            }
+        }
+        self._queue(
+            SheetOp(
+                spreadsheet=worksheet.spreadsheet,
+                worksheet=worksheet,
+                requests=[request],
+                values=[list(r) for r in rows],
+                insert_row=row,
+                on_done=[on_done] if on_done else [],
+            )
+        )
+
+    def update_values(
+        self,
+        worksheet,
+        range_name: str,
+        values: List[List[Any]],
+        on_done: Optional[Callable] = None,
+    ):
+        """Queue a USER_ENTERED values write, like Worksheet.update"""
+        # Values are written after all queued row inserts, so a range below a
+        # pending insert must not wait for them
+        first_row = a1_range_to_grid_range(range_name).get("startRowIndex", 0) + 1
+        pending_from = self._pending_structure_from(worksheet)
+        if pending_from is not None and first_row >= pending_from:
+            self.flush()
+        self._queue(
+            SheetOp(
+                spreadsheet=worksheet.spreadsheet,
+                worksheet=worksheet,
+                range_name=range_name,
+                values=values,
+                on_done=[on_done] if on_done else [],
+            )
+        )
+
+    def freeze(self, worksheet, rows: int):
+        """Queue freezing the first rows, like Worksheet.freeze(rows=...)"""
+        request = {
+            "updateSheetProperties": {
+                "properties": {
+                    "sheetId": worksheet.id,
+                    "gridProperties": {"frozenRowCount": rows},
+                },
+                "fields": "gridProperties.frozenRowCount",
+            }
+        }
+        self._queue(
+            SheetOp(
+                spreadsheet=worksheet.spreadsheet,
+                worksheet=worksheet,
+                requests=[request],
+                frozen_rows=rows,
+            )
+        )
+
+    def batch_update(
+        self,
+        spreadsheet,
+        requests_: List[dict],
+        on_done: Optional[Callable] = None,
+        replayable: bool = True,
+    ):
+        """Queue raw batch_update requests
+
+        Pass replayable=False for requests that depend on the sheet's current
+        layout, such as row deletions, which must not be sent on a later run.
+        """
+        self._queue(
+            SheetOp(
+                spreadsheet=spreadsheet,
+                requests=list(requests_),
+                on_done=[on_done] if on_done else [],
+                replayable=replayable,
+            )
+        )
+
+    def _chunks(self, items: List, size: Callable, limit: int) -> List[List]:
+        chunks, current, current_size = [], [], 0
+        for item in items:
+            item_size = size(item)
+            if current and current_size + item_size > limit:
+                chunks.append(current)
+                current, current_size = [], 0
+            current.append(item)
+            current_size += item_size
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def _flush_spreadsheet(self, spreadsheet, ops: List[SheetOp]):
+        # 1. Row inserts, freezes and raw requests, in the order they were queued
+        structure = [(op, request) for op in ops for request in op.requests]
+        for chunk in self._chunks(
+            structure, lambda item: 1, self.max_requests_per_batch
+        ):
+            try:
+                self.write(
+                    spreadsheet.batch_update,
+                    {"requests": [request for _, request in chunk]},
+                )
+            except Exception as e:
+                print(f"Error sending {len(chunk)} sheet update request(s): {e}")
+                for op, _ in chunk:
+                    op.structure_failed = True
+
+        for op in ops:
+            if op.structure_failed or op.worksheet is None:
+                continue
+            # Keep gspread's view of the grid current, as its own methods do
+            properties = op.worksheet._properties.setdefault("gridProperties", {})
+            if op.insert_row is not None:
+                properties["rowCount"] = properties.get("rowCount", 0) + len(op.values)
+            if op.frozen_rows is not None:
+                properties["frozenRowCount"] = op.frozen_rows
+
+        # 2. Cell values of the inserts that went through and plain updates.
+        # A block moves down by the rows inserted above it after it.
+        shifts = {}
+        inserted_after: Dict[int, List[tuple]] = {}
+        for op in reversed(ops):
+            if op.structure_failed or op.insert_row is None:
+                continue
+            later = inserted_after.setdefault(id(op.worksheet), [])
+            shifts[id(op)] = sum(n for row, n in later if row <= op.insert_row)
+            later.append((op.insert_row, len(op.values)))
+        data = [
+            (op, value_range)
+            for op in ops
+            if not op.structure_failed
+            for value_range in op.value_ranges(
+                self.max_cells_per_batch, shifts.get(id(op), 0)
+            )
+        ]
+        for chunk in self._chunks(
+            data,
+            lambda item: sum(len(row) for row in item[1]["values"]) or 1,
+            self.max_cells_per_batch,
+        ):
+            try:
+                self.write(
+                    spreadsheet.values_batch_update,
+                    {
+                        "valueInputOption": "USER_ENTERED",
+                        "data": [value_range for _, value_range in chunk],
+                    },
+                )
+            except Exception as e:
+                print(f"Error writing {len(chunk)} range(s) of sheet values: {e}")
+                for op, _ in chunk:
+                    op.values_failed = True
+
+        for op in ops:
+            if op.structure_failed or op.values_failed:
+                self._dead_letter(op)
+                continue
+            for callback in op.on_done:
+                callback()
+
+    def flush(self) -> int:
+        """Send every queued write; returns how many writes could not be sent"""
+        with self._flush_lock:
+            with self._lock:
+                ops, self._pending = self._pending, []
+            by_spreadsheet: Dict[str, List[SheetOp]] = {}
+            for op in ops:
+                by_spreadsheet.setdefault(op.spreadsheet.id, []).append(op)
+            for spreadsheet_ops in by_spreadsheet.values():
+                self._flush_spreadsheet(spreadsheet_ops[0].spreadsheet, spreadsheet_ops)
+            return sum(op.structure_failed or op.values_failed for op in ops)
+
+    # Dead letters
+
+    def _dead_letter(self, op: SheetOp):
+        if not op.replayable:
+            print("Dropping failed sheet update, it is only valid for this run.")
+            return
+        entry = {"spreadsheet_id": op.spreadsheet.id, "time": time.time()}
+        if op.insert_row is not None:
+            # Rows inserted but left blank are filled in on replay if untouched
+            kind = "insert_values" if not op.structure_failed else "insert"
+            entry.update(kind=kind, row=op.insert_row, values=op.values)
+        elif op.values is not None:
+            entry.update(kind="values", range=op.range_name, values=op.values)
+        else:
+            entry.update(kind="requests", requests=op.requests)
+        if op.worksheet is not None:
+            entry["worksheet"] = op.worksheet.title
+
+        directory = os.path.dirname(self.dead_letter_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock, open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.dead_lettered += 1
+        print(f"Saved failed sheet write to {self.dead_letter_path} for the next run.")
+
+    def replay_dead_letters(self, spreadsheet) -> int:
+        """Queue and flush the saved writes for spreadsheet; returns how many"""
+        if not os.path.exists(self.dead_letter_path):
+            return 0
+        with self._lock:
+            with open(self.dead_letter_path, encoding="utf-8") as f:
+                entries = [json.loads(line) for line in f if line.strip()]
+            kept = [e for e in entries if e["spreadsheet_id"] != spreadsheet.id]
+            with open(self.dead_letter_path, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(e, ensure_ascii=False) + "\n" for e in kept)
+        entries = [e for e in entries if e["spreadsheet_id"] == spreadsheet.id]
+
+        for entry in entries:
+            if entry["kind"] == "requests":
+                self.batch_update(spreadsheet, entry["requests"])
+                continue
+            worksheet = self.read(spreadsheet.worksheet, entry["worksheet"])
+            if entry["kind"] == "values":
+                self.update_values(worksheet, entry["range"], entry["values"])
+            elif entry["kind"] == "insert_values" and self._rows_blank(
+                worksheet, entry["row"], len(entry["values"])
+            ):
+                self._queue(
+                    SheetOp(
+                        spreadsheet=spreadsheet,
+                        worksheet=worksheet,
+                        values=entry["values"],
+                        insert_row=entry["row"],
+                    )
+                )
+            else:
+                self.insert_rows(worksheet, entry["values"], row=entry["row"])
+        if entries:
+            print(f"Replaying {len(entries)} saved sheet write(s).")
+            self.flush()
+        return len(entries)
+
+    def _rows_blank(self, worksheet, row: int, count: int) -> bool:
+        values = self.read(worksheet.get, f"{row}:{row + count - 1}")
+        return not any(cell for values_row in values for cell in values_row)
+
+    def summary(self) -> str:
+        return (
+            f"{self.calls} API call(s), {self.retries} retried, "
+            f"{self.waited:.1f}s waiting on quota, {self.dead_lettered} write(s) saved for later"
+        )
+
+
+_default_scheduler: Optional[SheetsScheduler] = None
+
+
+def get_default_sheets_scheduler() -> Optional[SheetsScheduler]:
+    """Scheduler used when none is passed in, None calls gspread directly"""
+    return _default_scheduler
+
+
+def configure_default_sheets_scheduler(**kwargs) -> SheetsScheduler:
+    """Route every sheet read and write through one shared scheduler"""
+    global _default_scheduler
+    if _default_scheduler is not None:
+        _default_scheduler.flush()
+    _default_scheduler = SheetsScheduler(**kwargs)
+    return _default_scheduler
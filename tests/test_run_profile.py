@@ -0,0 +1,29 @@
+import os
+import pstats
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from run_profile import PROFILE_MODES, SourceProfiler
+
+
+def work(n: int) -> int:
+    return sum(i * i for i in range(n))
+
+
+@pytest.mark.parametrize("mode", PROFILE_MODES)
+def test_thread_pool_under_profiler(tmp_path, mode):
+    with SourceProfiler("Pool", str(tmp_path), mode, memory=True) as profiler:
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(work, [20000] * 16))
+
+    assert results == [work(20000)] * 16
+    suffix = ".pstats" if mode == "cprofile" else ".collapsed"
+    assert sorted(os.path.basename(path) for path in profiler.artifacts) == sorted(
+        [f"Pool{suffix}", "Pool.txt", "Pool.alloc.txt"]
+    )
+    if mode == "cprofile":
+        # The calls made in the pool's threads are in the profile
+        stats = pstats.Stats(str(tmp_path / "Pool.pstats"))
+        calls = [row[1] for key, row in stats.stats.items() if key[2] == "work"]
+        assert calls == [16]
@@ -0,0 +1,164 @@
+import threading
+from typing import Iterator, Optional, Tuple, Union
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+try:  # urllib3 decodes brotli transparently when one of these is installed
+    import brotli  # noqa: F401
+
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+
+        ACCEPT_ENCODING = "gzip, deflate, br"
+    except ImportError:
+        ACCEPT_ENCODING = "gzip, deflate"
+
+
+Timeout = Union[float, Tuple[float, float]]
+
+
+class TransportStats:
+    """Thread-safe counters describing the traffic of one run"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.wire_bytes = 0
+        self.content_bytes = 0
+
+    def record_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def record_response(self, wire_bytes: int, content_bytes: int):
+        with self._lock:
+            self.requests += 1
+            self.wire_bytes += wire_bytes
+            self.content_bytes += content_bytes
+
+    @property
+    def handshakes_saved(self) -> int:
+        """Requests served over an already open (keep-alive) connection"""
+        return max(self.requests - self.connections, 0)
+
+    def summary(self) -> str:
+        return (
+            f"{self.requests} requests over {self.connections} connections "
+            f"({self.handshakes_saved} handshakes saved), "
+            f"{self.wire_bytes / 1024:.1f} KiB transferred, "
+            f"{self.content_bytes / 1024:.1f} KiB decoded"
+        )
+
+
+class _CountingAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools report every new TCP/TLS connection"""
+
+    def __init__(self, stats: TransportStats, **kwargs):
+        self._stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        stats = self._stats
+
+        class CountingHTTPConnectionPool(HTTPConnectionPool):
+            def _new_conn(self):
+                stats.record_connection()
+                return super()._new_conn()
+
+        class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+            def _new_conn(self):
+                stats.record_connection()
+                return super()._new_conn()
+
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool,
+        }
+
+
+class HttpTransport:
+    """Pooled keep-alive HTTP session that can be shared between scrapers
+
+    Args:
+        pool_connections: Number of per-host connection pools to keep around
+        pool_maxsize: Connections kept alive per host, should be >= the number
+            of concurrent workers hitting that host
+        timeout: Default (connect, read) timeout in seconds for every request
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        timeout: Timeout = (5, 30),
+    ):
+        self.timeout = timeout
+        self.stats = TransportStats()
+        self.session = requests.Session()
+        self.session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+        adapter = _CountingAdapter(
+            self.stats, pool_connections=pool_connections, pool_maxsize=pool_maxsize
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(
+        self,
+        url: str,
+        headers: Optional[dict] = None,
+        timeout: Timeout = None,
+        stream: bool = False,
+    ) -> requests.Response:
+        """GET url, with stream=True the body must be read through iter_body"""
+        response = self.session.get(
+            url, headers=headers, timeout=timeout or self.timeout, stream=stream
+        )
+        if not stream:
+            # Body is fully read at this point; tell() is the on-the-wire size
+            self.stats.record_response(response.raw.tell(), len(response.content))
+        return response
+
+    def iter_body(
+        self, response: requests.Response, chunk_size: int = 64 * 1024
+    ) -> Iterator[bytes]:
+        """Yield the decoded body of a streamed response, counting its bytes"""
+        content_bytes = 0
+        try:
+            for chunk in response.iter_content(chunk_size):
+                content_bytes += len(chunk)
+                yield chunk
+        finally:
+            wire_bytes = response.raw.tell() if response.raw else content_bytes
+            self.stats.record_response(wire_bytes, content_bytes)
+            response.close()
+
+    def close(self):
+        self.session.close()
+
+
+_default_transport: Optional[HttpTransport] = None
+_default_transport_lock = threading.Lock()
+
+
+def get_default_transport() -> HttpTransport:
+    """Transport shared by every scraper that is not given its own"""
+    global _default_transport
+    with _default_transport_lock:
+        if _default_transport is None:
+            _default_transport = HttpTransport()
+        return _default_transport
+
+
+def configure_default_transport(**kwargs) -> HttpTransport:
+    """Replace the shared transport, e.g. to tune pool sizes or timeouts"""
+    global _default_transport
+    with _default_transport_lock:
+        if _default_transport is not None:
+            _default_transport.close()
+        _default_transport = HttpTransport(**kwargs)
+        return _default_transport
@@ -0,0 +1,112 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+
+class SeenUrlIndex:
+    """Persistent record of when each detail URL was last fetched
+
+    Lets detail-page scrapers skip refetching pages fetched within the
+    freshness window and stop walking listing pages once a page only links to
+    known URLs. What was extracted from each page is kept with it, so skipped
+    pages still yield their events and a sink that failed on them gets them
+    again on the next run.
+
+    Args:
+        path: SQLite file holding the index
+        freshness: Seconds after a fetch during which a URL is not fetched again
+    """
+
+    def __init__(
+        self, path: str = ".scraper_state/seen_urls.sqlite", freshness: float = 6 * 3600
+    ):
+        self.freshness = freshness
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS seen_urls (
+                url TEXT PRIMARY KEY,
+                source TEXT,
+                last_seen REAL NOT NULL,
+                content_hash TEXT
+            )
+            """)
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(seen_urls)")]
+        if "data" not in columns:
+            # Rows from before extractions were kept have none, and are stale
+            self._db.execute("ALTER TABLE seen_urls ADD COLUMN data TEXT")
+
+    def _lookup(self, urls: List[str]) -> Dict[str, tuple]:
+        """(last_seen, data) of the urls in the index"""
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's bound parameter limit
+            for i in range(0, len(urls), 500):
+                chunk = urls[i : i + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                for url, last_seen, data in self._db.execute(
+                    "SELECT url, last_seen, data FROM seen_urls "
+                    f"WHERE url IN ({placeholders})",
+                    chunk,
+                ):
+                    found[url] = (last_seen, data)
+        return found
+
+    def fresh(self, urls: Iterable[str], now: Optional[float] = None) -> Dict[str, Any]:
+        """What was extracted from each URL fetched within the freshness window"""
+        urls = list(urls)
+        now = now or time.time()
+        return {
+            url: json.loads(data)
+            for url, (last_seen, data) in self._lookup(urls).items()
+            if data is not None and now - last_seen < self.freshness
+        }
+
+    def stale(self, urls: Iterable[str], now: Optional[float] = None) -> List[str]:
+        """URLs never fetched or last fetched outside the freshness window, in order"""
+        urls = list(urls)
+        fresh = self.fresh(urls, now)
+        return [url for url in urls if url not in fresh]
+
+    def all_known(self, urls: Iterable[str]) -> bool:
+        """True if every URL has been fetched before, however long ago"""
+        urls = list(urls)
+        return bool(urls) and len(self._lookup(urls)) == len(set(urls))
+
+    def record(self, url: str, data: Any, source: str = ""):
+        """Mark url as fetched now, keeping the JSON serializable data
+        extracted from it"""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO seen_urls (url, source, last_seen, data) "
+                "VALUES (?, ?, ?, ?)",
+                (url, source, time.time(), json.dumps(data)),
+            )
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_default_index: Optional[SeenUrlIndex] = None
+
+
+def get_default_seen_index() -> Optional[SeenUrlIndex]:
+    """Index used by scrapers that are not given one, None crawls everything"""
+    return _default_index
+
+
+def configure_default_seen_index(**kwargs) -> SeenUrlIndex:
+    """Enable incremental crawling for every detail-page scraper"""
+    global _default_index
+    if _default_index is not None:
+        _default_index.close()
+    _default_index = SeenUrlIndex(**kwargs)
+    return _default_index
@@ -1,7 +1,35 @@
 #!/usr/bin/env python
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
 import gspread
+from gspread.utils import absolute_range_name, rowcol_to_a1
 from oauth2client.service_account import ServiceAccountCredentials
 from gspread_formatting import CellFormat  # For parsing format data
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sheet_mirror import top_rows_fingerprint  # noqa: E402
+from sheets_scheduler import (  # noqa: E402
+    SheetsScheduler,
+    configure_default_sheets_scheduler,
+    get_default_sheets_scheduler,
+)
+
+SHEETS = ["Combined", "ILoveQatar", "QatarMuseums", "VisitQatar"]
+KEY_COLUMNS = ("title", "start_date", "location", "source")
+
+# Values and column A background of a row range, nothing else of the grid
+GRID_FIELDS = (
+    "sheets(properties(sheetId,title),data(startRow,startColumn,"
+    "rowData(values(formattedValue,effectiveFormat(backgroundColorStyle)))))"
+)
+
 # import re # Uncomment if you use regex in prepare_key_component
 
 
@@ -26,269 +54,575 @@ def prepare_key_component(value: any) -> str:
     return s
 
 
-def deduplicate_combined_sheet_batched(worksheet_name):
+def has_highlight(effective_format: dict) -> bool:
+    """Whether a cell's background is anything but opaque white or transparent"""
+    if not (effective_format or {}).get("backgroundColorStyle"):
+        return False
+    cell_format = CellFormat.from_props(effective_format or {})
+    if not (cell_format and cell_format.backgroundColorStyle):
+        return False
+    rgb_color_obj = cell_format.backgroundColorStyle.rgbColor
+    if not (
+        hasattr(rgb_color_obj, "red")
+        or hasattr(rgb_color_obj, "green")
+        or hasattr(rgb_color_obj, "blue")
+    ):
+        return False
+    r = rgb_color_obj.red if hasattr(rgb_color_obj, "red") else 0.0
+    g = rgb_color_obj.green if hasattr(rgb_color_obj, "green") else 0.0
+    b = rgb_color_obj.blue if hasattr(rgb_color_obj, "blue") else 0.0
+    alpha = rgb_color_obj.alpha if hasattr(rgb_color_obj, "alpha") else 1.0
+
+    is_opaque_white = r == 1.0 and g == 1.0 and b == 1.0 and alpha == 1.0
+    is_fully_transparent = alpha == 0.0
+    return not is_opaque_white and not is_fully_transparent
+
+
+@dataclass
+class SheetRow:
+    """One row as read from the grid, row being its 1-based sheet row"""
+
+    row: int
+    values: List[str]
+    highlighted: bool = False
+
+    def key(self, key_indices: List[int]) -> str:
+        return "".join(
+            prepare_key_component(self.values[i] if i < len(self.values) else "")
+            for i in key_indices
+        )
+
+    def sort_key(self) -> tuple:
+        """Rows kept first: highlighted, then with content in column A, then topmost"""
+        col_a_value = self.values[0] if self.values else ""
+        return (-int(self.highlighted), -int(bool(col_a_value.strip())), self.row)
+
+
+@dataclass
+class DedupeSheetState:
+    """A worksheet as the last dedupe left it"""
+
+    headers: List[str]
+    row_count: int
+    data_rows: int
+    fingerprint: str
+
+
+class DedupeKeyIndex:
+    """Keys of the rows each worksheet kept at the last dedupe, with the watermark
+
+    New events are inserted at row 2, so a row's position counted up from the
+    last data row stays the same as rows are added above it. The grid row
+    count recorded at the last run is the watermark: rows added since are the
+    ones between the header and the rows the last run saw, which are
+    recognised by a fingerprint of their first check_rows rows. Only those
+    new rows are read and compared against the stored keys.
+
+    Args:
+        path: SQLite file holding the index
+        check_rows: Rows seen by the last run read again to confirm the watermark
+    """
+
+    def __init__(
+        self, path: str = ".scraper_state/dedupe_index.sqlite", check_rows: int = 5
+    ):
+        self.check_rows = check_rows
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS sheets (
+                sheet TEXT PRIMARY KEY,
+                headers TEXT NOT NULL,
+                row_count INTEGER NOT NULL,
+                data_rows INTEGER NOT NULL,
+                fingerprint TEXT NOT NULL
+            )
+            """)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS sheet_keys (
+                sheet TEXT NOT NULL,
+                key TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                PRIMARY KEY (sheet, key)
+            ) WITHOUT ROWID
+            """)
+
+    def state(self, sheet: str) -> Optional[DedupeSheetState]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT headers, row_count, data_rows, fingerprint FROM sheets WHERE sheet = ?",
+                (sheet,),
+            ).fetchone()
+        if row is None:
+            return None
+        return DedupeSheetState(json.loads(row[0]), row[1], row[2], row[3])
+
+    def lookup(self, sheet: str, keys: Iterable[str]) -> Dict[str, int]:
+        """Position of each of keys stored for sheet, 1 being the last data row"""
+        keys = list(keys)
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 900):
+                chunk = keys[i : i + 900]
+                found.update(
+                    self._db.execute(
+                        f"SELECT key, position FROM sheet_keys WHERE sheet = ? "
+                        f"AND key IN ({', '.join('?' * len(chunk))})",
+                        (sheet, *chunk),
+                    )
+                )
+        return found
+
+    def replace(self, sheet: str, state: DedupeSheetState, keys: Dict[str, int]):
+        """Store every key of sheet after reading all of it"""
+        with self._lock:
+            self._db.execute("DELETE FROM sheet_keys WHERE sheet = ?", (sheet,))
+            self._write(sheet, state, keys)
+
+    def apply(
+        self,
+        sheet: str,
+        state: DedupeSheetState,
+        deleted: Iterable[int],
+        added: Dict[str, int],
+    ):
+        """Record rows deleted and rows added since the last run
+
+        deleted holds positions before the deletes, added the positions after.
+        """
+        with self._lock:
+            for position in sorted(deleted, reverse=True):
+                self._db.execute(
+                    "DELETE FROM sheet_keys WHERE sheet = ? AND position = ?",
+                    (sheet, position),
+                )
+                self._db.execute(
+                    "UPDATE sheet_keys SET position = position - 1 "
+                    "WHERE sheet = ? AND position > ?",
+                    (sheet, position),
+                )
+            self._write(sheet, state, added)
+
+    def _write(self, sheet: str, state: DedupeSheetState, keys: Dict[str, int]):
+        self._db.execute(
+            "INSERT OR REPLACE INTO sheets VALUES (?, ?, ?, ?, ?)",
+            (
+                sheet,
+                json.dumps(state.headers, ensure_ascii=False),
+                state.row_count,
+                state.data_rows,
+                state.fingerprint,
+            ),
+        )
+        self._db.executemany(
+            "INSERT OR REPLACE INTO sheet_keys VALUES (?, ?, ?)",
+            ((sheet, key, position) for key, position in keys.items()),
+        )
+        self._db.commit()
+
+    def forget(self, sheet: str):
+        """Drop what is known of sheet so the next run reads it in full"""
+        with self._lock:
+            self._db.execute("DELETE FROM sheets WHERE sheet = ?", (sheet,))
+            self._db.execute("DELETE FROM sheet_keys WHERE sheet = ?", (sheet,))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+@dataclass
+class SheetPlan:
+    """What one dedupe run reads and deletes in a worksheet"""
+
+    title: str
+    sheet_id: int
+    index_id: str
+    row_count: int
+    col_count: int
+    state: Optional[DedupeSheetState] = None
+    # Rows added since the last run, None to read the whole sheet
+    new_rows: Optional[int] = None
+    rows: List[SheetRow] = field(default_factory=list)
+    headers: List[str] = field(default_factory=list)
+    data_rows: int = 0
+    delete: List[int] = field(default_factory=list)
+    keys: Dict[str, int] = field(default_factory=dict)
+    # Rows seen by the last run that share a key with a new row, to be read
+    old_rows: Dict[int, str] = field(default_factory=dict)
+
+    def range_to(self, first: int, last: int) -> Tuple[str, int, int, int]:
+        return (self.title, first, last, self.col_count)
+
+
+def position(data_rows: int, row: int) -> int:
+    """Position of a sheet row counted up from the last data row"""
+    return data_rows - row + 2
+
+
+def fetch_sheet_rows(
+    spreadsheet, scheduler: SheetsScheduler, ranges: List[Tuple[str, int, int, int]]
+) -> Dict[str, List[SheetRow]]:
+    """Values and column A highlight of row ranges in several worksheets
+
+    ranges holds (worksheet title, first row, last row, columns). Everything
+    is read with one spreadsheet metadata request.
+    """
+    range_names = [
+        absolute_range_name(title, f"A{first}:{rowcol_to_a1(last, columns)}")
+        for title, first, last, columns in ranges
+    ]
+    metadata = scheduler.read(
+        spreadsheet.fetch_sheet_metadata,
+        params={"ranges": range_names, "fields": GRID_FIELDS},
+    )
+    rows: Dict[str, List[SheetRow]] = {}
+    for sheet in metadata.get("sheets", []):
+        title = sheet["properties"]["title"]
+        for data in sheet.get("data", []):
+            start = data.get("startRow", 0)
+            for offset, row_data in enumerate(data.get("rowData", [])):
+                cells = row_data.get("values", [])
+                values = [cell.get("formattedValue", "") for cell in cells]
+                while values and values[-1] == "":
+                    values.pop()
+                highlighted = bool(cells) and has_highlight(
+                    cells[0].get("effectiveFormat")
+                )
+                rows.setdefault(title, []).append(
+                    SheetRow(start + offset + 1, values, highlighted)
+                )
+    return rows
+
+
+def _key_indices(plan: SheetPlan) -> Optional[List[int]]:
+    try:
+        return [plan.headers.index(name) for name in KEY_COLUMNS]
+    except ValueError:
+        print(
+            f"🛑 Error: One or more key columns {KEY_COLUMNS} not found in the header row of '{plan.title}'."
+        )
+        print(f"Actual header row found: {plan.headers}")
+        return None
+
+
+def _choose(groups: Dict[str, List[SheetRow]]) -> Tuple[List[int], Dict[str, int]]:
+    """Rows to delete and the row kept for each key"""
+    delete, kept = [], {}
+    for event_key, rows in groups.items():
+        rows.sort(key=SheetRow.sort_key)
+        kept[event_key] = rows[0].row
+        delete.extend(row.row for row in rows[1:])
+    return delete, kept
+
+
+def _fingerprint(rows: List[SheetRow], deleted: Iterable[int], check_rows: int) -> str:
+    deleted = set(deleted)
+    top = [row.values for row in rows if row.row >= 2 and row.row not in deleted]
+    return top_rows_fingerprint(top[:check_rows])
+
+
+def _plan_window(plan: SheetPlan, rows: List[SheetRow], check_rows: int) -> bool:
+    """Read the rows added since the last run; False if the sheet drifted"""
+    state = plan.state
+    if not rows or rows[0].row != 1 or rows[0].values != state.headers:
+        return False
+    seen_top = [row for row in rows if row.row >= plan.new_rows + 2]
+    expected_rows = min(check_rows, state.data_rows)
+    if len(seen_top) < expected_rows or (
+        top_rows_fingerprint([row.values for row in seen_top[:expected_rows]])
+        != state.fingerprint
+    ):
+        return False
+
+    plan.rows = rows
+    plan.headers = state.headers
+    plan.data_rows = state.data_rows + plan.new_rows
+    return True
+
+
+def _plan_new_rows(plan: SheetPlan, index: DedupeKeyIndex) -> Dict[str, List[SheetRow]]:
+    """Groups of new rows by key, noting rows seen before that share a key"""
+    key_indices = _key_indices(plan)
+    groups: Dict[str, List[SheetRow]] = {}
+    if key_indices is None:
+        return groups
+    for row in plan.rows:
+        if 2 <= row.row <= plan.new_rows + 1:
+            groups.setdefault(row.key(key_indices), []).append(row)
+    for event_key, stored in index.lookup(plan.index_id, groups).items():
+        plan.old_rows[plan.data_rows + 2 - stored] = event_key
+    return groups
+
+
+def _plan_full(plan: SheetPlan, rows: List[SheetRow]) -> Dict[str, List[SheetRow]]:
+    """Groups of every data row by key"""
+    groups: Dict[str, List[SheetRow]] = {}
+    if not rows or rows[0].row != 1:
+        print(f"⚠️ Worksheet '{plan.title}' is empty or has no header row.")
+        return groups
+    plan.rows = rows
+    plan.headers = rows[0].values
+    plan.new_rows = None
+    plan.data_rows = max((row.row for row in rows if row.values), default=1) - 1
+    key_indices = _key_indices(plan)
+    if key_indices is None:
+        return groups
+    width = len(plan.headers)
+    for row in rows[1 : plan.data_rows + 1]:
+        # get_all_values pads rows to the sheet width, blank rows included
+        row.values += [""] * (width - len(row.values))
+        groups.setdefault(row.key(key_indices), []).append(row)
+    return groups
+
+
+def _new_state(plan: SheetPlan, check_rows: int) -> DedupeSheetState:
+    return DedupeSheetState(
+        headers=plan.headers,
+        row_count=plan.row_count - len(plan.delete),
+        data_rows=plan.data_rows - len(plan.delete),
+        fingerprint=_fingerprint(plan.rows, plan.delete, check_rows),
+    )
+
+
+def _kept_positions(plan: SheetPlan) -> Dict[str, int]:
+    """Positions the kept rows have once the deletes are done"""
+    deleted = sorted(plan.delete)
+    remaining = plan.data_rows - len(deleted)
+    positions = {}
+    for event_key, row in plan.keys.items():
+        above = sum(1 for d in deleted if d < row)
+        positions[event_key] = position(remaining, row - above)
+    return positions
+
+
+def deduplicate_sheets(
+    worksheet_names: List[str] = SHEETS,
+    scheduler: Optional[SheetsScheduler] = None,
+    client=None,
+    index: Optional[DedupeKeyIndex] = None,
+    spreadsheet_name: str = "Event Scrapes",
+    full: bool = False,
+) -> int:
     """
-    Deduplicates the "Combined" sheet using batch operations for reads and writes
-    to respect API quotas.
-    Keeps the entry where Column A has highlighting or content.
+    Deduplicates several worksheets in one pass, keeping the entry where
+    Column A has highlighting or content.
+    Authenticates once; values and column A formats of every worksheet are
+    read together in one spreadsheet metadata request, and every delete is
+    sent in one batch update. With an index, only the rows added since the
+    last run are read and checked against the keys it stored; full reads
+    every row anyway and rebuilds the index.
+    An already authorized client (or fake_gspread.FakeClient) can be passed in.
+    Returns the number of rows deleted.
     """
+    scheduler = scheduler or get_default_sheets_scheduler() or SheetsScheduler()
+
     # ###### Google Sheets Setups #######
     scope = [
         "https://spreadsheets.google.com/feeds",
         "https://www.googleapis.com/auth/drive",
     ]
     creds_path = "credentials.json"
-    spreadsheet_name = "Event Scrapes"
 
-    print(
-        f"Attempting to connect to Google Sheet: '{spreadsheet_name} -> {worksheet_name}'..."
-    )
+    print(f"Attempting to connect to Google Sheet: '{spreadsheet_name}'...")
     try:
-        creds = ServiceAccountCredentials.from_json_keyfile_name(creds_path, scope)
-        client = gspread.authorize(creds)
-        spreadsheet = client.open(spreadsheet_name)
-        worksheet = spreadsheet.worksheet(worksheet_name)
+        if client is None:
+            creds = ServiceAccountCredentials.from_json_keyfile_name(creds_path, scope)
+            client = gspread.authorize(creds)
+        spreadsheet = scheduler.read(client.open, spreadsheet_name)
+        metadata = scheduler.read(
+            spreadsheet.fetch_sheet_metadata,
+            params={"fields": "sheets.properties"},
+        )
         print("Successfully connected.")
     except Exception as e:
         print(f"🛑 Error connecting to Google Sheets: {e}")
         print(
             f"Please ensure '{creds_path}' is correct and has necessary API permissions."
         )
-        return
+        return 0
+
+    properties = {
+        sheet["properties"]["title"]: sheet["properties"]
+        for sheet in metadata.get("sheets", [])
+    }
+    check_rows = index.check_rows if index else 0
+    plans: List[SheetPlan] = []
+    for name in worksheet_names:
+        if name not in properties:
+            print(f"⚠️ Worksheet '{name}' not found, skipping.")
+            continue
+        grid = properties[name].get("gridProperties", {})
+        plan = SheetPlan(
+            title=name,
+            sheet_id=properties[name]["sheetId"],
+            index_id=f"{spreadsheet.id}/{properties[name]['sheetId']}",
+            row_count=grid.get("rowCount", 1000),
+            col_count=grid.get("columnCount", 26),
+        )
+        plan.state = index.state(plan.index_id) if index else None
+        if plan.state and not full and plan.row_count >= plan.state.row_count:
+            plan.new_rows = plan.row_count - plan.state.row_count
+        plans.append(plan)
+    if not plans:
+        return 0
+
+    def first_read(plan: SheetPlan):
+        if plan.new_rows is None:
+            return plan.range_to(1, plan.row_count)
+        return plan.range_to(1, min(plan.new_rows + check_rows + 1, plan.row_count))
 
     try:
-        print("Fetching all values from the worksheet (1 API call)...")
-        all_values = worksheet.get_all_values()
-        if not all_values or len(all_values) < 1:
-            print(f"⚠️ Worksheet '{worksheet_name}' is empty or has no header row.")
-            return
-        print(f"Fetched {len(all_values)} total rows (including header).")
+        print(f"Fetching new rows of {len(plans)} worksheets (1 API call)...")
+        rows = fetch_sheet_rows(spreadsheet, scheduler, [first_read(p) for p in plans])
     except Exception as e:
-        print(f"🛑 Error fetching values from worksheet '{worksheet_name}': {e}")
-        return
-
-    header_row = all_values[0]
-    data_rows = all_values[1:]
-    num_data_rows = len(data_rows)
-
-    if num_data_rows == 0:
-        print("✅ No data rows to process.")
-        return
-
-    try:
-        title_col_idx = header_row.index("title")
-        start_date_col_idx = header_row.index("start_date")
-        location_col_idx = header_row.index("location")
-        source_col_idx = header_row.index("source")
-        col_a_idx = 0
-        print(
-            f"Key columns identified: Title (idx {title_col_idx}), Date (idx {start_date_col_idx}), Location (idx {location_col_idx}), Source (idx {source_col_idx})."
-        )
-    except ValueError:
-        print(
-            "🛑 Error: One or more key columns ('title', 'start_date', 'location', 'source') not found in the header row."
-        )
-        print(f"Actual header row found: {header_row}")
-        return
-
-    # Batch fetch formats for Column A (data rows only)
-    col_a_formats_map = {}  # Maps gspread_row_index (1-based) -> CellFormat object
-    if num_data_rows > 0:
-        print(
-            f"Batch fetching formats for Column A (A2:A{num_data_rows + 1}) (1 API call)..."
-        )
+        print(f"🛑 Error fetching values from the worksheets: {e}")
+        return 0
+
+    groups: Dict[str, Dict[str, List[SheetRow]]] = {}
+    drifted = []
+    for plan in plans:
+        sheet_rows = rows.get(plan.title, [])
+        if plan.new_rows is None:
+            groups[plan.title] = _plan_full(plan, sheet_rows)
+        elif _plan_window(plan, sheet_rows, check_rows):
+            print(f"'{plan.title}': {plan.new_rows} rows added since the last run.")
+            groups[plan.title] = _plan_new_rows(plan, index)
+        else:
+            print(f"'{plan.title}' changed since the last run, reading all of it.")
+            drifted.append(plan)
+
+    # Whole sheets that drifted and the rows seen before that new rows
+    # duplicate, again in one request
+    second_read = [plan.range_to(1, plan.row_count) for plan in drifted]
+    for plan in plans:
+        window_end = plan.rows[-1].row if plan.rows else 0
+        if plan not in drifted:
+            second_read += [
+                plan.range_to(row, row) for row in plan.old_rows if row > window_end
+            ]
+    more_rows: Dict[str, List[SheetRow]] = {}
+    if second_read:
         try:
-            # Range for data rows in column A: A2 to A(num_data_rows + 1 because header is row 1)
-            range_A_data_rows = f"{worksheet.title}!A2:A{num_data_rows + 1}"
-
-            # Fetch metadata including effective formats for the specified range in column A
-            # 'startRow' in the response is 0-indexed and refers to the first row of the *range* requested.
-            metadata = worksheet.spreadsheet.fetch_sheet_metadata(
-                params={
-                    "fields": "sheets/data(rowData(values/effectiveFormat),startRow)",
-                    "ranges": [range_A_data_rows],
-                }
-            )
-
-            if metadata and metadata.get("sheets"):
-                sheet_data_list = metadata["sheets"][0].get("data", [])
-                if sheet_data_list:
-                    # API 'startRow' is 0-indexed. If our range was A2:..., startRow in response should be 1.
-                    api_start_row_0_indexed = sheet_data_list[0].get("startRow", 0)
-                    row_data_from_metadata = sheet_data_list[0].get("rowData", [])
-
-                    for offset, row_item_format_data in enumerate(
-                        row_data_from_metadata
-                    ):
-                        # Calculate the 1-based gspread row index this format belongs to
-                        gspread_row_idx = api_start_row_0_indexed + offset + 1
-                        format_dict = {}
-                        if (
-                            row_item_format_data
-                            and row_item_format_data.get("values")
-                            and len(row_item_format_data["values"]) > 0
-                        ):
-                            format_dict = row_item_format_data["values"][0].get(
-                                "effectiveFormat", {}
-                            )
-                        col_a_formats_map[gspread_row_idx] = CellFormat.from_props(
-                            format_dict
-                        )
-            print(
-                f"Successfully fetched and parsed formats for {len(col_a_formats_map)} cells in Column A."
-            )
+            print(f"Fetching {len(second_read)} more ranges (1 API call)...")
+            more_rows = fetch_sheet_rows(spreadsheet, scheduler, second_read)
         except Exception as e:
-            print(
-                f"⚠️ Warning: Could not batch fetch formats for Column A. Error: {e}. Formatting checks will be skipped (assuming no highlight)."
-            )
-            # col_a_formats_map will remain empty; .get() will default to basic CellFormat later.
-
-    processed_events = {}
-    print(f"\nProcessing {num_data_rows} data rows to identify duplicates...")
-    for idx, row_data in enumerate(data_rows):
-        current_row_gspread_idx = idx + 2
-
-        try:
-            title = row_data[title_col_idx]
-            start_date = row_data[start_date_col_idx]
-            location = row_data[location_col_idx]
-            source = row_data[source_col_idx]
-            col_a_value = row_data[col_a_idx] if len(row_data) > col_a_idx else ""
-        except IndexError:
-            print(
-                f"⚠️ Warning: Row {current_row_gspread_idx} (data index {idx}) has insufficient columns. Skipping."
-            )
-            continue
-
-        event_key = (
-            prepare_key_component(title)
-            + prepare_key_component(start_date)
-            + prepare_key_component(location)
-            + prepare_key_component(source)
-        )
-
-        has_col_a_highlight = False
-        # Get pre-fetched format; default to an empty format if not found
-        cell_format = col_a_formats_map.get(
-            current_row_gspread_idx, CellFormat.from_props({})
-        )
-
-        if cell_format and cell_format.backgroundColorStyle:
-            rgb_color_obj = cell_format.backgroundColorStyle.rgbColor
-            if (
-                hasattr(rgb_color_obj, "red")
-                or hasattr(rgb_color_obj, "green")
-                or hasattr(rgb_color_obj, "blue")
-            ):
-                r = rgb_color_obj.red if hasattr(rgb_color_obj, "red") else 0.0
-                g = rgb_color_obj.green if hasattr(rgb_color_obj, "green") else 0.0
-                b = rgb_color_obj.blue if hasattr(rgb_color_obj, "blue") else 0.0
-                alpha = rgb_color_obj.alpha if hasattr(rgb_color_obj, "alpha") else 1.0
-
-                is_opaque_white = r == 1.0 and g == 1.0 and b == 1.0 and alpha == 1.0
-                is_fully_transparent = alpha == 0.0
-
-                if not is_opaque_white and not is_fully_transparent:
-                    has_col_a_highlight = True
-
-        row_info = {
-            "original_row_index": current_row_gspread_idx,
-            "data": row_data,
-            "has_col_a_highlight": has_col_a_highlight,
-            "col_a_value": col_a_value,
-        }
-        if event_key not in processed_events:
-            processed_events[event_key] = []
-        processed_events[event_key].append(row_info)
-
-    rows_to_delete_indices = []
-    print(
-        "\nDetermining which duplicate rows to keep or delete based on preferences..."
-    )
-    for event_key, rows_info_list in processed_events.items():
-        if len(rows_info_list) <= 1:
-            continue
-
-        def sort_key_for_duplicates(row_item):
-            highlight_score = 1 if row_item["has_col_a_highlight"] else 0
-            col_a_has_content = 1 if str(row_item["col_a_value"]).strip() else 0
-            return (
-                -highlight_score,
-                -col_a_has_content,
-                row_item["original_row_index"],
-            )
-
-        rows_info_list.sort(key=sort_key_for_duplicates)
-        for i in range(1, len(rows_info_list)):
-            rows_to_delete_indices.append(rows_info_list[i]["original_row_index"])
-
-    if not rows_to_delete_indices:
-        print("\n✅ No duplicate rows to delete were found.")
-        return
-
-    # Sort indices in descending order. This is crucial for batch_update
-    # as requests are processed in order, and deleting from bottom-up avoids index shifts
-    # if the API were to process them sequentially *within* the batch and shift.
-    # For `deleteDimension` requests in a single batch, the indices should refer to
-    # the sheet's state *before* any operations in that batch begin.
-    # However, sorting descending remains good practice and ensures correct behavior if
-    # one were to revert to non-batch deletes.
-    rows_to_delete_indices.sort(reverse=True)
-
-    print(
-        f"\nFound {len(rows_to_delete_indices)} rows to delete. Preparing batch delete request (1 API call)..."
-    )
+            print(f"🛑 Error fetching values from the worksheets: {e}")
+            return 0
+    for plan in drifted:
+        plan.new_rows = None
+        groups[plan.title] = _plan_full(plan, more_rows.get(plan.title, []))
+    for plan in plans:
+        if plan.old_rows and plan not in drifted:
+            key_indices = _key_indices(plan)
+            seen = {row.row: row for row in plan.rows + more_rows.get(plan.title, [])}
+            for row_number, event_key in plan.old_rows.items():
+                row = seen.get(row_number)
+                if row is None or row.key(key_indices) != event_key:
+                    # Rows moved in a way the watermark missed; the next run
+                    # reads the whole sheet, this one leaves older rows alone
+                    print(
+                        f"⚠️ Warning: row {row_number} of '{plan.title}' is not the one indexed, skipping older rows."
+                    )
+                    index.forget(plan.index_id)
+                    plan.state = None
+                    break
+                groups[plan.title][event_key].append(row)
 
     delete_requests = []
-    for row_idx_to_delete in rows_to_delete_indices:
-        # Google Sheets API DeleteDimensionRequest uses 0-indexed rows.
-        # endIndex is exclusive.
-        delete_requests.append(
-            {
-                "deleteDimension": {
-                    "range": {
-                        "sheetId": worksheet.id,  # Get sheetId from the gspread worksheet object
-                        "dimension": "ROWS",
-                        "startIndex": row_idx_to_delete
-                        - 1,  # Convert 1-based gspread index to 0-based API index
-                        "endIndex": row_idx_to_delete,  # Deletes the single row at startIndex
+    for plan in plans:
+        plan.delete, plan.keys = _choose(groups.get(plan.title, {}))
+        # deleteDimension indices refer to the sheet before the batch, bottom
+        # rows first keeps them valid whichever order the API applies them in
+        for row_idx_to_delete in sorted(plan.delete, reverse=True):
+            # Google Sheets API DeleteDimensionRequest uses 0-indexed rows.
+            # endIndex is exclusive.
+            delete_requests.append(
+                {
+                    "deleteDimension": {
+                        "range": {
+                            "sheetId": plan.sheet_id,
+                            "dimension": "ROWS",
+                            "startIndex": row_idx_to_delete - 1,
+                            "endIndex": row_idx_to_delete,
+                        }
                     }
                 }
-            }
-        )
+            )
+        if plan.delete:
+            print(f"'{plan.title}': {len(plan.delete)} duplicate rows to delete.")
 
-    deleted_count = 0
-    failed_to_delete_count = 0
+    deleted_ok = True
     if delete_requests:
         try:
-            print(f"Executing batch delete for {len(delete_requests)} rows...")
-            body = {"requests": delete_requests}
-            worksheet.spreadsheet.batch_update(body)  # Send the single batch request
-            deleted_count = len(
-                delete_requests
-            )  # Assume all succeed if no exception from batch_update
-            print(f"Batch delete request for {deleted_count} rows sent successfully.")
+            print(f"\nExecuting batch delete for {len(delete_requests)} rows...")
+            # Row indices are only valid for this read of the sheet, so failed
+            # deletes are not saved for a later run; the next dedupe finds them
+            scheduler.batch_update(spreadsheet, delete_requests, replayable=False)
+            if scheduler.flush():
+                raise RuntimeError("the Sheets API kept rejecting the request")
+            print(
+                f"Batch delete request for {len(delete_requests)} rows sent successfully."
+            )
         except Exception as e:
+            deleted_ok = False
             print(f"🛑 Error during batch delete: {e}")
-            failed_to_delete_count = len(
-                delete_requests
-            )  # Assume all failed in the batch on error
             print(
-                "  The sheet may be in a partially deduplicated state. Please check manually or retry."
+                "  The sheets may be in a partially deduplicated state. Please check manually or retry."
             )
 
+    if index:
+        for plan in plans:
+            if not plan.headers or (plan.delete and not deleted_ok):
+                index.forget(plan.index_id)
+            elif plan.new_rows is None:
+                index.replace(
+                    plan.index_id, _new_state(plan, check_rows), _kept_positions(plan)
+                )
+            elif plan.state is not None:
+                index.apply(
+                    plan.index_id,
+                    _new_state(plan, check_rows),
+                    [position(plan.data_rows, row) for row in plan.delete],
+                    _kept_positions(plan),
+                )
+
+    deleted_count = len(delete_requests) if deleted_ok else 0
     print("\n--- Deduplication Summary ---")
-    print(
-        f"Total rows initially identified for deletion: {len(rows_to_delete_indices)}"
-    )
+    for plan in plans:
+        examined = plan.data_rows if plan.new_rows is None else plan.new_rows
+        print(
+            f"'{plan.title}': {examined} rows examined, {len(plan.delete)} duplicates"
+        )
     print(f"Batch delete request sent for: {deleted_count} rows")
-    if failed_to_delete_count > 0:
-        print(f"Batch delete request failed for: {failed_to_delete_count} rows")
+    if delete_requests and not deleted_ok:
+        print(f"Batch delete request failed for: {len(delete_requests)} rows")
     print("✅ Deduplication process complete.")
+    return deleted_count
+
+
+def deduplicate_combined_sheet_batched(
+    worksheet_name, scheduler: Optional[SheetsScheduler] = None, client=None
+):
+    """
+    Deduplicates one worksheet, reading all of it.
+    Kept for callers of the one-sheet version; deduplicate_sheets handles
+    every worksheet with one connection.
+    """
+    return deduplicate_sheets([worksheet_name], scheduler, client)
 
 
 if __name__ == "__main__":
-    deduplicate_combined_sheet_batched("Combined")
-    deduplicate_combined_sheet_batched("ILoveQatar")
-    deduplicate_combined_sheet_batched("QatarMuseums")
-    deduplicate_combined_sheet_batched("VisitQatar")
+    parser = argparse.ArgumentParser(description="Delete duplicate event rows")
+    parser.add_argument("sheets", nargs="*", default=SHEETS)
+    parser.add_argument(
+        "--full", action="store_true", help="read every row, rebuilding the key index"
+    )
+    args = parser.parse_args()
+
+    configure_default_sheets_scheduler(reads_per_minute=60, writes_per_minute=60)
+    deduplicate_sheets(args.sheets, index=DedupeKeyIndex(), full=args.full)
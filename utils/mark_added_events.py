@@ -1,77 +1,100 @@
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 import csv
+import os
+import sys
 from gspread_formatting import *
 
-# ####### Google Sheets setups #######
-scope = [
-    "https://spreadsheets.google.com/feeds",
-    "https://www.googleapis.com/auth/drive",
-]
-creds = ServiceAccountCredentials.from_json_keyfile_name("../credentials.json", scope)
-client = gspread.authorize(creds)
-spreadsheet = client.open("Event Scrapes")
-worksheet = spreadsheet.worksheet("Combined")
-
-# 1. Read the CSV data
-csv_titles = set()
-csv_file_path = "events.csv"  # Make sure this path is correct
-with open(csv_file_path, mode="r", encoding="utf-8") as csvfile:
-    reader = csv.DictReader(csvfile)
-    for row in reader:
-        csv_titles.add(
-            row["title_en"].strip()
-        )  # .strip() to remove leading/trailing whitespace
-
-print(f"Titles loaded from CSV: {csv_titles}")
-
-# 2. Get all values from the Google Sheet
-all_sheet_values = worksheet.get_all_values()
-
-if not all_sheet_values:
-    print("Google Sheet is empty. Exiting.")
-    exit()
-
-# 3. Find the 'title' column in the Google Sheet
-header_row = all_sheet_values[0]
-title_col_index = -1
-try:
-    title_col_index = header_row.index("title")
-except ValueError:
-    print("Error: 'title' column not found in the Google Sheet header.")
-    exit()
-
-print(f"'title' column found at index: {title_col_index}")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sheet_columns import read_columns  # noqa: E402
 
 # Define the green format
 green_format = CellFormat(
     backgroundColor=Color(0.678, 0.886, 0.733)  # A pleasant green (e.g., light green)
 )
 
-updates_to_apply = []
 
-# 4. Iterate through rows and compare titles
-# Start from the second row to skip the header
-for row_idx, row_data in enumerate(all_sheet_values[1:], start=1):
-    if len(row_data) > title_col_index:  # Ensure the row has enough columns
-        sheet_title = row_data[title_col_index].strip()
+def mark_added_events(worksheet, csv_file_path: str = "events.csv") -> int:
+    """Highlight column A of the rows whose title appears in the CSV's title_en
+
+    Returns the number of cells formatted. worksheet can be a gspread worksheet
+    or a fake_gspread one.
+    """
+    # 1. Read the CSV data
+    csv_titles = set()
+    with open(csv_file_path, mode="r", encoding="utf-8") as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row in reader:
+            csv_titles.add(
+                row["title_en"].strip()
+            )  # .strip() to remove leading/trailing whitespace
+
+    print(f"Titles loaded from CSV: {csv_titles}")
+
+    # 2. Read only the 'title' column of the Google Sheet
+    read = read_columns(worksheet, ["title"])
+
+    if not read.headers:
+        print("Google Sheet is empty. Exiting.")
+        return 0
+
+    # 3. Find the 'title' column in the Google Sheet
+    if "title" not in read.columns:
+        print("Error: 'title' column not found in the Google Sheet header.")
+        return 0
+
+    print(f"'title' column found at index: {read.headers.index('title')}")
+
+    matched_rows = []
+
+    # 4. Iterate through the titles and compare them
+    # Data starts at row 2, below the header
+    for row_number, title in enumerate(read.columns["title"], start=2):
+        sheet_title = title.strip()
         if sheet_title in csv_titles:
-            # If title matches, add the first column cell to the list of cells to format
-            # gspread uses 1-based indexing for rows and columns
-            cell_to_format_a1 = f"A{row_idx + 1}"  # +1 because row_idx is 0-based relative to all_sheet_values[1:]
-            # and we need 1-based sheet row number
-            updates_to_apply.append(cell_to_format_a1)
+            matched_rows.append(row_number)
             print(
-                f"Match found: '{sheet_title}' in row {row_idx + 1}. Adding A{row_idx + 1} to format list."
+                f"Match found: '{sheet_title}' in row {row_number}. Adding A{row_number} to format list."
             )
 
-if updates_to_apply:
-    print(f"Applying green formatting to {len(updates_to_apply)} cells in column A...")
-    # 5. Batch update cell formatting
-    # format_cell_ranges expects a list of tuples: (range, format)
-    # We create a list of (cell_address, green_format) for all matched cells
-    ranges_to_format = [(cell_range, green_format) for cell_range in updates_to_apply]
-    format_cell_ranges(worksheet, ranges_to_format)
-    print("Formatting complete!")
-else:
-    print("No matching titles found in the Google Sheet. No cells formatted.")
+    # Neighbouring rows are formatted as one range
+    updates_to_apply = []
+    for row_number in matched_rows:
+        if updates_to_apply and updates_to_apply[-1][1] == row_number - 1:
+            updates_to_apply[-1][1] = row_number
+        else:
+            updates_to_apply.append([row_number, row_number])
+    updates_to_apply = [
+        f"A{first}" if first == last else f"A{first}:A{last}"
+        for first, last in updates_to_apply
+    ]
+
+    if updates_to_apply:
+        print(f"Applying green formatting to {len(matched_rows)} cells in column A...")
+        # 5. Batch update cell formatting, one request for every range
+        # format_cell_ranges expects a list of tuples: (range, format)
+        ranges_to_format = [
+            (cell_range, green_format) for cell_range in updates_to_apply
+        ]
+        format_cell_ranges(worksheet, ranges_to_format)
+        print("Formatting complete!")
+    else:
+        print("No matching titles found in the Google Sheet. No cells formatted.")
+    return len(matched_rows)
+
+
+if __name__ == "__main__":
+    # ####### Google Sheets setups #######
+    scope = [
+        "https://spreadsheets.google.com/feeds",
+        "https://www.googleapis.com/auth/drive",
+    ]
+    creds = ServiceAccountCredentials.from_json_keyfile_name(
+        "../credentials.json", scope
+    )
+    client = gspread.authorize(creds)
+    spreadsheet = client.open("Event Scrapes")
+    worksheet = spreadsheet.worksheet("Combined")
+
+    mark_added_events(worksheet, "events.csv")  # Make sure this path is correct